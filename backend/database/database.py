@@ -18,7 +18,9 @@ engine = create_engine(
 )
 
 # Create SessionLocal class
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Committed objects keep their loaded state instead of being reloaded with an
+# extra SELECT on next access (services no longer refresh() after writes)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
 # Create Base class
 Base = declarative_base()
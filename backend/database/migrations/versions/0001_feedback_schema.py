@@ -0,0 +1,138 @@
+"""Feedback schema: model_performance constraint and metrics, lookup indexes
+
+- Feedback writes upsert performance counters with ON CONFLICT (model_version,
+  field_name), which needs a matching unique constraint. Tables created by
+  Base.metadata.create_all before the constraint was declared don't have it,
+  and may hold several rows per model/field - those are merged by summing
+  their counters first.
+- precision, recall and f1_score stop being written by the application; the
+  stored columns become generated columns computed from the counters.
+- Indexes for active field definition lookups and newest-first training
+  feedback pages.
+
+The schema is still created by create_all on startup, so each step checks the
+live schema and skips what is already in place (or not there yet).
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-16 00:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+UNIQUE_CONSTRAINT = "uq_model_performance_version_field"
+
+# Performance metrics as generated from the counters
+METRIC_EXPRESSIONS = {
+    "precision": (
+        "CASE WHEN correct_predictions + false_positives > 0 "
+        "THEN CAST(correct_predictions AS FLOAT) / (correct_predictions + false_positives) ELSE 0.0 END"
+    ),
+    "recall": (
+        "CASE WHEN correct_predictions + false_negatives > 0 "
+        "THEN CAST(correct_predictions AS FLOAT) / (correct_predictions + false_negatives) ELSE 0.0 END"
+    ),
+    "f1_score": (
+        "CASE WHEN correct_predictions > 0 "
+        "THEN CAST(2 * correct_predictions AS FLOAT) / (2 * correct_predictions + false_positives + false_negatives) ELSE 0.0 END"
+    ),
+}
+
+INDEXES = {
+    "ix_field_definitions_active_required": ("field_definitions", ["is_active", "is_required"]),
+    "ix_human_feedback_training": ("human_feedback", ["model_version", "field_name", "review_timestamp", "id"]),
+}
+
+# Rows of one model/field, correlated with the row being updated
+_SAME_GROUP = (
+    "FROM model_performance AS duplicate "
+    "WHERE duplicate.model_version = model_performance.model_version "
+    "AND duplicate.field_name = model_performance.field_name"
+)
+
+
+def _merge_duplicate_performance_rows() -> None:
+    """Fold each model/field's rows into its lowest id: counters summed, averages
+    weighted by predictions, latest update kept - then delete the rest"""
+    op.execute(
+        "UPDATE model_performance SET "
+        f"total_predictions = (SELECT SUM(COALESCE(duplicate.total_predictions, 0)) {_SAME_GROUP}), "
+        f"correct_predictions = (SELECT SUM(COALESCE(duplicate.correct_predictions, 0)) {_SAME_GROUP}), "
+        f"false_positives = (SELECT SUM(COALESCE(duplicate.false_positives, 0)) {_SAME_GROUP}), "
+        f"false_negatives = (SELECT SUM(COALESCE(duplicate.false_negatives, 0)) {_SAME_GROUP}), "
+        "avg_reward = (SELECT COALESCE(SUM(COALESCE(duplicate.avg_reward, 0) * COALESCE(duplicate.total_predictions, 0)) "
+        f"/ NULLIF(SUM(COALESCE(duplicate.total_predictions, 0)), 0), 0) {_SAME_GROUP}), "
+        "avg_confidence = (SELECT COALESCE(SUM(COALESCE(duplicate.avg_confidence, 0) * COALESCE(duplicate.total_predictions, 0)) "
+        f"/ NULLIF(SUM(COALESCE(duplicate.total_predictions, 0)), 0), 0) {_SAME_GROUP}), "
+        f"last_updated = (SELECT MAX(duplicate.last_updated) {_SAME_GROUP}) "
+        "WHERE id IN (SELECT MIN(id) FROM model_performance GROUP BY model_version, field_name HAVING COUNT(*) > 1)"
+    )
+    op.execute(
+        "DELETE FROM model_performance WHERE id NOT IN "
+        "(SELECT keep.id FROM (SELECT MIN(id) AS id FROM model_performance GROUP BY model_version, field_name) AS keep)"
+    )
+
+
+def _batch_recreate() -> str:
+    """SQLite can only add generated columns by rebuilding the table"""
+    return "always" if op.get_bind().dialect.name == "sqlite" else "auto"
+
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    
+    if inspector.has_table("model_performance"):
+        unique_constraints = {constraint["name"] for constraint in inspector.get_unique_constraints("model_performance")}
+        if UNIQUE_CONSTRAINT not in unique_constraints:
+            _merge_duplicate_performance_rows()
+            with op.batch_alter_table("model_performance") as batch_op:
+                batch_op.create_unique_constraint(UNIQUE_CONSTRAINT, ["model_version", "field_name"])
+        
+        columns = {column["name"]: column for column in inspector.get_columns("model_performance")}
+        stored_metrics = [name for name in METRIC_EXPRESSIONS if not columns.get(name, {}).get("computed")]
+        if stored_metrics:
+            with op.batch_alter_table("model_performance", recreate=_batch_recreate()) as batch_op:
+                for name in stored_metrics:
+                    if name in columns:
+                        batch_op.drop_column(name)
+                    batch_op.add_column(sa.Column(name, sa.Float, sa.Computed(METRIC_EXPRESSIONS[name], persisted=True)))
+    
+    # New databases get the tables, indexes included, from create_all on startup
+    for index_name, (table, index_columns) in INDEXES.items():
+        if not inspector.has_table(table):
+            continue
+        existing = {index["name"]: index["column_names"] for index in inspector.get_indexes(table)}
+        if existing.get(index_name) == index_columns:
+            continue
+        if index_name in existing:
+            op.drop_index(index_name, table_name=table)
+        op.create_index(index_name, table, index_columns)
+
+
+def downgrade() -> None:
+    for index_name, (table, _) in INDEXES.items():
+        op.drop_index(index_name, table_name=table)
+    
+    # Back to plain columns, filled with the current values; merged rows are
+    # not split again
+    with op.batch_alter_table("model_performance", recreate=_batch_recreate()) as batch_op:
+        for name in METRIC_EXPRESSIONS:
+            batch_op.drop_column(name)
+            batch_op.add_column(sa.Column(name, sa.Float))
+    op.execute(
+        "UPDATE model_performance SET "
+        + ", ".join(f"{name} = {expression}" for name, expression in METRIC_EXPRESSIONS.items())
+    )
+    
+    with op.batch_alter_table("model_performance") as batch_op:
+        batch_op.drop_constraint(UNIQUE_CONSTRAINT, type_="unique")
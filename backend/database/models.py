@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, JSON, Float, Boolean, ForeignKey
+from sqlalchemy import Column, Computed, Integer, String, DateTime, Text, JSON, Float, Boolean, ForeignKey, Index, UniqueConstraint, case, cast
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -91,6 +91,12 @@ class Configuration(Base):
 
 class FieldDefinition(Base):
     __tablename__ = "field_definitions"
+    __table_args__ = (
+        # Active required/optional field lookups
+        Index("ix_field_definitions_active_required", "is_active", "is_required"),
+    )
+    # Fetch server defaults (timestamps) in the INSERT itself via RETURNING
+    __mapper_args__ = {"eager_defaults": True}
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, nullable=False)
@@ -106,6 +112,13 @@ class FieldDefinition(Base):
 
 class HumanFeedback(Base):
     __tablename__ = "human_feedback"
+    __table_args__ = (
+        # Newest-first training reads per model/field (B-tree is scanned backwards)
+        # id breaks ties between rows of one review, which share a timestamp
+        Index("ix_human_feedback_training", "model_version", "field_name", "review_timestamp", "id"),
+    )
+    # Fetch server defaults (timestamps) in the INSERT itself via RETURNING
+    __mapper_args__ = {"eager_defaults": True}
     
     id = Column(Integer, primary_key=True, index=True)
     document_id = Column(Integer, ForeignKey("documents.id"), nullable=False)
@@ -127,6 +140,10 @@ class HumanFeedback(Base):
 
 class ModelPerformance(Base):
     __tablename__ = "model_performance"
+    __table_args__ = (
+        # One row per model/field - also the conflict target for counter upserts
+        UniqueConstraint("model_version", "field_name", name="uq_model_performance_version_field"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     model_version = Column(String, nullable=False)
@@ -139,10 +156,24 @@ class ModelPerformance(Base):
     avg_reward = Column(Float, default=0.0)
     last_updated = Column(DateTime(timezone=True), server_default=func.now())
     
-    # Performance metrics
-    precision = Column(Float, default=0.0)  # correct / (correct + false_positive)
-    recall = Column(Float, default=0.0)     # correct / (correct + false_negative)
-    f1_score = Column(Float, default=0.0)   # 2 * (precision * recall) / (precision + recall)
+    # Performance metrics - generated columns computed by the database from the
+    # counters, so feedback writes only have to touch the counters and SQL
+    # readers outside the ORM see current values
+    precision = Column(Float, Computed(case(  # correct / (correct + false_positive)
+        (correct_predictions + false_positives > 0,
+         cast(correct_predictions, Float) / (correct_predictions + false_positives)),
+        else_=0.0
+    ), persisted=True))
+    recall = Column(Float, Computed(case(  # correct / (correct + false_negative)
+        (correct_predictions + false_negatives > 0,
+         cast(correct_predictions, Float) / (correct_predictions + false_negatives)),
+        else_=0.0
+    ), persisted=True))
+    f1_score = Column(Float, Computed(case(  # 2 * (precision * recall) / (precision + recall) = 2TP / (2TP + FP + FN)
+        (correct_predictions > 0,
+         cast(2 * correct_predictions, Float) / (2 * correct_predictions + false_positives + false_negatives)),
+        else_=0.0
+    ), persisted=True))
 
 class ProcessingQueue(Base):
     __tablename__ = "processing_queue"
@@ -173,8 +204,14 @@ class User(Base):
     last_login = Column(DateTime(timezone=True))
     
     # Relationships
-    reviewed_documents = relationship("Document", foreign_keys="Document.reviewed_by")
-    audit_logs = relationship("AuditLog", foreign_keys="AuditLog.user_id")
+    # reviewed_by / user_id hold the username without a foreign key, so the
+    # joins are spelled out
+    reviewed_documents = relationship(
+        "Document", primaryjoin="foreign(Document.reviewed_by) == User.username", viewonly=True
+    )
+    audit_logs = relationship(
+        "AuditLog", primaryjoin="foreign(AuditLog.user_id) == User.username", viewonly=True
+    )
 
 class BatchUpload(Base):
     __tablename__ = "batch_uploads"
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, File, UploadFile, Depends, HTTPException, BackgroundTasks
+from fastapi import FastAPI, File, UploadFile, Depends, HTTPException, BackgroundTasks, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
@@ -7,6 +7,7 @@ import shutil
 import uuid
 from datetime import datetime
 from typing import List, Optional, Dict, Any
+from urllib.parse import urlencode
 import logging
 
 from database import get_db, init_db, Document, FieldExtraction, AuditLog, FieldDefinition, HumanFeedback, ModelPerformance
@@ -31,6 +32,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # Paging cursor of /analytics/feedback-data
 )
 
 # Initialize services
@@ -57,6 +59,11 @@ async def startup_event():
     finally:
         db.close()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release shared LLM provider connections on shutdown"""
+    await LLMService.aclose()
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -172,9 +179,17 @@ async def process_document(document_id: int):
         db.add(audit_log)
         db.commit()
         
-        # Step 1: OCR Processing
+        # Step 1: OCR Processing - when pipelined, each page's LLM extraction
+        # (step 3) starts as soon as that page is OCR'd
         logger.info(f"Starting OCR for document {document_id}")
-        ocr_result = ocr_service.extract_text_from_pdf(document.file_path)
+        if llm_service.page_pipeline:
+            page_results, extraction_result = await llm_service.extract_fields_from_pages(
+                ocr_service.iter_pages(document.file_path),
+                preprocess=ocr_service.preprocess_text
+            )
+            ocr_result = ocr_service.combine_page_results(page_results)
+        else:
+            ocr_result = ocr_service.extract_text_from_pdf(document.file_path)
         
         # Update document with OCR results
         document.ocr_text = ocr_result['text']
@@ -196,12 +211,13 @@ async def process_document(document_id: int):
         db.add(audit_log)
         db.commit()
         
-        # Step 2: Preprocess text
-        preprocessed_text = ocr_service.preprocess_text(ocr_result['text'])
-        
-        # Step 3: LLM Field Extraction
-        logger.info(f"Starting field extraction for document {document_id}")
-        extraction_result = llm_service.extract_fields(preprocessed_text)
+        if not llm_service.page_pipeline:
+            # Step 2: Preprocess text
+            preprocessed_text = ocr_service.preprocess_text(ocr_result['text'])
+            
+            # Step 3: LLM Field Extraction
+            logger.info(f"Starting field extraction for document {document_id}")
+            extraction_result = llm_service.extract_fields(preprocessed_text, ocr_confidence=ocr_result['confidence'])
         
         # Update document with extraction results
         document.extracted_fields = extraction_result['extracted_fields']
@@ -403,6 +419,30 @@ async def get_llm_providers(db: Session = Depends(get_db)):
         "default_provider": llm_service.default_provider
     }
 
+@app.post("/extract/batch")
+async def extract_batch(request: Dict[str, Any], db: Session = Depends(get_db)):
+    """
+    Extract fields from a list of OCR texts concurrently
+    """
+    texts = request.get("texts")
+    if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+        raise HTTPException(status_code=400, detail="texts must be a list of strings")
+    
+    concurrency = request.get("concurrency")
+    # bool is an int subclass, so true/false are rejected explicitly
+    if concurrency is not None and (isinstance(concurrency, bool) or not isinstance(concurrency, int) or concurrency < 1):
+        raise HTTPException(status_code=400, detail="concurrency must be a positive integer")
+    
+    llm_service = LLMService(db)
+    results = await llm_service.extract_fields_batch(
+        texts,
+        provider=request.get("provider"),
+        model=request.get("model"),
+        concurrency=concurrency
+    )
+    
+    return {"results": results}
+
 # Field Definition Management Endpoints
 
 @app.get("/fields", response_model=List[dict])
@@ -474,9 +514,11 @@ async def delete_field_definition(field_id: int, db: Session = Depends(get_db)):
     return {"message": "Field definition deactivated successfully"}
 
 # Human Feedback and RL Endpoints
+# Plain def: FastAPI runs these on its threadpool, so their blocking database
+# round trips don't stall the event loop for other requests
 
 @app.post("/documents/{document_id}/feedback")
-async def submit_human_feedback(
+def submit_human_feedback(
     document_id: int,
     feedback_data: Dict[str, Any],
     db: Session = Depends(get_db)
@@ -520,7 +562,7 @@ async def submit_human_feedback(
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/documents/{document_id}/review/complete")
-async def complete_document_review(
+def complete_document_review(
     document_id: int,
     review_data: Dict[str, Any],
     db: Session = Depends(get_db)
@@ -535,7 +577,7 @@ async def complete_document_review(
     corrected_fields = review_data.get("corrected_fields", {})
     model_version = document.llm_model or "unknown"
     
-    feedback_count = 0
+    feedback_items = []
     
     try:
         # Process each field correction
@@ -557,18 +599,20 @@ async def complete_document_review(
             else:
                 continue  # Skip if both are empty
             
-            rl_service.record_human_feedback(
-                document_id=document_id,
-                field_name=field_name,
-                original_value=original_value,
-                corrected_value=corrected_value,
-                original_confidence=original_confidence,
-                feedback_type=feedback_type,
-                reviewer_id=reviewer_id,
-                model_version=model_version,
-                ocr_context=document.ocr_text
-            )
-            feedback_count += 1
+            feedback_items.append({
+                "document_id": document_id,
+                "field_name": field_name,
+                "original_value": original_value,
+                "corrected_value": corrected_value,
+                "original_confidence": original_confidence,
+                "feedback_type": feedback_type,
+                "reviewer_id": reviewer_id,
+                "model_version": model_version,
+                "ocr_context": document.ocr_text
+            })
+        
+        rl_service.record_human_feedback_batch(feedback_items)
+        feedback_count = len(feedback_items)
         
         # Update document review status
         document.review_completed = True
@@ -595,7 +639,7 @@ async def complete_document_review(
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/analytics/model-performance")
-async def get_model_performance(
+def get_model_performance(
     model_version: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
@@ -625,16 +669,31 @@ async def get_model_performance(
     }
 
 @app.get("/analytics/feedback-data")
-async def get_feedback_data(
+def get_feedback_data(
+    response: Response,
     model_version: Optional[str] = None,
     field_name: Optional[str] = None,
     limit: int = 100,
+    cursor: Optional[datetime] = None,
+    cursor_id: Optional[int] = None,
     db: Session = Depends(get_db)
 ):
-    """Get human feedback data for analysis"""
+    """Get human feedback data for analysis, newest first. When more pages
+    follow, the X-Next-Cursor header holds the cursor and cursor_id query
+    parameters for the next one"""
+    if (cursor is None) != (cursor_id is None):
+        raise HTTPException(status_code=400, detail="cursor and cursor_id must be given together")
+    
     rl_service = ReinforcementLearningService(db)
     
-    feedback_data = rl_service.get_feedback_for_training(model_version, field_name, limit)
+    feedback_data = rl_service.get_feedback_for_training(
+        model_version, field_name, limit, (cursor, cursor_id) if cursor is not None else None
+    )
+    
+    # A full page may have more behind it; a short page is the last one
+    if feedback_data and len(feedback_data) == limit:
+        last = feedback_data[-1]
+        response.headers["X-Next-Cursor"] = urlencode({"cursor": last.review_timestamp.isoformat(), "cursor_id": last.id})
     
     return [
         {
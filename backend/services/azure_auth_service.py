@@ -2,7 +2,9 @@ import logging
 from typing import Dict, Any, Optional, List
 import requests
 import jwt
-from datetime import datetime, timedelta
+import orjson
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from fastapi import HTTPException, status
 import os
@@ -32,11 +34,23 @@ class AzureEntraIDService:
         self.authority = f"https://login.microsoftonline.com/{self.tenant_id}"
         self.token_endpoint = f"{self.authority}/oauth2/v2.0/token"
         self.userinfo_endpoint = "https://graph.microsoft.com/v1.0/me"
+        self.memberof_endpoint = "https://graph.microsoft.com/v1.0/me/memberOf"
         self.jwks_uri = f"{self.authority}/discovery/v2.0/keys"
         
         # Scopes
         self.scopes = ["openid", "profile", "email", "User.Read"]
         
+        # Shared HTTP session so token/Graph calls reuse connections
+        self.http_timeout = float(os.getenv("AZURE_HTTP_TIMEOUT", "10"))
+        self._http = requests.Session()
+        self._http.headers.update({
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip"
+        })
+        
+        # Skip last_login writes for logins closer together than this
+        self.last_login_refresh_interval = timedelta(minutes=5)
+        
         self.enabled = all([self.tenant_id, self.client_id, self.client_secret])
         
         if not self.enabled:
@@ -84,12 +98,12 @@ class AzureEntraIDService:
                 "scope": " ".join(self.scopes)
             }
             
-            response = requests.post(self.token_endpoint, data=data)
+            response = self._http.post(self.token_endpoint, data=data, timeout=self.http_timeout)
             response.raise_for_status()
             
-            return response.json()
+            return orjson.loads(response.content)
             
-        except requests.RequestException as e:
+        except (requests.RequestException, orjson.JSONDecodeError) as e:
             logger.error(f"Error exchanging code for token: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -101,12 +115,12 @@ class AzureEntraIDService:
         
         try:
             headers = {"Authorization": f"Bearer {access_token}"}
-            response = requests.get(self.userinfo_endpoint, headers=headers)
+            response = self._http.get(self.userinfo_endpoint, headers=headers, timeout=self.http_timeout)
             response.raise_for_status()
             
-            return response.json()
+            return orjson.loads(response.content)
             
-        except requests.RequestException as e:
+        except (requests.RequestException, orjson.JSONDecodeError) as e:
             logger.error(f"Error getting user info: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -118,9 +132,9 @@ class AzureEntraIDService:
         
         try:
             # Get signing keys from Azure
-            jwks_response = requests.get(self.jwks_uri)
+            jwks_response = self._http.get(self.jwks_uri, timeout=self.http_timeout)
             jwks_response.raise_for_status()
-            jwks = jwks_response.json()
+            jwks = orjson.loads(jwks_response.content)
             
             # Decode token header to get key ID
             unverified_header = jwt.get_unverified_header(id_token)
@@ -213,30 +227,37 @@ class AzureEntraIDService:
         try:
             email = azure_user_info.get("mail") or azure_user_info.get("userPrincipalName")
             username = email.split("@")[0] if email else azure_user_info.get("id")
+            full_name = azure_user_info.get("displayName") or azure_user_info.get("name")
+            now = datetime.now(timezone.utc)
             
-            # Check if user exists
+            # Check if user exists (users.email is unique + indexed)
             user = self.db.query(User).filter(User.email == email).first()
             
             if user:
-                # Update existing user
-                user.full_name = azure_user_info.get("displayName") or azure_user_info.get("name")
-                user.last_login = datetime.utcnow()
-                self.db.commit()
-                
-                logger.info(f"Updated existing Azure user: {email}")
+                # Only write back when something actually changed
+                if user.full_name != full_name or self._is_login_stale(user.last_login, now):
+                    user.full_name = full_name
+                    user.last_login = now
+                    self.db.commit()
+                    logger.info(f"Updated existing Azure user: {email}")
             else:
                 # Create new user
                 user_data = {
                     "username": username,
                     "email": email,
                     "password": "azure_sso",  # Placeholder - not used for SSO users
-                    "full_name": azure_user_info.get("displayName") or azure_user_info.get("name"),
+                    "full_name": full_name,
                     "role": self.determine_user_role(azure_user_info),
                     "is_active": True
                 }
                 
-                user = self.auth_service.create_user(user_data)
-                logger.info(f"Created new Azure user: {email}")
+                try:
+                    user = self.auth_service.create_user(user_data)
+                    logger.info(f"Created new Azure user: {email}")
+                except IntegrityError:
+                    # A concurrent login created the same user first
+                    self.db.rollback()
+                    user = self.db.query(User).filter(User.email == email).one()
             
             return user
             
@@ -247,6 +268,18 @@ class AzureEntraIDService:
                 detail="Failed to create/update user"
             )
     
+    def _is_login_stale(self, last_login: Optional[datetime], now: datetime) -> bool:
+        """Check whether last_login is old enough to be worth rewriting"""
+        
+        if last_login is None:
+            return True
+        
+        if last_login.tzinfo is None:
+            # Naive values (e.g. SQLite, older rows) are stored as UTC
+            last_login = last_login.replace(tzinfo=timezone.utc)
+        
+        return now - last_login > self.last_login_refresh_interval
+    
     def determine_user_role(self, azure_user_info: Dict[str, Any]) -> str:
         """Determine user role based on Azure user information"""
         
@@ -266,14 +299,23 @@ class AzureEntraIDService:
         
         try:
             headers = {"Authorization": f"Bearer {access_token}"}
-            response = requests.get(
-                "https://graph.microsoft.com/v1.0/me/memberOf",
-                headers=headers
-            )
-            response.raise_for_status()
             
-            groups = response.json().get("value", [])
-            return [group.get("displayName") for group in groups if group.get("displayName")]
+            # Ask for the largest page Graph allows and only the field we use,
+            # then follow @odata.nextLink so large tenants are not truncated
+            url = f"{self.memberof_endpoint}?$top=999&$select=displayName"
+            group_names = []
+            
+            while url:
+                response = self._http.get(url, headers=headers, timeout=self.http_timeout)
+                response.raise_for_status()
+                
+                page = orjson.loads(response.content)
+                group_names.extend(
+                    group.get("displayName") for group in page.get("value", []) if group.get("displayName")
+                )
+                url = page.get("@odata.nextLink")
+            
+            return group_names
             
         except Exception as e:
             logger.error(f"Error getting Azure groups: {str(e)}")
@@ -291,12 +333,12 @@ class AzureEntraIDService:
                 "scope": " ".join(self.scopes)
             }
             
-            response = requests.post(self.token_endpoint, data=data)
+            response = self._http.post(self.token_endpoint, data=data, timeout=self.http_timeout)
             response.raise_for_status()
             
-            return response.json()
+            return orjson.loads(response.content)
             
-        except requests.RequestException as e:
+        except (requests.RequestException, orjson.JSONDecodeError) as e:
             logger.error(f"Error refreshing token: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
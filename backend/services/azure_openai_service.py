@@ -1,16 +1,36 @@
 import logging
+import re
+from functools import lru_cache
 from typing import Dict, Any, List, Optional
-import openai
-from openai import AzureOpenAI
 import os
 from dotenv import load_dotenv
-import json
+import orjson
 import time
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Format checks for confidence scoring, compiled once instead of per value
+_DATE_PATTERNS = (
+    re.compile(r'\d{1,2}/\d{1,2}/\d{4}'),
+    re.compile(r'\d{1,2}-\d{1,2}-\d{4}'),
+    re.compile(r'\d{4}-\d{1,2}-\d{1,2}')
+)
+_EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+_PHONE_PATTERNS = (
+    re.compile(r'^\(\d{3}\) \d{3}-\d{4}$'),
+    re.compile(r'^\d{3}-\d{3}-\d{4}$'),
+    re.compile(r'^\d{10}$')
+)
+
+
+@lru_cache(maxsize=256)
+def _compile_validation_pattern(pattern: str) -> re.Pattern:
+    """Compiled form of a field's validation pattern"""
+    return re.compile(pattern)
+
+
 class AzureOpenAIService:
     """Service for Azure OpenAI integration"""
     
@@ -25,12 +45,17 @@ class AzureOpenAIService:
         self.gpt35_deployment = os.getenv("AZURE_OPENAI_GPT35_DEPLOYMENT", "gpt-35-turbo")
         self.embedding_deployment = os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT", "text-embedding-ada-002")
         
+        # Review thresholds
+        self.reload_config()
+        
         # Initialize client
         self.client = None
         self.enabled = False
         
         if self.azure_endpoint and self.api_key:
             try:
+                # Imported here so processes without Azure configured don't load the SDK
+                from openai import AzureOpenAI
                 self.client = AzureOpenAI(
                     azure_endpoint=self.azure_endpoint,
                     api_key=self.api_key,
@@ -43,6 +68,11 @@ class AzureOpenAIService:
         else:
             logger.warning("Azure OpenAI not configured - missing endpoint or API key")
     
+    def reload_config(self):
+        """Re-read the review thresholds from the environment"""
+        self.min_confidence_threshold = float(os.getenv("MIN_CONFIDENCE_THRESHOLD", "0.7"))
+        self.required_fields_threshold = float(os.getenv("REQUIRED_FIELDS_THRESHOLD", "0.8"))
+    
     def extract_fields(self, ocr_text: str, field_definitions: List[Dict], model: str = None) -> Dict[str, Any]:
         """
         Extract fields from OCR text using Azure OpenAI
@@ -66,7 +96,7 @@ class AzureOpenAIService:
             prompt = self._create_extraction_prompt(ocr_text, field_definitions)
             
             # Call Azure OpenAI
-            start_time = time.time()
+            start_time = time.perf_counter()
             response = self.client.chat.completions.create(
                 model=deployment,
                 messages=[
@@ -84,7 +114,7 @@ class AzureOpenAIService:
                 response_format={"type": "json_object"}
             )
             
-            processing_time = time.time() - start_time
+            processing_time = time.perf_counter() - start_time
             
             # Parse response
             extracted_data = self._parse_response(response, field_definitions)
@@ -197,7 +227,7 @@ JSON Response:"""
                 content = content[:-3]
             content = content.strip()
             
-            extracted_data = json.loads(content)
+            extracted_data = orjson.loads(content)
             
             # Map display names to internal names
             field_mapping = {}
@@ -214,7 +244,7 @@ JSON Response:"""
             
             return validated_data
             
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"Failed to parse Azure OpenAI JSON response: {str(e)}")
             logger.error(f"Raw response: {response.choices[0].message.content}")
             return {}
@@ -227,38 +257,40 @@ JSON Response:"""
         
         confidence_scores = {}
         
+        # Definitions by internal and display name, first definition wins
+        field_lookup = {}
+        for fd in field_definitions:
+            field_lookup.setdefault(fd.get('name'), fd)
+            field_lookup.setdefault(fd.get('display_name'), fd)
+        
         for field_name, value in extracted_data.items():
-            if not value or str(value).strip() == "":
+            text = str(value) if value else ""
+            if not text.strip():
                 confidence_scores[field_name] = 0.0
             else:
                 # Base confidence for Azure OpenAI
                 confidence = 0.85  # Higher base confidence for structured output
                 
-                # Find field definition
-                field_def = None
-                for fd in field_definitions:
-                    if fd.get('name') == field_name or fd.get('display_name') == field_name:
-                        field_def = fd
-                        break
+                field_def = field_lookup.get(field_name)
                 
                 if field_def:
                     field_type = field_def.get('field_type', 'text')
                     validation_pattern = field_def.get('validation_pattern')
                     
                     # Adjust confidence based on field type validation
-                    if field_type == "date" and self._is_valid_date(str(value)):
+                    if field_type == "date" and self._is_valid_date(text):
                         confidence = 0.9
-                    elif field_type == "email" and self._is_valid_email(str(value)):
+                    elif field_type == "email" and self._is_valid_email(text):
                         confidence = 0.9
-                    elif field_type == "phone" and self._is_valid_phone(str(value)):
+                    elif field_type == "phone" and self._is_valid_phone(text):
                         confidence = 0.9
-                    elif validation_pattern and self._matches_pattern(str(value), validation_pattern):
+                    elif validation_pattern and self._matches_pattern(text, validation_pattern):
                         confidence = 0.9
                 
                 # Adjust based on value length and content
-                if len(str(value)) < 2:
+                if len(text) < 2:
                     confidence = 0.6
-                elif len(str(value)) > 100:
+                elif len(text) > 100:
                     confidence = 0.8  # Very long values might be less accurate
                 
                 confidence_scores[field_name] = confidence
@@ -294,10 +326,6 @@ JSON Response:"""
         # Check if all required fields are present
         missing_required = [field for field in required_fields if field not in extracted_data or not extracted_data[field]]
         
-        # Check confidence thresholds
-        min_confidence = float(os.getenv("MIN_CONFIDENCE_THRESHOLD", "0.7"))
-        required_threshold = float(os.getenv("REQUIRED_FIELDS_THRESHOLD", "0.8"))
-        
         overall_confidence = confidence_scores.get('overall', 0.0)
         
         # Requires review if:
@@ -307,54 +335,33 @@ JSON Response:"""
         if missing_required:
             return True
         
-        if overall_confidence < min_confidence:
+        if overall_confidence < self.min_confidence_threshold:
             return True
         
         for field_name in required_fields:
-            if field_name in confidence_scores and confidence_scores[field_name] < required_threshold:
+            if field_name in confidence_scores and confidence_scores[field_name] < self.required_fields_threshold:
                 return True
         
         return False
     
     def _is_valid_date(self, date_str: str) -> bool:
         """Simple date validation"""
-        import re
-        date_patterns = [
-            r'\d{1,2}/\d{1,2}/\d{4}',
-            r'\d{1,2}-\d{1,2}-\d{4}',
-            r'\d{4}-\d{1,2}-\d{1,2}'
-        ]
-        
-        for pattern in date_patterns:
-            if re.match(pattern, date_str.strip()):
-                return True
-        return False
+        date_str = date_str.strip()
+        return any(pattern.match(date_str) for pattern in _DATE_PATTERNS)
     
     def _is_valid_email(self, email_str: str) -> bool:
         """Simple email validation"""
-        import re
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        return bool(re.match(pattern, email_str.strip()))
+        return bool(_EMAIL_PATTERN.match(email_str.strip()))
     
     def _is_valid_phone(self, phone_str: str) -> bool:
         """Simple phone validation"""
-        import re
-        patterns = [
-            r'^\(\d{3}\) \d{3}-\d{4}$',
-            r'^\d{3}-\d{3}-\d{4}$',
-            r'^\d{10}$'
-        ]
-        
-        for pattern in patterns:
-            if re.match(pattern, phone_str.strip()):
-                return True
-        return False
+        phone_str = phone_str.strip()
+        return any(pattern.match(phone_str) for pattern in _PHONE_PATTERNS)
     
     def _matches_pattern(self, value: str, pattern: str) -> bool:
         """Check if value matches regex pattern"""
-        import re
         try:
-            return bool(re.match(pattern, value.strip()))
+            return bool(_compile_validation_pattern(pattern).match(value.strip()))
         except re.error:
             return False
     
@@ -1,15 +1,70 @@
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import cv2
 import numpy as np
 from PIL import Image
 import os
 import tempfile
-from pdf2image import convert_from_path
+import threading
+import fitz  # PyMuPDF
 import pytesseract
 
+# Optional persistent Tesseract binding - falls back to pytesseract subprocesses
+try:
+    from tesserocr import PyTessBaseAPI
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+    PyTessBaseAPI = None
+
 logger = logging.getLogger(__name__)
 
+# Common document start indicators looked for in page headers
+HEADER_START_INDICATORS = (
+    "authorization", "denial", "approval", "notice",
+    "patient:", "member:", "case:", "reference:",
+    "date:", "to:", "from:", "re:"
+)
+
+# Keywords used for simple document type classification
+DOCUMENT_TYPE_KEYWORDS = {
+    "authorization": ("authorization", "approved", "authorize", "approval"),
+    "denial": ("denial", "denied", "reject", "decline", "not approved"),
+    "appeal": ("appeal", "reconsideration", "review request"),
+    "claim": ("claim", "billing", "invoice", "payment"),
+    "correspondence": ("letter", "notice", "communication", "memo")
+}
+
+# Per-process state used by boundary-detection pool workers
+_worker_splitter = None
+_worker_pdf = None
+
+# Per-page boundary features (struct-of-arrays over the pages of one PDF)
+PAGE_FEATURES_DTYPE = np.dtype([
+    ('content_ratio', 'f4'),  # Fraction of non-white pixels
+    ('rule_coverage', 'f4'),  # Widest letterhead rule as a fraction of page width
+    ('header_score', 'i1'),   # Header start indicators found by OCR (filled in batch)
+])
+
+def _page_features_worker(args: Tuple[str, int]) -> Tuple[float, float, Optional[np.ndarray]]:
+    """Process-pool entry point: render one PDF page and extract its boundary features"""
+    global _worker_splitter, _worker_pdf
+    
+    if _worker_splitter is None:
+        _worker_splitter = DocumentSplitterService()
+    
+    pdf_path, page_index = args
+    
+    # Keep the PDF open across all pages this worker handles
+    if _worker_pdf is None or _worker_pdf.name != pdf_path:
+        if _worker_pdf is not None:
+            _worker_pdf.close()
+        _worker_pdf = fitz.open(pdf_path)
+    
+    gray = _worker_splitter._render_page(_worker_pdf, page_index)
+    return _worker_splitter._page_features(gray, page_index)
+
 class DocumentSplitterService:
     """Service for splitting multi-document files into individual documents"""
     
@@ -17,6 +72,17 @@ class DocumentSplitterService:
         self.min_page_height = 500  # Minimum height for a valid page
         self.separator_threshold = 0.8  # Threshold for detecting page separators
         self.confidence_threshold = 0.7  # Minimum confidence for split detection
+        self.pdf_dpi = 150  # Rasterization DPI for the boundary-feature pass
+        self.part_dpi = 200  # Rasterization DPI of written split parts - they are OCR'd downstream
+        self.analysis_max_dim = 600  # Long edge (px) used for whole-page heuristics
+        self.blank_page_ratio = 0.05  # Pages with less content than this are separators
+        self.min_rule_coverage = 0.6  # Letterhead rule must span this fraction of the width
+        self.min_header_indicators = 2  # Header indicators needed to mark a document start
+        self.max_workers = int(os.getenv("SPLITTER_MAX_WORKERS", str(os.cpu_count() or 1)))
+        
+        # Tesseract handle reused for header OCR across pages (created lazily)
+        self._tess = None
+        self._tess_lock = threading.Lock()
     
     def split_document(self, file_path: str) -> Dict[str, Any]:
         """
@@ -46,74 +112,81 @@ class DocumentSplitterService:
         """Split a PDF document into individual documents"""
         
         try:
-            # Convert PDF pages to images
-            images = convert_from_path(pdf_path, dpi=200)
-            
-            if len(images) <= 1:
-                return {
-                    "status": "no_split_needed",
-                    "message": "Document has only one page",
-                    "documents": [{
-                        "file_path": pdf_path,
-                        "file_size": os.path.getsize(pdf_path),
-                        "page_range": "1-1",
-                        "confidence": 1.0
-                    }]
-                }
-            
-            # Analyze pages to find document boundaries
-            split_points = self._detect_document_boundaries(images)
-            
-            if not split_points:
+            # PyMuPDF renders in-process, one page at a time, so no page
+            # images are written to disk or held in memory all at once
+            with fitz.open(pdf_path) as doc:
+                page_count = doc.page_count
+                
+                if page_count <= 1:
+                    return {
+                        "status": "no_split_needed",
+                        "message": "Document has only one page",
+                        "documents": [{
+                            "file_path": pdf_path,
+                            "file_size": os.path.getsize(pdf_path),
+                            "page_range": "1-1",
+                            "confidence": 1.0
+                        }]
+                    }
+                
+                # Analyze pages to find document boundaries
+                split_points = self._detect_document_boundaries(doc)
+                
+                if not split_points:
+                    return {
+                        "status": "no_split_detected",
+                        "message": "No document boundaries detected",
+                        "documents": [{
+                            "file_path": pdf_path,
+                            "file_size": os.path.getsize(pdf_path),
+                            "page_range": f"1-{page_count}",
+                            "confidence": 0.5
+                        }]
+                    }
+                
+                # Create individual documents. Pages are rendered here (PyMuPDF is
+                # not thread-safe) while PNG encoding + writing of earlier parts
+                # runs on threads - cv2.imwrite releases the GIL
+                parts = []
+                base_name = os.path.splitext(pdf_path)[0]
+                
+                with ThreadPoolExecutor(max_workers=min(8, len(split_points) + 1)) as executor:
+                    start_page = 0
+                    for i, split_point in enumerate(split_points + [page_count]):
+                        if split_point > start_page:
+                            # Create document for this range
+                            doc_images = [self._render_part_page(doc, page) for page in range(start_page, split_point)]
+                            
+                            # Save as PDF (would need additional PDF library for this)
+                            # For now, save as images - every part, single page or not,
+                            # is a colour PNG so consumers see one format
+                            doc_path = f"{base_name}_part_{i+1}.png"
+                            
+                            # Combine multiple images into one (simple vertical stack)
+                            doc_image = doc_images[0] if len(doc_images) == 1 else self._combine_images_vertically(doc_images)
+                            future = executor.submit(self._write_part, doc_path, doc_image)
+                            
+                            parts.append((future, doc_path, start_page, split_point))
+                            
+                            start_page = split_point
+                    
+                    documents = []
+                    for future, doc_path, first_page, split_point in parts:
+                        documents.append({
+                            "file_path": doc_path,
+                            "file_size": future.result(),
+                            "page_range": f"{first_page+1}-{split_point}",
+                            "confidence": 0.8,
+                            "pages_count": split_point - first_page
+                        })
+                
                 return {
-                    "status": "no_split_detected",
-                    "message": "No document boundaries detected",
-                    "documents": [{
-                        "file_path": pdf_path,
-                        "file_size": os.path.getsize(pdf_path),
-                        "page_range": f"1-{len(images)}",
-                        "confidence": 0.5
-                    }]
+                    "status": "split_completed",
+                    "original_pages": page_count,
+                    "documents_created": len(documents),
+                    "documents": documents
                 }
             
-            # Create individual documents
-            documents = []
-            base_name = os.path.splitext(pdf_path)[0]
-            
-            start_page = 0
-            for i, split_point in enumerate(split_points + [len(images)]):
-                if split_point > start_page:
-                    # Create document for this range
-                    doc_images = images[start_page:split_point]
-                    doc_path = f"{base_name}_part_{i+1}.pdf"
-                    
-                    # Save as PDF (would need additional PDF library for this)
-                    # For now, save as images
-                    doc_path = f"{base_name}_part_{i+1}.png"
-                    if len(doc_images) == 1:
-                        doc_images[0].save(doc_path)
-                    else:
-                        # Combine multiple images into one (simple vertical stack)
-                        combined_image = self._combine_images_vertically(doc_images)
-                        combined_image.save(doc_path)
-                    
-                    documents.append({
-                        "file_path": doc_path,
-                        "file_size": os.path.getsize(doc_path),
-                        "page_range": f"{start_page+1}-{split_point}",
-                        "confidence": 0.8,
-                        "pages_count": len(doc_images)
-                    })
-                    
-                    start_page = split_point
-            
-            return {
-                "status": "split_completed",
-                "original_pages": len(images),
-                "documents_created": len(documents),
-                "documents": documents
-            }
-            
         except Exception as e:
             logger.error(f"Error splitting PDF: {str(e)}")
             raise
@@ -122,12 +195,14 @@ class DocumentSplitterService:
         """Split a single image that may contain multiple documents"""
         
         try:
-            image = cv2.imread(image_path)
-            if image is None:
+            # Load straight to grayscale: separators and parts are both luminance-only,
+            # matching the grayscale pages produced for PDFs
+            gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+            if gray is None:
                 raise ValueError("Could not load image")
             
             # Detect horizontal separators (common in faxed documents)
-            separators = self._detect_horizontal_separators(image)
+            separators = self._detect_horizontal_separators(gray)
             
             if not separators:
                 return {
@@ -145,10 +220,10 @@ class DocumentSplitterService:
             base_name = os.path.splitext(image_path)[0]
             
             y_start = 0
-            for i, separator_y in enumerate(separators + [image.shape[0]]):
+            for i, separator_y in enumerate(separators + [gray.shape[0]]):
                 if separator_y > y_start + self.min_page_height:
                     # Extract document region
-                    doc_region = image[y_start:separator_y, :]
+                    doc_region = gray[y_start:separator_y, :]
                     
                     # Save as separate image
                     doc_path = f"{base_name}_part_{i+1}.png"
@@ -166,7 +241,7 @@ class DocumentSplitterService:
             
             return {
                 "status": "split_completed",
-                "original_size": f"{image.shape[1]}x{image.shape[0]}",
+                "original_size": f"{gray.shape[1]}x{gray.shape[0]}",
                 "documents_created": len(documents),
                 "documents": documents
             }
@@ -175,118 +250,191 @@ class DocumentSplitterService:
             logger.error(f"Error splitting image: {str(e)}")
             raise
     
-    def _detect_document_boundaries(self, images: List[Image.Image]) -> List[int]:
-        """Detect document boundaries in a list of PDF page images"""
-        
-        split_points = []
+    def _detect_document_boundaries(self, doc: fitz.Document) -> List[int]:
+        """Detect document boundaries across the pages of an open PDF"""
         
         try:
-            for i, image in enumerate(images):
-                # Convert PIL image to OpenCV format
-                cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-                
-                # Look for document boundary indicators
-                if self._is_document_boundary(cv_image, i):
-                    split_points.append(i)
+            # Only (path, page) pairs cross the process boundary; each worker
+            # opens the PDF itself and renders its own pages
+            pages = [(doc.name, i) for i in range(doc.page_count)]
+            features = np.empty(len(pages), dtype=PAGE_FEATURES_DTYPE)
+            
+            features['header_score'] = 0
+            header_regions = {}
+            
+            # Phase 1: extract image features - pages are independent and
+            # CPU-bound, so spread them over processes
+            rows = None
+            max_workers = min(self.max_workers, len(pages))
+            if max_workers > 1:
+                try:
+                    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                        rows = list(executor.map(_page_features_worker, pages))
+                except Exception as e:
+                    # e.g. daemonic Celery workers cannot spawn child processes
+                    logger.warning(f"Parallel boundary detection unavailable, running sequentially: {str(e)}")
+            
+            if rows is None:
+                rows = (self._page_features(self._render_page(doc, i), i) for _, i in pages)
+            
+            for i, (content_ratio, rule_coverage, header_region) in enumerate(rows):
+                features[i]['content_ratio'] = content_ratio
+                features[i]['rule_coverage'] = rule_coverage
+                if header_region is not None:
+                    header_regions[i] = header_region
+            
+            # Header OCR for the pages the image features left undecided, as
+            # one batch rather than one Tesseract call per page
+            if header_regions:
+                header_texts = self._ocr_headers(list(header_regions.values()))
+                features['header_score'][list(header_regions)] = [
+                    sum(1 for indicator in HEADER_START_INDICATORS if indicator in text.lower())
+                    for text in header_texts
+                ]
             
-            return split_points
+            # Phase 2: apply the boundary rules to the whole document at once
+            is_boundary = self._boundary_mask(features)
+            return np.flatnonzero(is_boundary).tolist()
             
         except Exception as e:
             logger.error(f"Error detecting document boundaries: {str(e)}")
             return []
     
-    def _is_document_boundary(self, image: np.ndarray, page_index: int) -> bool:
-        """Determine if a page represents a document boundary"""
+    def _boundary_mask(self, features: np.ndarray) -> np.ndarray:
+        """Flag pages whose features indicate the start of a new document"""
+        
+        return (
+            (features['content_ratio'] < self.blank_page_ratio)  # Mostly blank separator page
+            | (features['rule_coverage'] > self.min_rule_coverage)  # Letterhead rule
+            | (features['header_score'] >= self.min_header_indicators)  # Header text
+        )
+    
+    def _render_page(self, doc: fitz.Document, page_index: int) -> np.ndarray:
+        """Rasterize one PDF page straight to an 8-bit grayscale array"""
+        
+        pix = doc[page_index].get_pixmap(dpi=self.pdf_dpi, colorspace=fitz.csGRAY)
+        return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+    
+    def _render_part_page(self, doc: fitz.Document, page_index: int) -> np.ndarray:
+        """Rasterize one PDF page for a written part - in colour, at part_dpi,
+        as the BGR array cv2.imwrite expects"""
+        
+        pix = doc[page_index].get_pixmap(dpi=self.part_dpi, colorspace=fitz.csRGB, alpha=False)
+        rgb = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, 3)
+        return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
+    
+    def _page_features(self, gray: np.ndarray, page_index: int) -> Tuple[float, float, Optional[np.ndarray]]:
+        """Extract the image boundary features of a grayscale page, plus its
+        header crop when the page still needs OCR to be decided"""
         
         try:
-            # Convert to grayscale
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            # Pixel-statistics features don't need full resolution; only OCR does
+            small = self._downsample(gray)
             
-            # Look for common boundary indicators
+            # 1. Content ratio (mostly blank pages are common separators)
+            non_white_pixels = cv2.countNonZero(cv2.compare(small, 240, cv2.CMP_LT))
+            content_ratio = non_white_pixels / small.size
             
-            # 1. Check for mostly blank pages (common separator)
-            non_white_pixels = np.sum(gray < 240)
-            total_pixels = gray.shape[0] * gray.shape[1]
-            content_ratio = non_white_pixels / total_pixels
+            # 2. Letterhead rules (horizontal banner lines in the header)
+            top_region = small[:int(small.shape[0] * 0.15), :]
             
-            if content_ratio < 0.05:  # Less than 5% content
-                return True
+            # 1-D vertical Sobel picks up horizontal edges only; summing strong
+            # responses per row is a 1-D Hough transform over horizontal lines
+            gradient = cv2.convertScaleAbs(cv2.Sobel(top_region, cv2.CV_16S, 0, 1, ksize=3))
+            rule_votes = self._row_counts(gradient, 40, cv2.CMP_GT)
+            rule_coverage = rule_votes.max() / top_region.shape[1] if rule_votes.size else 0.0
             
-            # 2. Look for header patterns that indicate new documents
-            header_region = gray[:int(gray.shape[0] * 0.2), :]  # Top 20%
+            # 3. Header patterns that indicate new documents. OCR is by far the
+            # most expensive feature, so skip it when the page is already decided
+            header_region = None
+            if content_ratio >= self.blank_page_ratio and rule_coverage <= self.min_rule_coverage:
+                header_region = np.ascontiguousarray(gray[:int(gray.shape[0] * 0.2), :])  # Top 20%
             
-            # Use OCR to detect common header text
-            try:
-                header_text = pytesseract.image_to_string(header_region).lower()
-                
-                # Common document start indicators
-                start_indicators = [
-                    "authorization", "denial", "approval", "notice",
-                    "patient:", "member:", "case:", "reference:",
-                    "date:", "to:", "from:", "re:"
-                ]
+            return content_ratio, rule_coverage, header_region
+            
+        except Exception as e:
+            logger.error(f"Error extracting features for page {page_index}: {str(e)}")
+            return 1.0, 0.0, None  # Neutral features: not a boundary
+    
+    def _downsample(self, gray: np.ndarray) -> np.ndarray:
+        """Shrink a page so its long edge is at most analysis_max_dim pixels"""
+        
+        scale = self.analysis_max_dim / max(gray.shape)
+        if scale >= 1.0:
+            return gray
+        
+        return cv2.resize(gray, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    
+    def _ocr_header(self, header_region: np.ndarray) -> str:
+        """OCR a header crop, reusing one Tesseract instance instead of a subprocess per page"""
+        
+        if not TESSEROCR_AVAILABLE:
+            return pytesseract.image_to_string(header_region)
+        
+        with self._tess_lock:
+            if self._tess is None:
+                self._tess = PyTessBaseAPI()
+            self._tess.SetImage(Image.fromarray(header_region))
+            return self._tess.GetUTF8Text()
+    
+    def _ocr_headers(self, header_regions: List[np.ndarray]) -> List[str]:
+        """OCR a batch of header crops, returning one text per crop ("" on failure)"""
+        
+        try:
+            if TESSEROCR_AVAILABLE:
+                # The persistent API already loads the model only once
+                return [self._ocr_header(region) for region in header_regions]
+            
+            # Single tesseract run over a list file instead of a subprocess per
+            # crop; tesseract ends each image's text with a form feed
+            with tempfile.TemporaryDirectory() as temp_dir:
+                image_paths = []
+                for i, region in enumerate(header_regions):
+                    image_path = os.path.join(temp_dir, f"header_{i}.png")
+                    if not cv2.imwrite(image_path, region):
+                        raise IOError(f"Failed to write {image_path}")
+                    image_paths.append(image_path)
                 
-                header_score = sum(1 for indicator in start_indicators if indicator in header_text)
+                list_path = os.path.join(temp_dir, "list.txt")
+                with open(list_path, "w") as f:
+                    f.write("\n".join(image_paths) + "\n")
                 
-                if header_score >= 2:  # Multiple indicators suggest document start
-                    return True
-                    
-            except Exception:
-                pass  # OCR failed, continue with other methods
-            
-            # 3. Look for visual patterns (logos, letterheads)
-            # This is a simplified approach - could be more sophisticated
-            top_region = gray[:int(gray.shape[0] * 0.15), :]
-            
-            # Detect potential logo/letterhead regions (high contrast areas)
-            edges = cv2.Canny(top_region, 50, 150)
-            edge_density = np.sum(edges > 0) / (top_region.shape[0] * top_region.shape[1])
+                texts = pytesseract.image_to_string(list_path).split("\f")
             
-            if edge_density > 0.02:  # Significant edge content in header
-                return True
+            if len(texts) < len(header_regions):
+                raise ValueError(f"Expected {len(header_regions)} OCR pages, got {len(texts)}")
             
-            return False
+            return texts[:len(header_regions)]
             
         except Exception as e:
-            logger.error(f"Error checking document boundary: {str(e)}")
-            return False
+            logger.warning(f"Header OCR failed, no text-based evidence: {str(e)}")
+            return [""] * len(header_regions)
     
-    def _detect_horizontal_separators(self, image: np.ndarray) -> List[int]:
-        """Detect horizontal separators in an image"""
+    def _detect_horizontal_separators(self, gray: np.ndarray) -> List[int]:
+        """Detect horizontal separators in a grayscale image"""
         
         try:
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
             # Look for horizontal lines that span most of the width
             height, width = gray.shape
             
-            separators = []
+            # Per-row pixel counts for the whole image in two fused threshold+sum
+            # passes (cv2.compare yields 0/255 masks, hence the division)
+            dark_counts = self._row_counts(gray, 50, cv2.CMP_LT)  # Dark pixels
+            blank_rows = self._row_counts(gray, 240, cv2.CMP_GT) > width * 0.9  # 90% very light pixels
             
-            # Scan for horizontal lines
-            for y in range(int(height * 0.1), int(height * 0.9), 10):  # Skip top/bottom 10%
-                row = gray[y, :]
-                
-                # Look for long sequences of similar pixels (potential separator lines)
-                # or very light/white regions (blank space between documents)
-                
-                # Method 1: Detect horizontal lines
-                line_pixels = np.sum(row < 50)  # Dark pixels
-                if line_pixels > width * 0.8:  # Line spans 80% of width
-                    separators.append(y)
-                    continue
-                
-                # Method 2: Detect blank regions
-                blank_pixels = np.sum(row > 240)  # Very light pixels
-                if blank_pixels > width * 0.9:  # 90% blank
-                    # Check if this is part of a larger blank region
-                    blank_region_height = 0
-                    for check_y in range(max(0, y-20), min(height, y+20)):
-                        check_row = gray[check_y, :]
-                        if np.sum(check_row > 240) > width * 0.9:
-                            blank_region_height += 1
-                    
-                    if blank_region_height > 10:  # Significant blank region
-                        separators.append(y)
+            # Number of blank rows in the +/-20 row window around each row
+            blank_cumsum = np.concatenate(([0], np.cumsum(blank_rows)))
+            
+            # Scan candidate rows, skipping top/bottom 10%
+            rows = np.arange(int(height * 0.1), int(height * 0.9), 10)
+            window_start = np.maximum(rows - 20, 0)
+            window_end = np.minimum(rows + 20, height)
+            blank_region_height = blank_cumsum[window_end] - blank_cumsum[window_start]
+            
+            # Method 1: lines spanning 80% of the width
+            # Method 2: blank rows that sit inside a significant blank region
+            is_separator = (dark_counts[rows] > width * 0.8) | (blank_rows[rows] & (blank_region_height > 10))
+            separators = rows[is_separator].tolist()
             
             # Remove separators that are too close together
             filtered_separators = []
@@ -300,30 +448,41 @@ class DocumentSplitterService:
             logger.error(f"Error detecting horizontal separators: {str(e)}")
             return []
     
-    def _combine_images_vertically(self, images: List[Image.Image]) -> Image.Image:
+    def _write_part(self, doc_path: str, image: np.ndarray) -> int:
+        """Write a split part image and return its size in bytes"""
+        
+        if not cv2.imwrite(doc_path, image):
+            raise IOError(f"Could not write split part: {doc_path}")
+        
+        return os.path.getsize(doc_path)
+    
+    def _row_counts(self, gray: np.ndarray, threshold: int, cmp_op: int) -> np.ndarray:
+        """Count the pixels in each row that satisfy `pixel <cmp_op> threshold`"""
+        
+        mask = cv2.compare(gray, threshold, cmp_op)
+        return cv2.reduce(mask, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel() // 255
+    
+    def _combine_images_vertically(self, images: List[np.ndarray]) -> np.ndarray:
         """Combine multiple images vertically into one image"""
         
         try:
             if not images:
                 raise ValueError("No images to combine")
             
-            if len(images) == 1:
-                return images[0]
-            
             # Calculate total height and max width
-            total_height = sum(img.height for img in images)
-            max_width = max(img.width for img in images)
+            total_height = sum(img.shape[0] for img in images)
+            max_width = max(img.shape[1] for img in images)
             
-            # Create combined image
-            combined = Image.new('RGB', (max_width, total_height), 'white')
+            # One contiguous white canvas, filled by slice assignment
+            combined = np.full((total_height, max_width) + images[0].shape[2:], 255, dtype=np.uint8)
             
-            # Paste images vertically
+            # Place images vertically
             y_offset = 0
             for img in images:
                 # Center image horizontally if it's narrower
-                x_offset = (max_width - img.width) // 2
-                combined.paste(img, (x_offset, y_offset))
-                y_offset += img.height
+                x_offset = (max_width - img.shape[1]) // 2
+                combined[y_offset:y_offset + img.shape[0], x_offset:x_offset + img.shape[1]] = img
+                y_offset += img.shape[0]
             
             return combined
             
@@ -342,23 +501,15 @@ class DocumentSplitterService:
             text = pytesseract.image_to_string(image_path).lower()
             
             # Simple keyword-based classification
-            classification_rules = {
-                "authorization": ["authorization", "approved", "authorize", "approval"],
-                "denial": ["denial", "denied", "reject", "decline", "not approved"],
-                "appeal": ["appeal", "reconsideration", "review request"],
-                "claim": ["claim", "billing", "invoice", "payment"],
-                "correspondence": ["letter", "notice", "communication", "memo"]
-            }
-            
             scores = {}
-            for doc_type, keywords in classification_rules.items():
+            for doc_type, keywords in DOCUMENT_TYPE_KEYWORDS.items():
                 score = sum(1 for keyword in keywords if keyword in text)
                 scores[doc_type] = score
             
             # Find best match
             if scores:
                 best_type = max(scores.keys(), key=lambda k: scores[k])
-                confidence = scores[best_type] / len(classification_rules[best_type])
+                confidence = scores[best_type] / len(DOCUMENT_TYPE_KEYWORDS[best_type])
                 
                 return {
                     "document_type": best_type,
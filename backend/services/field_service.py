@@ -1,41 +1,96 @@
 import logging
-from typing import List, Dict, Any, Optional
-from sqlalchemy.orm import Session
+import os
+import re
+import time
+from collections import namedtuple
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy import func, lambda_stmt, select, tuple_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, selectinload
 from database.models import FieldDefinition, HumanFeedback, ModelPerformance
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Columns read by the field definition getters
+_FIELD_VIEW_COLUMNS = (
+    FieldDefinition.id,
+    FieldDefinition.name,
+    FieldDefinition.display_name,
+    FieldDefinition.description,
+    FieldDefinition.field_type,
+    FieldDefinition.is_required,
+    FieldDefinition.validation_pattern,
+    FieldDefinition.extraction_hints,
+    FieldDefinition.is_active,
+)
+
+class FieldView(namedtuple("FieldView", [column.key for column in _FIELD_VIEW_COLUMNS] + ["compiled_pattern", "prompt_line"])):
+    """Read-only field definition row returned by the FieldDefinitionService getters,
+    with validation_pattern precompiled (None when unset or invalid) and the
+    field's extraction prompt line rendered"""
+    __slots__ = ()
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        """Dict-style access for callers that take field definitions as dicts"""
+        return getattr(self, key, default)
+
+def render_prompt_line(display_name: str, description: Optional[str], extraction_hints: Optional[Dict[str, Any]]) -> str:
+    """A field's line in the extraction prompt - name, description and keyword hints together"""
+    line = f"- {display_name}"
+    if description:
+        line += f": {description}"
+    if extraction_hints and extraction_hints.get('keywords'):
+        line += f" (keywords: {', '.join(extraction_hints['keywords'])})"
+    return line
+
+def _dialect_insert(db: Session):
+    """insert() construct with ON CONFLICT support for the session's database"""
+    return postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+
+# Per-process cache of field definition reads: key -> (loaded_at, rows)
+_field_cache: Dict[Any, Tuple[float, List[FieldView]]] = {}
+
 class FieldDefinitionService:
     """Service for managing configurable field definitions"""
     
     def __init__(self, db: Session):
         self.db = db
+        self.cache_ttl = float(os.getenv("FIELD_CACHE_TTL", "60"))  # Seconds before cached reads reload
     
-    def get_active_fields(self) -> List[FieldDefinition]:
+    def get_active_fields(self) -> List[FieldView]:
         """Get all active field definitions"""
-        return self.db.query(FieldDefinition).filter(FieldDefinition.is_active == True).all()
+        # Field lookups run on every extraction - lambda statements reuse
+        # their compiled SQL instead of rebuilding it on each call, and plain
+        # column selects skip ORM object hydration
+        stmt = lambda_stmt(lambda: select(*_FIELD_VIEW_COLUMNS).where(
+            FieldDefinition.is_active == True
+        ).order_by(FieldDefinition.id))
+        return self._cached("active", stmt)
     
-    def get_required_fields(self) -> List[FieldDefinition]:
+    def get_required_fields(self) -> List[FieldView]:
         """Get all required field definitions"""
-        return self.db.query(FieldDefinition).filter(
+        stmt = lambda_stmt(lambda: select(*_FIELD_VIEW_COLUMNS).where(
             FieldDefinition.is_active == True,
             FieldDefinition.is_required == True
-        ).all()
+        ).order_by(FieldDefinition.id))
+        return self._cached("required", stmt)
     
-    def get_optional_fields(self) -> List[FieldDefinition]:
+    def get_optional_fields(self) -> List[FieldView]:
         """Get all optional field definitions"""
-        return self.db.query(FieldDefinition).filter(
+        stmt = lambda_stmt(lambda: select(*_FIELD_VIEW_COLUMNS).where(
             FieldDefinition.is_active == True,
             FieldDefinition.is_required == False
-        ).all()
+        ).order_by(FieldDefinition.id))
+        return self._cached("optional", stmt)
     
     def create_field_definition(self, field_data: Dict[str, Any]) -> FieldDefinition:
         """Create a new field definition"""
         field_def = FieldDefinition(**field_data)
         self.db.add(field_def)
         self.db.commit()
-        self.db.refresh(field_def)
+        _field_cache.clear()
         return field_def
     
     def update_field_definition(self, field_id: int, field_data: Dict[str, Any]) -> Optional[FieldDefinition]:
@@ -44,9 +99,8 @@ class FieldDefinitionService:
         if field_def:
             for key, value in field_data.items():
                 setattr(field_def, key, value)
-            field_def.updated_at = datetime.utcnow()
             self.db.commit()
-            self.db.refresh(field_def)
+            _field_cache.clear()
         return field_def
     
     def delete_field_definition(self, field_id: int) -> bool:
@@ -54,24 +108,54 @@ class FieldDefinitionService:
         field_def = self.db.query(FieldDefinition).filter(FieldDefinition.id == field_id).first()
         if field_def:
             field_def.is_active = False
-            field_def.updated_at = datetime.utcnow()
             self.db.commit()
+            _field_cache.clear()
             return True
         return False
     
-    def get_field_by_name(self, name: str) -> Optional[FieldDefinition]:
+    def get_field_by_name(self, name: str) -> Optional[FieldView]:
         """Get field definition by name"""
-        return self.db.query(FieldDefinition).filter(
+        # name is picked up from the closure as a bound parameter
+        stmt = lambda_stmt(lambda: select(*_FIELD_VIEW_COLUMNS).where(
             FieldDefinition.name == name,
             FieldDefinition.is_active == True
-        ).first()
+        ).limit(1))
+        fields = self._cached(("name", name), stmt)
+        return fields[0] if fields else None
     
-    def initialize_default_fields(self):
-        """Initialize default field definitions if none exist"""
-        existing_count = self.db.query(FieldDefinition).count()
-        if existing_count > 0:
-            return
+    def _cached(self, key: Any, stmt) -> List[FieldView]:
+        """Return a field definition read from the per-process cache, running
+        the statement when it is missing or older than the TTL"""
+        now = time.monotonic()
+        entry = _field_cache.get(key)
+        
+        if entry is None or now - entry[0] >= self.cache_ttl:
+            # Immutable rows, so they can be shared across sessions as-is;
+            # patterns are compiled and prompt lines rendered once per load
+            # rather than per validation / per prompt
+            entry = _field_cache[key] = (now, [
+                FieldView(
+                    *row,
+                    self._compile_pattern(row.validation_pattern),
+                    render_prompt_line(row.display_name, row.description, row.extraction_hints)
+                )
+                for row in self.db.execute(stmt)
+            ])
         
+        return entry[1]
+    
+    def _compile_pattern(self, pattern: Optional[str]) -> Optional[re.Pattern]:
+        """Compile a field's validation pattern, or None if unset or invalid"""
+        if not pattern:
+            return None
+        try:
+            return re.compile(pattern)
+        except re.error as e:
+            logger.warning(f"Invalid validation pattern {pattern!r}: {str(e)}")
+            return None
+    
+    def initialize_default_fields(self):
+        """Initialize default field definitions that don't exist yet"""
         default_fields = [
             # Required fields
             {
@@ -244,12 +328,18 @@ class FieldDefinitionService:
             }
         ]
         
-        for field_data in default_fields:
-            field_def = FieldDefinition(**field_data)
-            self.db.add(field_def)
+        # One multi-row INSERT that skips names already present - idempotent and
+        # safe when several workers start up at once (rows need identical keys)
+        stmt = _dialect_insert(self.db)(FieldDefinition).values([
+            {"validation_pattern": None, **field_data} for field_data in default_fields
+        ]).on_conflict_do_nothing(index_elements=[FieldDefinition.name])
         
+        inserted = self.db.execute(stmt).rowcount
         self.db.commit()
-        logger.info(f"Initialized {len(default_fields)} default field definitions")
+        
+        if inserted:
+            _field_cache.clear()
+            logger.info(f"Initialized {inserted} default field definitions")
 
 
 class ReinforcementLearningService:
@@ -270,34 +360,53 @@ class ReinforcementLearningService:
         model_version: str,
         ocr_context: str = None
     ) -> HumanFeedback:
-        """Record human feedback for RL training"""
+        """Record human feedback for RL training - the feedback row and its
+        performance counters are written in one transaction"""
         
-        # Calculate reward score based on feedback type
-        reward_score = self._calculate_reward_score(
-            feedback_type, original_value, corrected_value, original_confidence
-        )
+        return self.record_human_feedback_batch([{
+            "document_id": document_id,
+            "field_name": field_name,
+            "original_value": original_value,
+            "corrected_value": corrected_value,
+            "original_confidence": original_confidence,
+            "feedback_type": feedback_type,
+            "reviewer_id": reviewer_id,
+            "model_version": model_version,
+            "ocr_context": ocr_context
+        }])[0]
+    
+    def record_human_feedback_batch(self, feedback_items: List[Dict[str, Any]]) -> List[HumanFeedback]:
+        """Record several human feedback entries (keyword arguments of
+        record_human_feedback) with one insert batch and one commit"""
         
-        feedback = HumanFeedback(
-            document_id=document_id,
-            field_name=field_name,
-            original_value=original_value,
-            corrected_value=corrected_value,
-            original_confidence=original_confidence,
-            feedback_type=feedback_type,
-            reviewer_id=reviewer_id,
-            model_version=model_version,
-            ocr_context=ocr_context,
-            reward_score=reward_score
-        )
+        feedback_rows = []
+        # (model_version, field_name) -> [total, correct, false_positives, false_negatives, reward_sum]
+        performance_deltas: Dict[Tuple[str, str], List[float]] = {}
         
-        self.db.add(feedback)
-        self.db.commit()
-        self.db.refresh(feedback)
+        for item in feedback_items:
+            feedback_type = item["feedback_type"]
+            reward_score = self._calculate_reward_score(
+                feedback_type, item.get("original_value"), item.get("corrected_value"), item["original_confidence"]
+            )
+            feedback_rows.append(HumanFeedback(**item, reward_score=reward_score))
+            
+            deltas = performance_deltas.setdefault((item["model_version"], item["field_name"]), [0, 0, 0, 0, 0.0])
+            correct, false_positives, false_negatives = self._feedback_counts(feedback_type)
+            deltas[0] += 1
+            deltas[1] += correct
+            deltas[2] += false_positives
+            deltas[3] += false_negatives
+            deltas[4] += reward_score
+        
+        # Flushed together as one multi-row INSERT, ids come back via RETURNING
+        self.db.add_all(feedback_rows)
         
-        # Update model performance metrics
-        self._update_model_performance(model_version, field_name, feedback_type, reward_score)
+        # One upsert per model/field instead of one per feedback entry
+        for (model_version, field_name), deltas in performance_deltas.items():
+            self.db.execute(self._performance_upsert(model_version, field_name, *deltas))
         
-        return feedback
+        self.db.commit()
+        return feedback_rows
     
     def _calculate_reward_score(
         self,
@@ -335,6 +444,10 @@ class ReinforcementLearningService:
         if not str1 or not str2:
             return 0.0
         
+        # Byte-identical values skip the normalization below
+        if str1 == str2:
+            return 1.0
+        
         # Simple character-based similarity
         str1_lower = str1.lower().strip()
         str2_lower = str2.lower().strip()
@@ -342,71 +455,63 @@ class ReinforcementLearningService:
         if str1_lower == str2_lower:
             return 1.0
         
-        # Calculate Jaccard similarity on character level
+        # Calculate Jaccard similarity on character level; the union size
+        # follows from inclusion-exclusion, so no union set is built
         set1 = set(str1_lower)
         set2 = set(str2_lower)
         intersection = len(set1.intersection(set2))
-        union = len(set1.union(set2))
+        union = len(set1) + len(set2) - intersection
         
         return intersection / union if union > 0 else 0.0
     
-    def _update_model_performance(
+    def _feedback_counts(self, feedback_type: str) -> Tuple[int, int, int]:
+        """Counter deltas (correct, false positives, false negatives) for one feedback"""
+        # "correction" - model found the field but with a wrong value - is not
+        # counted as a false positive
+        return (
+            1 if feedback_type == "confirmation" else 0,
+            1 if feedback_type == "removal" else 0,
+            1 if feedback_type == "addition" else 0
+        )
+    
+    def _performance_upsert(
         self,
         model_version: str,
         field_name: str,
-        feedback_type: str,
-        reward_score: float
+        total: int,
+        correct: int,
+        false_positives: int,
+        false_negatives: int,
+        reward_sum: float
     ):
-        """Update model performance metrics"""
-        
-        # Get or create performance record
-        performance = self.db.query(ModelPerformance).filter(
-            ModelPerformance.model_version == model_version,
-            ModelPerformance.field_name == field_name
-        ).first()
-        
-        if not performance:
-            performance = ModelPerformance(
-                model_version=model_version,
-                field_name=field_name
-            )
-            self.db.add(performance)
-        
-        # Update counters
-        performance.total_predictions += 1
-        
-        if feedback_type == "confirmation":
-            performance.correct_predictions += 1
-        elif feedback_type == "correction":
-            # Model found field but wrong value - not counted as false positive
-            pass
-        elif feedback_type == "addition":
-            performance.false_negatives += 1
-        elif feedback_type == "removal":
-            performance.false_positives += 1
-        
-        # Update average reward
-        current_total_reward = performance.avg_reward * (performance.total_predictions - 1)
-        performance.avg_reward = (current_total_reward + reward_score) / performance.total_predictions
-        
-        # Calculate precision, recall, F1
-        if performance.correct_predictions + performance.false_positives > 0:
-            performance.precision = performance.correct_predictions / (
-                performance.correct_predictions + performance.false_positives
-            )
+        """Build a single INSERT ... ON CONFLICT DO UPDATE that applies counter
+        deltas to a performance record"""
         
-        if performance.correct_predictions + performance.false_negatives > 0:
-            performance.recall = performance.correct_predictions / (
-                performance.correct_predictions + performance.false_negatives
-            )
+        stmt = _dialect_insert(self.db)(ModelPerformance).values(
+            model_version=model_version,
+            field_name=field_name,
+            total_predictions=total,
+            correct_predictions=correct,
+            false_positives=false_positives,
+            false_negatives=false_negatives,
+            avg_reward=reward_sum / total
+        )
         
-        if performance.precision + performance.recall > 0:
-            performance.f1_score = 2 * (performance.precision * performance.recall) / (
-                performance.precision + performance.recall
-            )
+        # Column references below are the existing row's values; precision,
+        # recall and F1 are derived from the counters on read
+        new_total = ModelPerformance.total_predictions + total
         
-        performance.last_updated = datetime.utcnow()
-        self.db.commit()
+        return stmt.on_conflict_do_update(
+            index_elements=[ModelPerformance.model_version, ModelPerformance.field_name],
+            set_={
+                "total_predictions": new_total,
+                "correct_predictions": ModelPerformance.correct_predictions + correct,
+                "false_positives": ModelPerformance.false_positives + false_positives,
+                "false_negatives": ModelPerformance.false_negatives + false_negatives,
+                "avg_reward": (ModelPerformance.avg_reward * ModelPerformance.total_predictions + reward_sum) / new_total,
+                "last_updated": func.now()
+            }
+        )
     
     def get_model_performance(self, model_version: str = None) -> List[ModelPerformance]:
         """Get model performance metrics"""
@@ -419,32 +524,49 @@ class ReinforcementLearningService:
         self,
         model_version: str = None,
         field_name: str = None,
-        limit: int = 1000
+        limit: int = 1000,
+        cursor: Optional[Tuple[datetime, int]] = None
     ) -> List[HumanFeedback]:
-        """Get human feedback data for RL training"""
-        query = self.db.query(HumanFeedback)
+        """Get human feedback data for RL training, newest first. Pass the
+        (review_timestamp, id) of the last row received as cursor for the next
+        page - timestamps alone repeat, since a review's rows share one transaction"""
+        # Batch-load the source documents in one IN query rather than lazily per
+        # row (the documents' own relationships still load lazily)
+        query = self.db.query(HumanFeedback).options(
+            selectinload(HumanFeedback.document).lazyload("*")
+        )
         
         if model_version:
             query = query.filter(HumanFeedback.model_version == model_version)
         if field_name:
             query = query.filter(HumanFeedback.field_name == field_name)
+        if cursor:
+            # Keyset pagination - an index range scan rather than an OFFSET
+            cursor_timestamp, cursor_id = cursor
+            query = query.filter(
+                tuple_(HumanFeedback.review_timestamp, HumanFeedback.id) < tuple_(cursor_timestamp, cursor_id)
+            )
         
-        return query.order_by(HumanFeedback.review_timestamp.desc()).limit(limit).all()
+        return query.order_by(HumanFeedback.review_timestamp.desc(), HumanFeedback.id.desc()).limit(limit).all()
     
     def get_performance_summary(self) -> Dict[str, Any]:
         """Get overall performance summary"""
-        total_feedback = self.db.query(HumanFeedback).count()
-        avg_reward = self.db.query(HumanFeedback).with_entities(
-            self.db.func.avg(HumanFeedback.reward_score)
-        ).scalar() or 0.0
-        
-        feedback_types = self.db.query(
+        # One grouped scan; the overall count and average are folded from the
+        # per-type rows (AVG ignores NULL rewards, so carry sum and count)
+        feedback_types = self.db.execute(select(
             HumanFeedback.feedback_type,
-            self.db.func.count(HumanFeedback.id)
-        ).group_by(HumanFeedback.feedback_type).all()
+            func.count(HumanFeedback.id),
+            func.sum(HumanFeedback.reward_score),
+            func.count(HumanFeedback.reward_score)
+        ).group_by(HumanFeedback.feedback_type)).all()
+        
+        total_feedback = sum(count for _, count, _, _ in feedback_types)
+        reward_sum = sum(total or 0.0 for _, _, total, _ in feedback_types)
+        reward_count = sum(rewarded for _, _, _, rewarded in feedback_types)
+        avg_reward = reward_sum / reward_count if reward_count else 0.0
         
         return {
             "total_feedback_records": total_feedback,
             "average_reward": float(avg_reward),
-            "feedback_distribution": {ft: count for ft, count in feedback_types}
-        }
\ No newline at end of file
+            "feedback_distribution": {ft: count for ft, count, _, _ in feedback_types}
+        }
@@ -0,0 +1,143 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Cached OCR text and LLM extractions are PHI - only the service user may read them
+_DIR_MODE = 0o700
+_FILE_MODE = 0o600
+
+# A write older than this that never got renamed into place was abandoned
+_STALE_TMP_AGE = 3600
+
+# Pruners by directory, shared by every service instance in the process so
+# the prune interval holds across per-request instances
+_pruners: Dict[str, "DirectoryPruner"] = {}
+_pruners_lock = threading.Lock()
+
+
+def make_private_dir(path: str):
+    """Create a cache directory (or shard) readable by the service user only"""
+    os.makedirs(path, mode=_DIR_MODE, exist_ok=True)
+    # makedirs leaves an existing directory's mode alone, and the mode is
+    # masked by the umask
+    if os.stat(path).st_mode & 0o777 != _DIR_MODE:
+        os.chmod(path, _DIR_MODE)
+
+
+def write_file_atomic(path: str, data: bytes):
+    """
+    Write then rename so concurrent workers never read a partial file. The
+    temporary file is removed if the write fails.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, _FILE_MODE)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def is_expired(path: str, max_age: float) -> bool:
+    """Whether a cache file was written more than max_age seconds ago; removes it if so"""
+    if max_age <= 0:
+        return False
+    try:
+        if time.time() - os.stat(path).st_mtime <= max_age:
+            return False
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    return True
+
+
+class DirectoryPruner:
+    """
+    Bounds a directory of cache files. Files written more than max_age seconds
+    ago are deleted, then the oldest files until the rest fit in max_bytes.
+    Age is the write time, not the last read, so nothing is kept longer than
+    max_age however often it is hit. 0 disables either limit.
+    
+    maybe_prune() is cheap to call after every write - the directory is walked
+    at most once per interval, in a background thread.
+    """
+    
+    def __init__(self, path: str, max_age: float, max_bytes: int, interval: float = 600):
+        self.path = path
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.last_pruned = None
+        self.lock = threading.Lock()
+    
+    def maybe_prune(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.last_pruned is not None and now - self.last_pruned < self.interval:
+                return
+            self.last_pruned = now
+        threading.Thread(target=self.prune, name="cache-prune", daemon=True).start()
+    
+    def prune(self) -> int:
+        """Delete expired and excess files, returning how many were deleted"""
+        now = time.time()
+        removed = 0
+        kept: List[Tuple[float, int, str]] = []
+        
+        for directory, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                age = now - stat.st_mtime
+                if filename.endswith(".tmp"):
+                    expired = age > _STALE_TMP_AGE
+                else:
+                    expired = self.max_age > 0 and age > self.max_age
+                if expired:
+                    removed += self._unlink(path)
+                elif not filename.endswith(".tmp"):
+                    kept.append((stat.st_mtime, stat.st_size, path))
+        
+        if self.max_bytes > 0:
+            total = sum(size for _, size, _ in kept)
+            # Oldest first
+            for _, size, path in sorted(kept):
+                if total <= self.max_bytes:
+                    break
+                removed += self._unlink(path)
+                total -= size
+        
+        if removed:
+            logger.info(f"Pruned {removed} files from cache directory {self.path}")
+        return removed
+    
+    def _unlink(self, path: str) -> int:
+        try:
+            os.unlink(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+        except OSError as e:
+            logger.warning(f"Failed to prune cache file {path}: {str(e)}")
+            return 0
+
+
+def shared_pruner(path: str, max_age: float, max_bytes: int) -> DirectoryPruner:
+    """The process-wide pruner for a cache directory"""
+    with _pruners_lock:
+        pruner = _pruners.get(path)
+        if pruner is None:
+            pruner = _pruners[path] = DirectoryPruner(path, max_age, max_bytes)
+        return pruner
@@ -1,35 +1,329 @@
 import os
-import json
+import re
+import hashlib
+import orjson
+import asyncio
 import logging
-from typing import Dict, Any, List, Optional
-from anthropic import Anthropic
-import openai
+import sqlite3
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property, lru_cache
+import httpx
+from typing import Dict, Any, List, Optional, Tuple, Callable, AsyncIterator
 from dotenv import load_dotenv
 from sqlalchemy.orm import Session
-from .field_service import FieldDefinitionService
+from .field_service import FieldDefinitionService, render_prompt_line
 from .azure_openai_service import AzureOpenAIService
+from .template_cache import TemplateCache
+from .file_cache import DirectoryPruner, make_private_dir, write_file_atomic
+
+# Optional client-side rate limiting - without it concurrent extraction relies
+# on the SDKs' 429 retry/backoff
+try:
+    from aiolimiter import AsyncLimiter
+    AIOLIMITER_AVAILABLE = True
+except ImportError:
+    AIOLIMITER_AVAILABLE = False
+    AsyncLimiter = None
+
+# HTTP/2 needs the h2 package (httpx[http2]); fall back to HTTP/1.1 keep-alive
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Optional response cache - extraction works without Redis, just uncached
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+    redis = None
+
+# Optional linear-time (DFA) matching for the field-keyword scan - a large
+# alternation in the stdlib engine is tried keyword by keyword at each position
+try:
+    import re2
+    RE2_AVAILABLE = True
+except ImportError:
+    RE2_AVAILABLE = False
+    re2 = None
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Rate limiters are shared per process - LLMService is created per request, and
+# a bucket per instance would not limit anything. aiolimiter buckets belong to
+# one event loop, so they are rebuilt when a new loop (asyncio.run) comes along.
+_rate_limiters: Dict[str, Tuple[Optional[asyncio.AbstractEventLoop], Optional[Tuple[Any, Any]]]] = {}
+
+# Static parts of the extraction prompt - kept short since every prompt token
+# is billed and adds prefill latency
+_PROMPT_INTRO = (
+    "You read insurance authorization and denial documents in a medical workflow. "
+    "From the OCR text of a multi-page faxed PDF below, extract the listed fields "
+    "and output one JSON object containing only the fields found."
+)
+_PROMPT_RULES = """Rules:
+- Use the field names exactly as listed; omit fields that are not present
+- Output only the JSON object, no explanation
+- Dates as MM/DD/YYYY, phone numbers as (XXX) XXX-XXXX, emails in valid format
+- Field labels vary - use synonyms, context and position in the document"""
+
+# Abbreviations that signal a relevant document but aren't field names
+_PREFILTER_SYNONYMS = ("dob", "mrn", "member", "denial", "authorization", "patient")
+
+# Compiled keyword-union pattern and keyword -> field display names, by field set
+_field_keyword_indexes: Dict[Tuple, Tuple[Any, Dict[str, Tuple[str, ...]]]] = {}
+
+# Static prompt prefix by field set - field definitions rarely change, so
+# the field list is rendered once rather than per document
+_prompt_prefixes: Dict[Tuple, str] = {}
+_PROMPT_PREFIX_CACHE_SIZE = 64
+
+# LLM response cache backend (Redis or a local directory), opened on first use
+_response_cache = None
+
+# Extraction recipes for recurring document templates, opened on first use
+_template_cache = None
+
+# Format checks for confidence scoring, compiled once instead of per value
+_DATE_PATTERNS = (
+    re.compile(r'\d{1,2}/\d{1,2}/\d{4}'),
+    re.compile(r'\d{1,2}-\d{1,2}-\d{4}'),
+    re.compile(r'\d{4}-\d{1,2}-\d{1,2}')
+)
+_EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+_PHONE_PATTERNS = (
+    re.compile(r'^\(\d{3}\) \d{3}-\d{4}$'),
+    re.compile(r'^\d{3}-\d{3}-\d{4}$'),
+    re.compile(r'^\d{10}$')
+)
+
+# Internal names the fallback confidence rules treat as identifiers
+_ID_FIELDS = frozenset({"member_id", "reference_number"})
+
+
+@lru_cache(maxsize=256)
+def _compile_validation_pattern(pattern: str) -> re.Pattern:
+    """Compiled form of an ad-hoc validation pattern"""
+    return re.compile(pattern)
+
+
+@lru_cache(maxsize=256)
+def _fallback_field_kind(field: str) -> Tuple[bool, bool, bool]:
+    """(is_date, is_id, is_name) for a field without a definition - field names repeat across documents"""
+    lowered = field.lower()
+    return "date" in lowered, field in _ID_FIELDS, "name" in lowered
+
+
+# Connection pools are shared by every LLMService in the process so TCP/TLS
+# sessions to the providers are reused across requests. Async connections
+# belong to the event loop that opened them, hence one async pool per loop.
+_http_client: Optional[httpx.Client] = None
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def _http_client_settings() -> Dict[str, Any]:
+    return {
+        "limits": httpx.Limits(max_connections=100, max_keepalive_connections=50),
+        "http2": HTTP2_AVAILABLE,
+        "timeout": 60.0
+    }
+
+
+def _get_http_client() -> httpx.Client:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.Client(**_http_client_settings())
+    return _http_client
+
+
+def _get_async_http_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _async_http_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(**_http_client_settings())
+        _async_http_clients[loop] = client
+    return client
+
+class _DirectoryCache:
+    """
+    Response cache in a local directory, one JSON file per key - for single
+    host deployments without Redis. Offers the get/setex subset of the Redis
+    client that the response cache uses.
+    
+    Entries are full extractions (PHI), so the directory is private to the
+    service user, expired entries are deleted when read, and a periodic prune
+    deletes the rest of the expired entries and the oldest ones beyond max_bytes.
+    """
+    
+    def __init__(self, path: str, max_age: float, max_bytes: int):
+        self.path = path
+        make_private_dir(path)
+        self.pruner = DirectoryPruner(path, max_age, max_bytes)
+        self.pruner.maybe_prune()
+    
+    def _file(self, key: str) -> str:
+        digest = key.rsplit(":", 1)[-1]
+        return os.path.join(self.path, digest[:2], f"{digest}.json")
+    
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._file(key)
+        try:
+            with open(path, "rb") as f:
+                entry = orjson.loads(f.read())
+        except FileNotFoundError:
+            return None
+        if time.time() > entry["expires_at"]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            return None
+        return entry["result"].encode("utf-8")
+    
+    def setex(self, key: str, ttl: int, value: bytes):
+        path = self._file(key)
+        make_private_dir(os.path.dirname(path))
+        entry = {
+            "result": value.decode("utf-8"),
+            "timestamp": time.time(),
+            "expires_at": time.time() + ttl
+        }
+        write_file_atomic(path, orjson.dumps(entry))
+        self.pruner.maybe_prune()
+
+
+# Errors that mean a cache is unavailable, not that extraction failed
+_CACHE_ERRORS = (OSError, ValueError, KeyError, sqlite3.Error) + ((redis.RedisError,) if REDIS_AVAILABLE else ())
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit breaker is open"""
+
+
+class _CircuitBreaker:
+    """
+    Per-provider circuit breaker - after fail_max consecutive failures the
+    provider is skipped for reset_timeout seconds, then a single trial call
+    is let through to decide whether to close the circuit again
+    """
+    
+    def __init__(self, fail_max: int, reset_timeout: float):
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Half-open: this caller is the trial, everyone else waits another period
+                self.opened_at = time.monotonic()
+                return True
+            return False
+    
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+    
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.fail_max:
+                self.opened_at = time.monotonic()
+
+
+# Breaker state is per process, shared by every LLMService instance
+_circuit_breakers: Dict[str, _CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+class _StreamingObjectParser:
+    """
+    Incremental parser for a streamed JSON object - returns each top-level
+    key/value pair as soon as the text closing it arrives, instead of waiting
+    for the whole response
+    """
+    
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.pair_start = None
+        self.complete = False  # The top-level object has closed
+    
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """Consume a chunk of the response, returning the pairs it completed"""
+        self.buffer += text
+        completed = []
+        
+        for i in range(self.position, len(self.buffer)):
+            char = self.buffer[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = self.depth > 0
+            elif char in '{[':
+                self.depth += 1
+                if self.depth == 1:
+                    self.pair_start = i + 1
+            elif char in '}]' and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    completed.extend(self._parse_pair(self.buffer[self.pair_start:i]))
+                    self.complete = True
+            elif char == ',' and self.depth == 1:
+                completed.extend(self._parse_pair(self.buffer[self.pair_start:i]))
+                self.pair_start = i + 1
+        
+        self.position = len(self.buffer)
+        return completed
+    
+    def _parse_pair(self, pair: str) -> List[Tuple[str, Any]]:
+        if not pair.strip():
+            return []
+        try:
+            return list(orjson.loads("{" + pair + "}").items())
+        except orjson.JSONDecodeError:
+            return []
+
+
 class LLMService:
+    # Bump when prompt wording or response handling changes so cached
+    # responses from the old prompt are not reused
+    PROMPT_VERSION = "v2"
+    
+    # OpenAI models that predate response_format JSON mode
+    JSON_MODE_UNSUPPORTED_MODELS = frozenset({"gpt-4", "gpt-4-0613", "gpt-4-0314"})
+    
     def __init__(self, db: Session = None):
-        self.anthropic_client = None
-        self.openai_client = None
+        self.async_anthropic_client = None
+        self.async_openai_client = None
         self.azure_openai_service = None
         self.db = db
         self.field_service = FieldDefinitionService(db) if db else None
         
-        # Initialize clients based on available API keys
-        anthropic_key = os.getenv("ANTHROPIC_API_KEY")
-        openai_key = os.getenv("OPENAI_API_KEY")
-        
-        if anthropic_key:
-            self.anthropic_client = Anthropic(api_key=anthropic_key)
-        
-        if openai_key:
-            self.openai_client = openai.OpenAI(api_key=openai_key)
+        # Provider clients are created on first use from these keys
+        self._anthropic_key = os.getenv("ANTHROPIC_API_KEY")
+        self._openai_key = os.getenv("OPENAI_API_KEY")
+        self._async_clients_loop = None  # Event loop the async clients were built for
         
         # Initialize Azure OpenAI service
         self.azure_openai_service = AzureOpenAIService()
@@ -39,220 +333,1320 @@ class LLMService:
         
         # Model version for RL tracking
         self.model_version = f"{self.default_provider}_{self.default_model}_v1.0"
+        
+        self.batch_concurrency = int(os.getenv("LLM_BATCH_CONCURRENCY", "8"))  # In-flight requests per extract_fields_batch
+        
+        # SDK retry/timeout policy - extraction responses are short JSON, so fail
+        # fast and let the circuit breaker route around a struggling provider
+        # instead of sitting through the SDK's default backoff
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", "1"))
+        self.request_timeout = float(os.getenv("LLM_REQUEST_TIMEOUT", "30.0"))
+        self.stream_timeout = httpx.Timeout(connect=5.0, read=60.0, write=5.0, pool=5.0)  # read is per chunk
+        # Stream extraction responses and hang up once the JSON object closes,
+        # rather than waiting for the complete body (and any trailing prose)
+        self.stream_responses = os.getenv("LLM_STREAM_RESPONSES", "0") == "1"
+        
+        # Per-minute request/token budgets for the async extraction path, set
+        # to ~80% of the account tier so requests are admitted at the rate the
+        # provider actually serves them instead of being retried after 429s
+        self.max_tokens = 2000  # Completion budget per extraction request
+        self._rate_limits = {
+            "anthropic": (int(os.getenv("ANTHROPIC_RPM", "40")), int(os.getenv("ANTHROPIC_TPM", "16000"))),
+            "openai": (int(os.getenv("OPENAI_RPM", "400")), int(os.getenv("OPENAI_TPM", "24000")))
+        }
+        
+        self.reload_config()
+        
+        self.cache_ttl = int(os.getenv("LLM_CACHE_TTL", "86400"))  # Seconds; 0 disables the response cache
+        self.cache_max_bytes = int(os.getenv("LLM_EXTRACTION_CACHE_MAX_BYTES", str(1024 ** 3)))  # Oldest LLM_EXTRACTION_CACHE_DIR entries deleted beyond this
+        self.template_max_distance = int(os.getenv("LLM_TEMPLATE_MAX_DISTANCE", "3"))  # Fingerprint bits two documents of one template may differ by
+        self.template_max_entries = int(os.getenv("LLM_TEMPLATE_MAX_ENTRIES", "1000"))  # Recipes kept, least recently used dropped first
+        self.template_max_age = float(os.getenv("LLM_TEMPLATE_MAX_AGE", str(30 * 86400)))  # Seconds an unused recipe is kept
+        
+        # Map-reduce extraction for OCR text longer than the threshold (0 disables)
+        self.chunk_threshold_chars = int(os.getenv("LLM_CHUNK_THRESHOLD_CHARS", "0"))
+        self.chunk_max_tokens = int(os.getenv("LLM_CHUNK_MAX_TOKENS", "3000"))
+        self.chunk_overlap_tokens = int(os.getenv("LLM_CHUNK_OVERLAP_TOKENS", "200"))
+        self.chunk_max_workers = int(os.getenv("LLM_CHUNK_MAX_WORKERS", "4"))
+        
+        # Extract each OCR'd page as it arrives (extract_fields_from_pages) rather
+        # than the whole document once OCR is done - overlaps OCR with LLM waits
+        self.page_pipeline = os.getenv("LLM_PAGE_PIPELINE", "0") == "1"
+        
+        self.json_retries = int(os.getenv("LLM_JSON_RETRIES", "1"))  # Re-asks, with the parse error, when a response isn't valid JSON
+        
+        # Consecutive provider failures before its circuit opens, and seconds it stays open
+        self.breaker_fail_max = int(os.getenv("LLM_BREAKER_FAIL_MAX", "5"))
+        self.breaker_reset_timeout = float(os.getenv("LLM_BREAKER_RESET_TIMEOUT", "30"))
+        
+        # Race Anthropic and OpenAI on async extraction that doesn't pin a provider
+        self.race_providers = os.getenv("LLM_RACE_PROVIDERS", "0") == "1"
+        # (also the models used when falling back from a provider whose circuit is open)
+        self.race_models = {
+            "anthropic": os.getenv("RACE_ANTHROPIC_MODEL", "claude-3-sonnet-20240229"),
+            "openai": os.getenv("RACE_OPENAI_MODEL", "gpt-4-turbo-preview")
+        }
+        
+        # Skip the LLM for OCR text that can't contain the fields (blank/noise pages)
+        self.min_ocr_chars = int(os.getenv("MIN_OCR_CHARS", "50"))  # Shorter (stripped) OCR text never reaches the LLM
+        self.min_ocr_confidence = float(os.getenv("MIN_OCR_CONFIDENCE", "0"))  # OCR confidence floor (0-1); 0 disables
+        self.prefilter_enabled = os.getenv("LLM_PREFILTER_ENABLED", "0") == "1"
+        self.prefilter_min_chars = int(os.getenv("LLM_PREFILTER_MIN_CHARS", "200"))
+        self.prefilter_min_keywords = int(os.getenv("LLM_PREFILTER_MIN_KEYWORDS", "3"))  # Distinct field keywords required
+        self.prompt_field_hints = os.getenv("LLM_PROMPT_FIELD_HINTS", "0") == "1"  # Name the fields whose labels were found in the prompt
+    
+    def reload_config(self):
+        """Re-read the review thresholds from the environment"""
+        self.min_confidence_threshold = float(os.getenv("MIN_CONFIDENCE_THRESHOLD", "0.7"))
+        self.required_fields_threshold = float(os.getenv("REQUIRED_FIELDS_THRESHOLD", "0.8"))
     
-    def extract_fields(self, ocr_text: str, provider: str = None, model: str = None) -> Dict[str, Any]:
+    # The provider SDKs are large; they are only imported once a client is
+    # actually needed, so processes that never call an LLM don't pay for them
+    @cached_property
+    def anthropic_client(self):
+        if not self._anthropic_key:
+            return None
+        from anthropic import Anthropic
+        return Anthropic(
+            api_key=self._anthropic_key,
+            http_client=_get_http_client(),
+            max_retries=self.max_retries,
+            timeout=self.request_timeout
+        )
+    
+    @cached_property
+    def openai_client(self):
+        if not self._openai_key:
+            return None
+        from openai import OpenAI
+        return OpenAI(
+            api_key=self._openai_key,
+            http_client=_get_http_client(),
+            max_retries=self.max_retries,
+            timeout=self.request_timeout
+        )
+    
+    def extract_fields(self, ocr_text: str, provider: str = None, model: str = None,
+                       ocr_confidence: float = None) -> Dict[str, Any]:
         """
         Extract fields from OCR text using LLM with configurable field definitions
         
         Args:
             ocr_text: Text extracted from OCR
             provider: LLM provider to use (anthropic, openai, azure_openai)
-            model: Specific model to use
+            model: Specific model to use. Naming a provider or model skips the
+                template recipe lookup
+            ocr_confidence: OCR engine confidence (0-1) for the text, if known
             
         Returns:
-            Dictionary containing extracted fields and metadata
+            Dictionary containing extracted fields and metadata. Text longer than
+            LLM_CHUNK_THRESHOLD_CHARS is extracted in chunks, and the merged
+            result additionally has the optional 'merged_from' key
+            ({'unit': 'chunk', 'count': n})
         """
+        # A caller that names a provider or model wants that model's answer,
+        # not a stored template recipe
+        use_templates = provider is None and model is None
         provider = provider or self.default_provider
         model = model or self.default_model
         
         try:
-            # Get field definitions from database
-            if self.field_service:
-                required_fields = self.field_service.get_required_fields()
-                optional_fields = self.field_service.get_optional_fields()
-                all_field_definitions = required_fields + optional_fields
-            else:
-                # Fallback to hardcoded fields if no database connection
-                required_fields = self._get_fallback_required_fields()
-                optional_fields = self._get_fallback_optional_fields()
-                all_field_definitions = self._convert_to_field_definitions(required_fields, optional_fields)
+            required_fields, optional_fields, all_field_definitions = self._get_extraction_fields()
+            
+            if self._is_insufficient_text(ocr_text, required_fields, optional_fields, ocr_confidence):
+                return self._build_insufficient_text_result(provider, model)
+            
+            # Documents from a known template are extracted with its stored recipe
+            if use_templates:
+                template_extraction = self._extract_with_template(ocr_text, required_fields, optional_fields)
+                if template_extraction is not None:
+                    return template_extraction
             
             # Use Azure OpenAI service if specified
             if provider == "azure_openai" and self.azure_openai_service.is_configured():
                 return self.azure_openai_service.extract_fields(ocr_text, all_field_definitions, model)
             
-            # Create extraction prompt with configurable fields
+            # Long faxes are extracted chunk by chunk and merged
+            if self.chunk_threshold_chars and len(ocr_text) > self.chunk_threshold_chars:
+                return self._extract_chunked(ocr_text, provider, model, required_fields, optional_fields)
+            
+            extraction = self._extract_text(ocr_text, provider, model, required_fields, optional_fields)
+            self._learn_template(ocr_text, extraction, required_fields, optional_fields)
+            return extraction
+            
+        except Exception as e:
+            logger.error(f"Field extraction failed: {str(e)}")
+            return self._build_extraction_error(e, provider, model)
+    
+    def _extract_text(self, ocr_text: str, provider: str, model: str, required_fields: List, optional_fields: List) -> Dict[str, Any]:
+        """Single-prompt extraction through the Anthropic/OpenAI clients"""
+        # Create extraction prompt with configurable fields
+        prompt = self._create_extraction_prompt(ocr_text, required_fields, optional_fields)
+        
+        # Identical prompts (re-faxes, duplicate pages, retries) reuse the cached response
+        cache_key = self._response_cache_key(provider, model, prompt)
+        result = self._get_cached_response(cache_key)
+        if result is not None:
+            return self._build_extraction_result(result, required_fields, optional_fields, provider, model)
+        
+        # Extract using specified provider, or the other one if its circuit is open
+        provider, model, result = self._call_provider(prompt, provider, model)
+        
+        extraction = self._build_extraction_result(result, required_fields, optional_fields, provider, model)
+        if extraction['extracted_fields']:
+            self._cache_response(self._response_cache_key(provider, model, prompt), result)
+        return extraction
+    
+    def _extract_chunked(self, ocr_text: str, provider: str, model: str, required_fields: List, optional_fields: List) -> Dict[str, Any]:
+        """Map-reduce extraction - overlapping chunks are extracted concurrently, then merged"""
+        chunks = self._chunk_text(ocr_text, self.chunk_max_tokens, self.chunk_overlap_tokens)
+        logger.info(f"Extracting {len(ocr_text)} characters of OCR text in {len(chunks)} chunks")
+        
+        def extract_chunk(chunk):
+            try:
+                return self._extract_text(chunk, provider, model, required_fields, optional_fields)
+            except Exception as e:
+                return e
+        
+        with ThreadPoolExecutor(max_workers=min(len(chunks), self.chunk_max_workers)) as executor:
+            results = list(executor.map(extract_chunk, chunks))
+        
+        extractions = [result for result in results if not isinstance(result, Exception)]
+        if not extractions:
+            raise results[0]
+        return self._merge_extractions(extractions, required_fields, provider, model)
+    
+    def _chunk_text(self, ocr_text: str, max_tokens: int = 3000, overlap: int = 200) -> List[str]:
+        """
+        Split text into overlapping chunks of about max_tokens tokens (~4
+        characters per token), breaking at a line or word boundary when possible
+        """
+        max_chars = max_tokens * 4
+        overlap_chars = overlap * 4
+        if len(ocr_text) <= max_chars:
+            return [ocr_text]
+        
+        chunks = []
+        start = 0
+        while start < len(ocr_text):
+            end = min(start + max_chars, len(ocr_text))
+            if end < len(ocr_text):
+                # Prefer a line break, then a space, in the last quarter of the window
+                boundary = ocr_text.rfind("\n", start + max_chars * 3 // 4, end)
+                if boundary == -1:
+                    boundary = ocr_text.rfind(" ", start + max_chars * 3 // 4, end)
+                if boundary != -1:
+                    end = boundary + 1
+            chunks.append(ocr_text[start:end])
+            if end >= len(ocr_text):
+                break
+            start = max(end - overlap_chars, start + 1)
+        return chunks
+    
+    def _merge_extractions(self, extractions: List[Dict[str, Any]], required_fields: List, provider: str, model: str,
+                           unit: str = "chunk") -> Dict[str, Any]:
+        """
+        Merge chunk (or page) extractions - each field takes the value with the
+        highest confidence, non-empty over empty, earlier chunk on ties
+        
+        The result has the extract_fields keys; raw_response stays a string, the
+        parts' responses joined with a break line. The optional 'merged_from'
+        key, present only on merged results, is {'unit': 'chunk' or 'page',
+        'count': number of parts merged}.
+        """
+        merged = {}
+        best_confidence = {}
+        for extraction in extractions:
+            confidence_scores = extraction['confidence_scores']
+            for field, value in extraction['extracted_fields'].items():
+                confidence = confidence_scores.get(field, 0.0) if value else -1.0
+                if field not in best_confidence or confidence > best_confidence[field]:
+                    merged[field] = value
+                    best_confidence[field] = confidence
+        
+        required_field_names = self._required_field_names(required_fields)
+        confidence_scores = self._calculate_confidence_scores(merged, required_field_names)
+        return {
+            'extracted_fields': merged,
+            'confidence_scores': confidence_scores,
+            'overall_confidence': confidence_scores.get('overall', 0.0),
+            'requires_review': self._requires_review(merged, confidence_scores, required_field_names),
+            'provider': provider,
+            'model': model,
+            'model_version': self.model_version,
+            'raw_response': f"\n\n--- {unit.upper()} BREAK ---\n\n".join(
+                extraction.get('raw_response') or '' for extraction in extractions
+            ),
+            'merged_from': {'unit': unit, 'count': len(extractions)}
+        }
+    
+    def extract_fields_streaming(self, ocr_text: str, provider: str = None, model: str = None,
+                                 on_field: Optional[Callable[[str, Any], None]] = None) -> Dict[str, Any]:
+        """
+        Streaming variant of extract_fields
+        
+        The response is parsed while it is being generated, and on_field is
+        called with each (key, value) pair, as named by the model, as soon as
+        it is complete. The return value is the same as extract_fields.
+        """
+        provider = provider or self.default_provider
+        model = model or self.default_model
+        
+        try:
+            required_fields, optional_fields, _ = self._get_extraction_fields()
+            
+            if self._is_insufficient_text(ocr_text, required_fields, optional_fields):
+                return self._build_insufficient_text_result(provider, model)
+            
             prompt = self._create_extraction_prompt(ocr_text, required_fields, optional_fields)
+            parser = _StreamingObjectParser()
+            
+            def emit(pairs):
+                if on_field:
+                    for key, value in pairs:
+                        on_field(key, value)
+            
+            cache_key = self._response_cache_key(provider, model, prompt)
+            result = self._get_cached_response(cache_key)
+            if result is not None:
+                emit(parser.feed(result))
+                return self._build_extraction_result(result, required_fields, optional_fields, provider, model)
             
-            # Extract using specified provider
             if provider == "anthropic" and self.anthropic_client:
-                result = self._extract_with_anthropic(prompt, model)
+                chunks = self._extract_with_anthropic_stream(prompt, model)
             elif provider == "openai" and self.openai_client:
-                result = self._extract_with_openai(prompt, model)
+                chunks = self._extract_with_openai_stream(prompt, model)
             else:
                 raise ValueError(f"Provider {provider} not available or not configured")
             
-            # Parse and validate results
-            extracted_data = self._parse_extraction_result(result, required_fields + optional_fields)
+            parts = []
+            for chunk in chunks:
+                parts.append(chunk)
+                emit(parser.feed(chunk))
+            result = "".join(parts)
             
-            # Calculate confidence scores
-            confidence_scores = self._calculate_confidence_scores(extracted_data, required_fields)
+            extraction = self._build_extraction_result(result, required_fields, optional_fields, provider, model)
+            if extraction['extracted_fields']:
+                self._cache_response(cache_key, result)
+            return extraction
             
-            return {
-                'extracted_fields': extracted_data,
-                'confidence_scores': confidence_scores,
-                'overall_confidence': confidence_scores.get('overall', 0.0),
-                'requires_review': self._requires_review(extracted_data, confidence_scores, required_fields),
-                'provider': provider,
-                'model': model,
-                'model_version': self.model_version,
-                'raw_response': result
+        except Exception as e:
+            logger.error(f"Field extraction failed: {str(e)}")
+            return self._build_extraction_error(e, provider, model)
+    
+    async def extract_fields_async(self, ocr_text: str, provider: str = None, model: str = None,
+                                   ocr_confidence: float = None, fields: Tuple[List, List, List] = None) -> Dict[str, Any]:
+        """
+        Async variant of extract_fields - the provider call is awaited instead
+        of blocking, so many documents can be in flight at once. Field reads,
+        response cache and template store calls block, so they run in worker
+        threads rather than on the event loop.
+        
+        fields: _get_extraction_fields() result, when the caller loaded it
+        once for several documents (the session is not shared across threads)
+        """
+        if self.race_providers and provider is None and model is None:
+            return await self.extract_fields_race(ocr_text, fields)
+        
+        use_templates = provider is None and model is None
+        provider = provider or self.default_provider
+        model = model or self.default_model
+        
+        try:
+            self._ensure_async_clients()
+            required_fields, optional_fields, all_field_definitions = fields or await asyncio.to_thread(self._get_extraction_fields)
+            
+            if self._is_insufficient_text(ocr_text, required_fields, optional_fields, ocr_confidence):
+                return self._build_insufficient_text_result(provider, model)
+            
+            if use_templates:
+                template_extraction = await asyncio.to_thread(self._extract_with_template, ocr_text, required_fields, optional_fields)
+                if template_extraction is not None:
+                    return template_extraction
+            
+            # Azure OpenAI service is synchronous - keep it off the event loop
+            if provider == "azure_openai" and self.azure_openai_service.is_configured():
+                return await asyncio.to_thread(
+                    self.azure_openai_service.extract_fields, ocr_text, all_field_definitions, model
+                )
+            
+            prompt = self._create_extraction_prompt(ocr_text, required_fields, optional_fields)
+            
+            cache_key = self._response_cache_key(provider, model, prompt)
+            result = await asyncio.to_thread(self._get_cached_response, cache_key)
+            if result is not None:
+                return self._build_extraction_result(result, required_fields, optional_fields, provider, model)
+            
+            provider, model, result = await self._call_provider_async(prompt, provider, model)
+            
+            extraction = self._build_extraction_result(result, required_fields, optional_fields, provider, model)
+            if extraction['extracted_fields']:
+                await asyncio.to_thread(self._cache_response, self._response_cache_key(provider, model, prompt), result)
+            await asyncio.to_thread(self._learn_template, ocr_text, extraction, required_fields, optional_fields)
+            return extraction
+            
+        except Exception as e:
+            logger.error(f"Field extraction failed: {str(e)}")
+            return self._build_extraction_error(e, provider, model)
+    
+    async def extract_fields_race(self, ocr_text: str, fields: Tuple[List, List, List] = None) -> Dict[str, Any]:
+        """
+        Send the same prompt to Anthropic and OpenAI at once and keep the first
+        response that yields fields, cancelling the other - provider latency
+        has a long tail, and racing cuts it off at the faster provider
+        """
+        try:
+            self._ensure_async_clients()
+            required_fields, optional_fields, _ = fields or await asyncio.to_thread(self._get_extraction_fields)
+            
+            if self._is_insufficient_text(ocr_text, required_fields, optional_fields):
+                return self._build_insufficient_text_result(self.default_provider, self.default_model)
+            
+            prompt = self._create_extraction_prompt(ocr_text, required_fields, optional_fields)
+            
+            contenders = {}
+            for provider, client, extract in (
+                ("anthropic", self.async_anthropic_client, self._extract_with_anthropic_async),
+                ("openai", self.async_openai_client, self._extract_with_openai_async),
+            ):
+                if not client:
+                    continue
+                model = self.race_models[provider]
+                cache_key = self._response_cache_key(provider, model, prompt)
+                result = await asyncio.to_thread(self._get_cached_response, cache_key)
+                if result is not None:
+                    return self._build_extraction_result(result, required_fields, optional_fields, provider, model)
+                contenders[provider] = (model, cache_key, extract)
+            
+            if not contenders:
+                raise ValueError("No provider available for racing")
+            
+            tasks = {
+                asyncio.create_task(extract(prompt, model)): (provider, model, cache_key)
+                for provider, (model, cache_key, extract) in contenders.items()
             }
+            pending = set(tasks)
+            last_result = None
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        provider, model, cache_key = tasks[task]
+                        if task.exception() is not None:
+                            logger.warning(f"{provider} lost the extraction race: {str(task.exception())}")
+                            continue
+                        
+                        extraction = self._build_extraction_result(task.result(), required_fields, optional_fields, provider, model)
+                        if extraction['extracted_fields']:
+                            await asyncio.to_thread(self._cache_response, cache_key, task.result())
+                            return extraction
+                        last_result = extraction
+            finally:
+                # Stop paying for the slower provider
+                for task in pending:
+                    task.cancel()
+                # A loser that failed in the same wakeup as the winner was never inspected
+                for task in tasks:
+                    if task.done() and not task.cancelled():
+                        task.exception()
+            
+            if last_result is not None:
+                return last_result
+            raise ValueError("All providers failed in the extraction race")
             
         except Exception as e:
             logger.error(f"Field extraction failed: {str(e)}")
+            return self._build_extraction_error(e, self.default_provider, self.default_model)
+    
+    async def extract_fields_batch(self, ocr_texts: List[str], provider: str = None, model: str = None,
+                                   concurrency: int = None) -> List[Dict[str, Any]]:
+        """Extract fields from several OCR texts concurrently, results in input order"""
+        # Identical texts (cover sheets, literal resends) are extracted once
+        # and the result fanned back out to every position
+        buckets: Dict[str, List[int]] = {}
+        unique_texts = []
+        for index, ocr_text in enumerate(ocr_texts):
+            digest = hashlib.blake2b(ocr_text.encode("utf-8"), digest_size=16).hexdigest()
+            if digest not in buckets:
+                buckets[digest] = []
+                unique_texts.append(ocr_text)
+            buckets[digest].append(index)
+        
+        if len(unique_texts) < len(ocr_texts):
+            logger.info(f"Extracting {len(unique_texts)} unique texts for a batch of {len(ocr_texts)}")
+        
+        # Bound in-flight requests so a large batch queues here instead of
+        # opening hundreds of connections that then wait on the rate limiter.
+        # A caller may ask for less than the configured ceiling, never more
+        semaphore = asyncio.Semaphore(min(concurrency or self.batch_concurrency, self.batch_concurrency))
+        
+        # Field definitions are read once for the whole batch
+        fields = await asyncio.to_thread(self._get_extraction_fields)
+        
+        async def extract_one(ocr_text: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.extract_fields_async(ocr_text, provider, model, fields=fields)
+        
+        unique_results = await asyncio.gather(
+            *(extract_one(ocr_text) for ocr_text in unique_texts),
+            return_exceptions=True
+        )
+        
+        results = [None] * len(ocr_texts)
+        for indices, result in zip(buckets.values(), unique_results):
+            if isinstance(result, Exception):
+                result = self._build_extraction_error(result, provider or self.default_provider, model or self.default_model)
+            for index in indices:
+                results[index] = dict(result)
+        return results
+    
+    async def extract_fields_from_pages(self, pages: AsyncIterator[Dict[str, Any]], provider: str = None,
+                                        model: str = None, preprocess: Callable[[str], str] = None
+                                        ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Extract fields page by page while the pages are still being produced
+        (OCRService.iter_pages) - each page's extraction starts as soon as it
+        arrives, so LLM waits overlap OCR of the following pages. Page
+        extractions are merged like chunks. Returns (page results, extraction).
+        """
+        provider = provider or self.default_provider
+        model = model or self.default_model
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+        
+        # Field definitions are read once for all the pages
+        fields = await asyncio.to_thread(self._get_extraction_fields)
+        
+        async def extract_page(page: Dict[str, Any]) -> Dict[str, Any]:
+            text = preprocess(page['text']) if preprocess else page['text']
+            async with semaphore:
+                return await self.extract_fields_async(text, provider, model, ocr_confidence=page.get('confidence'), fields=fields)
+        
+        page_results = []
+        tasks = []
+        try:
+            async for page in pages:
+                page_results.append(page)
+                tasks.append(asyncio.create_task(extract_page(page)))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        
+        results = await asyncio.gather(*tasks)
+        # Failed pages and pages skipped before the LLM (blank fax pages) don't vote
+        extractions = [result for result in results if 'error' not in result and 'skipped' not in result]
+        if not extractions:
+            return page_results, results[0] if results else self._build_insufficient_text_result(provider, model)
+        if len(extractions) == 1:
+            return page_results, extractions[0]
+        
+        merged = self._merge_extractions(extractions, fields[0], extractions[0]['provider'], extractions[0]['model'], unit="page")
+        return page_results, merged
+    
+    def extract_fields_batch_sync(self, ocr_texts: List[str], provider: str = None, model: str = None) -> List[Dict[str, Any]]:
+        """Blocking wrapper around extract_fields_batch for synchronous callers
+        (must not be called from a running event loop)"""
+        async def run_batch():
+            try:
+                return await self.extract_fields_batch(ocr_texts, provider, model)
+            finally:
+                # The loop goes away with asyncio.run, so its connection pool must too
+                client = _async_http_clients.pop(asyncio.get_running_loop(), None)
+                if client is not None:
+                    await client.aclose()
+        
+        return asyncio.run(run_batch())
+    
+    def _ensure_async_clients(self):
+        """Bind the async SDK clients to the running loop's shared connection pool"""
+        loop = asyncio.get_running_loop()
+        if self._async_clients_loop is loop:
+            return
+        
+        http_client = _get_async_http_client()
+        if self._anthropic_key:
+            from anthropic import AsyncAnthropic
+            self.async_anthropic_client = AsyncAnthropic(
+                api_key=self._anthropic_key,
+                http_client=http_client,
+                max_retries=self.max_retries,
+                timeout=self.request_timeout
+            )
+        if self._openai_key:
+            from openai import AsyncOpenAI
+            self.async_openai_client = AsyncOpenAI(
+                api_key=self._openai_key,
+                http_client=http_client,
+                max_retries=self.max_retries,
+                timeout=self.request_timeout
+            )
+        self._async_clients_loop = loop
+    
+    @staticmethod
+    def close():
+        """Close the process-wide sync connection pool (call on shutdown)"""
+        global _http_client
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+    
+    @staticmethod
+    async def aclose():
+        """Close the running loop's async connection pool and the sync pool (call on shutdown)"""
+        client = _async_http_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+        LLMService.close()
+    
+    def submit_batch(self, ocr_texts: Dict[str, str], provider: str = None, model: str = None) -> str:
+        """
+        Submit an offline extraction job through the provider's Batch API
+        
+        Batch jobs are billed at a discount and don't count against the
+        interactive rate limits, at the cost of up to 24h turnaround - use for
+        backfills and re-extraction, not for documents a reviewer is waiting on.
+        
+        Args:
+            ocr_texts: OCR text keyed by custom id (e.g. the document id); the
+                custom id comes back with each result in collect_batch_results
+            provider: anthropic or openai
+            model: Specific model to use
+        
+        Returns:
+            Provider batch id
+        """
+        provider = provider or self.default_provider
+        model = model or self.default_model
+        
+        required_fields, optional_fields, _ = self._get_extraction_fields()
+        prompts = {
+            str(custom_id): self._create_extraction_prompt(ocr_text, required_fields, optional_fields)
+            for custom_id, ocr_text in ocr_texts.items()
+        }
+        
+        if provider == "anthropic" and self.anthropic_client:
+            batch = self.anthropic_client.messages.batches.create(requests=[
+                {"custom_id": custom_id, "params": self._anthropic_request_params(prompt, model)}
+                for custom_id, prompt in prompts.items()
+            ])
+        elif provider == "openai" and self.openai_client:
+            lines = [
+                orjson.dumps({
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": self._openai_request_params(prompt, model)
+                })
+                for custom_id, prompt in prompts.items()
+            ]
+            input_file = self.openai_client.files.create(
+                file=("extraction_batch.jsonl", b"\n".join(lines)),
+                purpose="batch"
+            )
+            batch = self.openai_client.batches.create(
+                input_file_id=input_file.id,
+                endpoint="/v1/chat/completions",
+                completion_window="24h"
+            )
+        else:
+            raise ValueError(f"Batch extraction not available for provider {provider}")
+        
+        logger.info(f"Submitted {provider} extraction batch {batch.id} with {len(prompts)} documents")
+        return batch.id
+    
+    def poll_batch(self, batch_id: str, provider: str = None) -> Dict[str, Any]:
+        """Get the processing status of a submitted extraction batch"""
+        provider = provider or self.default_provider
+        
+        if provider == "anthropic" and self.anthropic_client:
+            batch = self.anthropic_client.messages.batches.retrieve(batch_id)
+            return {
+                'batch_id': batch.id,
+                'status': batch.processing_status,
+                'completed': batch.processing_status == "ended",
+                'request_counts': batch.request_counts.model_dump()
+            }
+        elif provider == "openai" and self.openai_client:
+            batch = self.openai_client.batches.retrieve(batch_id)
             return {
-                'extracted_fields': {},
-                'confidence_scores': {},
-                'overall_confidence': 0.0,
-                'requires_review': True,
-                'provider': provider,
-                'model': model,
-                'model_version': self.model_version,
-                'error': str(e)
+                'batch_id': batch.id,
+                'status': batch.status,
+                'completed': batch.status in ("completed", "failed", "expired", "cancelled"),
+                'request_counts': batch.request_counts.model_dump() if batch.request_counts else {}
             }
+        
+        raise ValueError(f"Batch extraction not available for provider {provider}")
+    
+    def collect_batch_results(self, batch_id: str, provider: str = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Collect the results of a finished extraction batch
+        
+        Returns:
+            Extraction results keyed by the custom ids passed to submit_batch,
+            in the same format as extract_fields
+        """
+        provider = provider or self.default_provider
+        required_fields, optional_fields, _ = self._get_extraction_fields()
+        results = {}
+        
+        if provider == "anthropic" and self.anthropic_client:
+            for entry in self.anthropic_client.messages.batches.results(batch_id):
+                if entry.result.type == "succeeded":
+                    message = entry.result.message
+                    results[entry.custom_id] = self._build_extraction_result(
+                        self._anthropic_response_text(message), required_fields, optional_fields, provider, message.model
+                    )
+                else:
+                    error = getattr(entry.result, 'error', None) or entry.result.type
+                    results[entry.custom_id] = self._build_extraction_error(error, provider, None)
+        
+        elif provider == "openai" and self.openai_client:
+            batch = self.openai_client.batches.retrieve(batch_id)
+            
+            # Successful requests land in the output file, failed ones in the error file
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if not file_id:
+                    continue
+                for line in self.openai_client.files.content(file_id).text.splitlines():
+                    if not line.strip():
+                        continue
+                    entry = orjson.loads(line)
+                    response = entry.get("response") or {}
+                    body = response.get("body") or {}
+                    if response.get("status_code") == 200 and body.get("choices"):
+                        results[entry["custom_id"]] = self._build_extraction_result(
+                            body["choices"][0]["message"]["content"], required_fields, optional_fields,
+                            provider, body.get("model")
+                        )
+                    else:
+                        error = entry.get("error") or body.get("error") or f"status {response.get('status_code')}"
+                        results[entry["custom_id"]] = self._build_extraction_error(error, provider, body.get("model"))
+        
+        else:
+            raise ValueError(f"Batch extraction not available for provider {provider}")
+        
+        logger.info(f"Collected {len(results)} results from {provider} extraction batch {batch_id}")
+        return results
+    
+    def _get_limiters(self, provider: str) -> Optional[Tuple[Any, Any]]:
+        """Requests/min and tokens/min token buckets for a provider, or None when rate limiting is unavailable"""
+        if not AIOLIMITER_AVAILABLE:
+            if provider not in _rate_limiters:
+                logger.warning(f"aiolimiter not installed - async {provider} calls are not rate limited")
+                _rate_limiters[provider] = (None, None)
+            return None
+        
+        loop = asyncio.get_running_loop()
+        limiter_loop, limiters = _rate_limiters.get(provider, (None, None))
+        if limiter_loop is not loop:
+            rpm, tpm = self._rate_limits[provider]
+            limiters = (AsyncLimiter(max_rate=rpm, time_period=60), AsyncLimiter(max_rate=tpm, time_period=60))
+            _rate_limiters[provider] = (loop, limiters)
+        return limiters
+    
+    async def _throttle(self, provider: str, prompt: str):
+        """Wait until both the request and the estimated token budget allow another call"""
+        limiters = self._get_limiters(provider)
+        if not limiters:
+            return
+        rpm_limiter, tpm_limiter = limiters
+        
+        # ~4 characters per token for the prompt plus the full completion budget;
+        # a single request can never take more than the whole bucket
+        estimated_tokens = min(len(prompt) // 4 + self.max_tokens, tpm_limiter.max_rate)
+        
+        await rpm_limiter.acquire()
+        await tpm_limiter.acquire(estimated_tokens)
+    
+    def _response_cache_key(self, provider: str, model: str, prompt: str) -> str:
+        """
+        Content-addressed cache key - the prompt covers both the OCR text and the
+        field definitions, so a schema change is a new key. Each component is
+        length-prefixed so no two (provider, model, version, prompt) tuples
+        hash the same bytes.
+        """
+        digest = hashlib.sha256()
+        for part in (provider, model, self.PROMPT_VERSION, prompt):
+            data = part.encode("utf-8")
+            digest.update(len(data).to_bytes(8, "big"))
+            digest.update(data)
+        return f"llm_response:{digest.hexdigest()}"
+    
+    def _get_response_cache(self):
+        """Shared response cache backend, or None when caching is unavailable"""
+        global _response_cache
+        if _response_cache is None:
+            cache_dir = os.getenv("LLM_EXTRACTION_CACHE_DIR")
+            redis_url = os.getenv("REDIS_URL")
+            if self.cache_ttl <= 0:
+                _response_cache = False
+            elif cache_dir:
+                try:
+                    _response_cache = _DirectoryCache(cache_dir, self.cache_ttl, self.cache_max_bytes)
+                except OSError as e:
+                    logger.warning(f"LLM response cache directory unavailable: {str(e)}")
+                    _response_cache = False
+            elif REDIS_AVAILABLE and redis_url:
+                _response_cache = redis.Redis.from_url(redis_url, socket_timeout=1, socket_connect_timeout=1)
+            else:
+                _response_cache = False
+        return _response_cache if _response_cache is not False else None
+    
+    def _get_cached_response(self, cache_key: str) -> Optional[str]:
+        """Raw LLM response cached for this key, if any"""
+        cache = self._get_response_cache()
+        if cache is None:
+            return None
+        try:
+            cached = cache.get(cache_key)
+        except _CACHE_ERRORS as e:
+            logger.warning(f"LLM response cache unavailable: {str(e)}")
+            return None
+        if cached is None:
+            return None
+        logger.info(f"LLM response cache hit: {cache_key}")
+        return cached.decode("utf-8")
+    
+    def _cache_response(self, cache_key: str, result: str):
+        """Cache a raw LLM response that produced an extraction"""
+        cache = self._get_response_cache()
+        if cache is None:
+            return
+        try:
+            cache.setex(cache_key, self.cache_ttl, result.encode("utf-8"))
+        except _CACHE_ERRORS as e:
+            logger.warning(f"Failed to cache LLM response: {str(e)}")
+    
+    def _get_template_cache(self) -> Optional[TemplateCache]:
+        """Shared template recipe store, or None when LLM_TEMPLATE_CACHE_PATH is unset"""
+        global _template_cache
+        if _template_cache is None:
+            path = os.getenv("LLM_TEMPLATE_CACHE_PATH")
+            try:
+                _template_cache = TemplateCache(
+                    path, self.template_max_distance, self.template_max_entries, self.template_max_age
+                ) if path else False
+            except sqlite3.Error as e:
+                logger.warning(f"Template cache unavailable: {str(e)}")
+                _template_cache = False
+        return _template_cache if _template_cache is not False else None
+    
+    def _template_schema(self, required_fields: List, optional_fields: List) -> str:
+        """Hash of the active field set and prompt version - recipes learned
+        under other fields or prompts are never applied"""
+        digest = hashlib.blake2b(self.PROMPT_VERSION.encode("utf-8"), digest_size=16)
+        for required, fields in ((True, required_fields), (False, optional_fields)):
+            for field in fields:
+                name = field.name if hasattr(field, 'name') else field.lower().replace(' ', '_')
+                digest.update(f"\0{int(required)}{name}".encode("utf-8"))
+        return digest.hexdigest()
+    
+    def _extract_with_template(self, ocr_text: str, required_fields: List, optional_fields: List) -> Optional[Dict[str, Any]]:
+        """Extraction from a matching template's recipe, or None to go to the LLM"""
+        template_cache = self._get_template_cache()
+        if template_cache is None:
+            return None
+        try:
+            match = template_cache.lookup(ocr_text, self._template_schema(required_fields, optional_fields))
+        except _CACHE_ERRORS as e:
+            logger.warning(f"Template cache lookup failed: {str(e)}")
+            return None
+        if match is None:
+            return None
+        
+        template_id, values = match
+        result = orjson.dumps(values).decode("utf-8")
+        return self._build_extraction_result(result, required_fields, optional_fields, "template", f"template-{template_id}")
+    
+    def _learn_template(self, ocr_text: str, extraction: Dict[str, Any], required_fields: List, optional_fields: List):
+        """Store a recipe for this document's template from a successful LLM extraction"""
+        template_cache = self._get_template_cache()
+        if template_cache is None or not extraction.get('extracted_fields'):
+            return
+        try:
+            raw_response = extraction['raw_response']
+            extracted_data = orjson.loads(self._extract_json_span(raw_response) or raw_response)
+            if isinstance(extracted_data, dict):
+                template_cache.learn(ocr_text, extracted_data, self._template_schema(required_fields, optional_fields))
+        except _CACHE_ERRORS as e:
+            logger.warning(f"Failed to store template recipe: {str(e)}")
+    
+    def _get_extraction_fields(self) -> Tuple[List, List, List]:
+        """Get required, optional and all field definitions for extraction"""
+        # Get field definitions from database
+        if self.field_service:
+            required_fields = self.field_service.get_required_fields()
+            optional_fields = self.field_service.get_optional_fields()
+            all_field_definitions = required_fields + optional_fields
+        else:
+            # Fallback to hardcoded fields if no database connection
+            required_fields = self._get_fallback_required_fields()
+            optional_fields = self._get_fallback_optional_fields()
+            all_field_definitions = self._convert_to_field_definitions(required_fields, optional_fields)
+        
+        return required_fields, optional_fields, all_field_definitions
+    
+    def _build_extraction_result(self, result: str, required_fields: List, optional_fields: List, provider: str, model: str) -> Dict[str, Any]:
+        """Parse a raw LLM response into the extraction result"""
+        # Parse and validate results
+        extracted_data = self._parse_extraction_result(result, required_fields + optional_fields)
+        
+        # Calculate confidence scores
+        required_field_names = self._required_field_names(required_fields)
+        confidence_scores = self._calculate_confidence_scores(extracted_data, required_field_names)
+        
+        return {
+            'extracted_fields': extracted_data,
+            'confidence_scores': confidence_scores,
+            'overall_confidence': confidence_scores.get('overall', 0.0),
+            'requires_review': self._requires_review(extracted_data, confidence_scores, required_field_names),
+            'provider': provider,
+            'model': model,
+            'model_version': self.model_version,
+            'raw_response': result
+        }
+    
+    def _build_extraction_error(self, error: Exception, provider: str, model: str) -> Dict[str, Any]:
+        """Extraction result for a failed extraction"""
+        return {
+            'extracted_fields': {},
+            'confidence_scores': {},
+            'overall_confidence': 0.0,
+            'requires_review': True,
+            'provider': provider,
+            'model': model,
+            'model_version': self.model_version,
+            'error': str(error)
+        }
+    
+    def _is_insufficient_text(self, ocr_text: str, required_fields: List, optional_fields: List,
+                              ocr_confidence: float = None) -> bool:
+        """Cheap check for OCR text too short or too unrelated to be worth an LLM call"""
+        # Blank fax pages and unreadable scans - nothing for the LLM to find
+        if len(ocr_text.strip()) < self.min_ocr_chars:
+            return True
+        if ocr_confidence is not None and ocr_confidence < self.min_ocr_confidence:
+            return True
+        
+        if not self.prefilter_enabled:
+            return False
+        if len(ocr_text) < self.prefilter_min_chars:
+            return True
+        
+        pattern, _ = self._field_keyword_index(required_fields, optional_fields)
+        
+        hits = set()
+        for match in pattern.finditer(ocr_text.lower()):
+            hits.add(match.group(0))
+            if len(hits) >= self.prefilter_min_keywords:
+                return False
+        return True
+    
+    def _field_keyword_index(self, required_fields: List, optional_fields: List) -> Tuple[Any, Dict[str, Tuple[str, ...]]]:
+        """
+        Single compiled alternation over every field keyword (display names,
+        extraction-hint keywords and common abbreviations), plus a map from
+        each keyword to the fields it signals. Built once per field set.
+        """
+        fields = [
+            (field.display_name, tuple((getattr(field, 'extraction_hints', None) or {}).get('keywords', ())))
+            if hasattr(field, 'display_name') else (field, ())
+            for field in required_fields + optional_fields
+        ]
+        key = tuple(fields)
+        index = _field_keyword_indexes.get(key)
+        if index is not None:
+            return index
+        
+        keyword_fields = {synonym: () for synonym in _PREFILTER_SYNONYMS}
+        for display_name, hint_keywords in fields:
+            for keyword in (display_name, *hint_keywords):
+                keyword = keyword.lower()
+                keyword_fields[keyword] = keyword_fields.get(keyword, ()) + (display_name,)
+        
+        # Longest keywords first so "date of birth" wins over "date"
+        engine = re2 if RE2_AVAILABLE else re
+        keywords = sorted(keyword_fields, key=lambda keyword: (-len(keyword), keyword))
+        pattern = engine.compile(r"\b(?:" + "|".join(engine.escape(keyword) for keyword in keywords) + r")\b")
+        
+        index = (pattern, keyword_fields)
+        _field_keyword_indexes[key] = index
+        return index
+    
+    def _detect_present_fields(self, ocr_text: str, required_fields: List, optional_fields: List) -> set:
+        """Display names of the fields whose labels or keywords appear in the OCR text"""
+        pattern, keyword_fields = self._field_keyword_index(required_fields, optional_fields)
+        present = set()
+        for keyword in {match.group(0) for match in pattern.finditer(ocr_text.lower())}:
+            present.update(keyword_fields.get(keyword, ()))
+        return present
+    
+    def _build_insufficient_text_result(self, provider: str, model: str) -> Dict[str, Any]:
+        """Extraction result for OCR text that was not sent to the LLM"""
+        logger.info("OCR text failed the extraction pre-filter - skipping LLM call")
+        return {
+            'extracted_fields': {},
+            'confidence_scores': {'overall': 0.0},
+            'overall_confidence': 0.0,
+            'requires_review': True,
+            'provider': provider,
+            'model': model,
+            'model_version': self.model_version,
+            'skipped': 'insufficient_ocr_text'
+        }
     
     def _create_extraction_prompt(self, ocr_text: str, required_fields: List, optional_fields: List) -> str:
         """Create the extraction prompt for the LLM using configurable field definitions"""
+        lines = [self._extraction_prompt_prefix(required_fields, optional_fields)]
+        # Everything below varies per document - keep it after the static
+        # prefix so provider prompt caching can reuse that prefix
+        if self.prompt_field_hints:
+            detected = self._detect_present_fields(ocr_text, required_fields, optional_fields)
+            if detected:
+                # Keep the listed order so identical documents give identical prompts
+                names = [field.display_name if hasattr(field, 'display_name') else field for field in required_fields + optional_fields]
+                lines.append(f"Labels detected in the text: {', '.join(name for name in names if name in detected)}")
+                lines.append("")
+        lines.append("OCR text:")
+        lines.append(ocr_text)
+        lines.append("")
+        lines.append("JSON:")
+        return "\n".join(lines)
+    
+    def _extraction_prompt_prefix(self, required_fields: List, optional_fields: List) -> str:
+        """
+        Static part of the extraction prompt (intro, field list, rules), built
+        once per field set. Keyed by the rendered field lines rather than
+        identity, so an edited definition simply produces a new entry.
+        """
+        required_lines = tuple(self._prompt_field_line(field) for field in required_fields)
+        optional_lines = tuple(self._prompt_field_line(field) for field in optional_fields)
+        key = (required_lines, optional_lines)
+        prefix = _prompt_prefixes.get(key)
+        if prefix is not None:
+            return prefix
         
-        # Build required fields section
-        required_section = []
-        for field in required_fields:
-            field_name = field.display_name if hasattr(field, 'display_name') else field
-            field_desc = field.description if hasattr(field, 'description') else ""
-            if field_desc:
-                required_section.append(f"- {field_name}: {field_desc}")
-            else:
-                required_section.append(f"- {field_name}")
+        prefix = "\n".join([
+            _PROMPT_INTRO,
+            "",
+            "Required fields (missing ones send the document to manual review):",
+            *required_lines,
+            "",
+            "Optional fields:",
+            *optional_lines,
+            "",
+            _PROMPT_RULES,
+            ""
+        ])
         
-        # Build optional fields section
-        optional_section = []
-        for field in optional_fields:
-            field_name = field.display_name if hasattr(field, 'display_name') else field
-            field_desc = field.description if hasattr(field, 'description') else ""
-            if field_desc:
-                optional_section.append(f"- {field_name}: {field_desc}")
-            else:
-                optional_section.append(f"- {field_name}")
+        if len(_prompt_prefixes) >= _PROMPT_PREFIX_CACHE_SIZE:
+            _prompt_prefixes.clear()
+        _prompt_prefixes[key] = prefix
+        return prefix
+    
+    def _prompt_field_line(self, field) -> str:
+        """One prompt line per field - name, description and keyword hints together"""
+        # Definitions from FieldDefinitionService come with the line pre-rendered
+        prompt_line = getattr(field, 'prompt_line', None)
+        if prompt_line is not None:
+            return prompt_line
         
-        # Build extraction hints
-        hints_section = []
-        all_fields = required_fields + optional_fields
-        for field in all_fields:
-            if hasattr(field, 'extraction_hints') and field.extraction_hints:
-                hints = field.extraction_hints
-                field_name = field.display_name if hasattr(field, 'display_name') else field
-                if 'keywords' in hints:
-                    keywords = ', '.join(hints['keywords'])
-                    hints_section.append(f"- {field_name}: Look for keywords like '{keywords}'")
+        if not hasattr(field, 'display_name'):
+            return f"- {field}"
         
-        prompt = f"""You are an expert at reading insurance authorization and denial documents in a medical workflow. Given OCR text from a multi-page faxed PDF, extract the following fields if present, and output a JSON object with only the found fields:
-
-Required Fields (must be found for successful processing):
-{chr(10).join(required_section)}
-
-Optional Fields (failing to find these does not result in the record moving to the review UI screen):
-{chr(10).join(optional_section)}
-
-Extraction Hints:
-{chr(10).join(hints_section) if hints_section else "Use context clues and common document patterns."}
-
-Instructions:
-1. If a field is missing or cannot be found, omit it from the JSON
-2. Use only valid JSON output, no extra explanation
-3. Be precise with field names - use exactly the display names listed above
-4. For dates, use MM/DD/YYYY format if possible
-5. For phone numbers, use standard formatting (XXX) XXX-XXXX if possible
-6. For email addresses, ensure proper email format
-7. Look for variations in field names and synonyms
-8. Consider the context and location of information in the document
-
-OCR Text to analyze:
-{ocr_text}
-
-Output only valid JSON:"""
+        return render_prompt_line(field.display_name, field.description, field.extraction_hints)
+    
+    def _get_breaker(self, provider: str) -> _CircuitBreaker:
+        """Shared circuit breaker for a provider"""
+        with _circuit_breakers_lock:
+            if provider not in _circuit_breakers:
+                _circuit_breakers[provider] = _CircuitBreaker(self.breaker_fail_max, self.breaker_reset_timeout)
+            return _circuit_breakers[provider]
+    
+    def _fallback_provider(self, provider: str, asynchronous: bool = False) -> Optional[Tuple[str, str]]:
+        """The other direct provider and its model, if it is configured"""
+        other = {"anthropic": "openai", "openai": "anthropic"}.get(provider)
+        if other is None:
+            return None
+        client = getattr(self, f"async_{other}_client" if asynchronous else f"{other}_client")
+        return (other, self.race_models[other]) if client else None
+    
+    def _call_provider(self, prompt: str, provider: str, model: str) -> Tuple[str, str, str]:
+        """
+        Call a provider through its circuit breaker. While the breaker is open
+        the call goes to the other provider instead of waiting out another
+        timeout/retry cycle. Returns (provider, model, response text).
+        """
+        calls = {
+            "anthropic": (self.anthropic_client, self._extract_with_anthropic),
+            "openai": (self.openai_client, self._extract_with_openai)
+        }
+        candidates = [(provider, model)]
+        fallback = self._fallback_provider(provider)
+        if fallback:
+            candidates.append(fallback)
+        
+        for candidate, candidate_model in candidates:
+            client, extract = calls.get(candidate, (None, None))
+            if not client:
+                raise ValueError(f"Provider {candidate} not available or not configured")
+            
+            breaker = self._get_breaker(candidate)
+            if not breaker.allow():
+                logger.warning(f"Circuit open for {candidate} - skipping")
+                continue
+            
+            try:
+                result = extract(prompt, candidate_model)
+                for attempt in range(self.json_retries):
+                    error = self._json_error(result)
+                    if error is None:
+                        break
+                    logger.warning(f"Unparseable {candidate} response ({error}) - retrying with feedback")
+                    result = extract(self._json_retry_prompt(prompt, error), candidate_model)
+            except Exception:
+                breaker.record_failure()
+                raise
+            breaker.record_success()
+            return candidate, candidate_model, result
         
-        return prompt
+        raise CircuitOpenError(f"Circuit open for {provider} and no fallback provider available")
+    
+    async def _call_provider_async(self, prompt: str, provider: str, model: str) -> Tuple[str, str, str]:
+        """Async variant of _call_provider"""
+        calls = {
+            "anthropic": (self.async_anthropic_client, self._extract_with_anthropic_async),
+            "openai": (self.async_openai_client, self._extract_with_openai_async)
+        }
+        candidates = [(provider, model)]
+        fallback = self._fallback_provider(provider, asynchronous=True)
+        if fallback:
+            candidates.append(fallback)
+        
+        for candidate, candidate_model in candidates:
+            client, extract = calls.get(candidate, (None, None))
+            if not client:
+                raise ValueError(f"Provider {candidate} not available or not configured")
+            
+            breaker = self._get_breaker(candidate)
+            if not breaker.allow():
+                logger.warning(f"Circuit open for {candidate} - skipping")
+                continue
+            
+            try:
+                result = await extract(prompt, candidate_model)
+                for attempt in range(self.json_retries):
+                    error = self._json_error(result)
+                    if error is None:
+                        break
+                    logger.warning(f"Unparseable {candidate} response ({error}) - retrying with feedback")
+                    result = await extract(self._json_retry_prompt(prompt, error), candidate_model)
+            except Exception:
+                breaker.record_failure()
+                raise
+            breaker.record_success()
+            return candidate, candidate_model, result
+        
+        raise CircuitOpenError(f"Circuit open for {provider} and no fallback provider available")
+    
+    def _anthropic_request_params(self, prompt: str, model: str) -> Dict[str, Any]:
+        """Messages API parameters for an extraction request"""
+        return {
+            "model": model,
+            "max_tokens": self.max_tokens,
+            "temperature": 0.1,
+            "messages": [
+                {"role": "user", "content": self._anthropic_prompt_blocks(prompt)},
+                # Prefill the opening brace so the reply is the JSON object
+                # itself - no markdown fence or preamble to strip or pay for
+                {"role": "assistant", "content": "{"}
+            ],
+            "stop_sequences": ["```"]
+        }
+    
+    def _anthropic_prompt_blocks(self, prompt: str) -> List[Dict[str, Any]]:
+        """
+        Split the prompt into the static prefix (intro, field list, rules) and
+        the per-document tail, marking the prefix as a prompt-cache breakpoint
+        so repeat requests with the same field set reuse it server-side
+        """
+        prefix, rules, tail = prompt.partition(_PROMPT_RULES)
+        if not rules:
+            return [{"type": "text", "text": prompt}]
+        return [
+            {"type": "text", "text": prefix + rules, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": tail}
+        ]
+    
+    def _openai_request_params(self, prompt: str, model: str) -> Dict[str, Any]:
+        """Chat Completions parameters for an extraction request"""
+        params = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": "You are an expert at extracting structured data from medical documents. Always respond with valid JSON only."},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.1,
+            "max_tokens": self.max_tokens
+        }
+        
+        # JSON mode guarantees a bare JSON object - no fences or prose
+        if model not in self.JSON_MODE_UNSUPPORTED_MODELS:
+            params["response_format"] = {"type": "json_object"}
+        
+        return params
+    
+    def _anthropic_response_text(self, message) -> str:
+        """Response text with the prefilled opening brace restored"""
+        return "{" + message.content[0].text
     
     def _extract_with_anthropic(self, prompt: str, model: str) -> str:
         """Extract using Anthropic Claude"""
+        if self.stream_responses:
+            return self._collect_stream(self._extract_with_anthropic_stream(prompt, model))
         try:
-            response = self.anthropic_client.messages.create(
-                model=model,
-                max_tokens=2000,
-                temperature=0.1,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            return response.content[0].text
+            response = self.anthropic_client.messages.create(**self._anthropic_request_params(prompt, model))
+            return self._anthropic_response_text(response)
         except Exception as e:
             logger.error(f"Anthropic API error: {str(e)}")
             raise
     
     def _extract_with_openai(self, prompt: str, model: str) -> str:
         """Extract using OpenAI GPT"""
+        if self.stream_responses:
+            return self._collect_stream(self._extract_with_openai_stream(prompt, model))
         try:
-            response = self.openai_client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "You are an expert at extracting structured data from medical documents. Always respond with valid JSON only."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.1,
-                max_tokens=2000
-            )
+            response = self.openai_client.chat.completions.create(**self._openai_request_params(prompt, model))
             return response.choices[0].message.content
         except Exception as e:
             logger.error(f"OpenAI API error: {str(e)}")
             raise
     
+    def _extract_with_anthropic_stream(self, prompt: str, model: str):
+        """Stream response text from Anthropic Claude, starting with the prefilled brace"""
+        try:
+            yield "{"
+            with self.anthropic_client.messages.stream(
+                **self._anthropic_request_params(prompt, model),
+                timeout=self.stream_timeout
+            ) as stream:
+                yield from stream.text_stream
+        except Exception as e:
+            logger.error(f"Anthropic API error: {str(e)}")
+            raise
+    
+    def _extract_with_openai_stream(self, prompt: str, model: str):
+        """Stream response text from OpenAI GPT"""
+        try:
+            with self.openai_client.chat.completions.create(
+                **self._openai_request_params(prompt, model),
+                stream=True,
+                timeout=self.stream_timeout
+            ) as stream:
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+        except Exception as e:
+            logger.error(f"OpenAI API error: {str(e)}")
+            raise
+    
+    async def _extract_with_anthropic_async(self, prompt: str, model: str) -> str:
+        """Extract using Anthropic Claude without blocking the event loop"""
+        try:
+            await self._throttle("anthropic", prompt)
+            if self.stream_responses:
+                async with self.async_anthropic_client.messages.stream(
+                    **self._anthropic_request_params(prompt, model),
+                    timeout=self.stream_timeout
+                ) as stream:
+                    return await self._collect_stream_async(stream.text_stream, "{")
+            response = await self.async_anthropic_client.messages.create(**self._anthropic_request_params(prompt, model))
+            return self._anthropic_response_text(response)
+        except Exception as e:
+            logger.error(f"Anthropic API error: {str(e)}")
+            raise
+    
+    async def _extract_with_openai_async(self, prompt: str, model: str) -> str:
+        """Extract using OpenAI GPT without blocking the event loop"""
+        try:
+            await self._throttle("openai", prompt)
+            if self.stream_responses:
+                stream = await self.async_openai_client.chat.completions.create(
+                    **self._openai_request_params(prompt, model),
+                    stream=True,
+                    timeout=self.stream_timeout
+                )
+                async with stream:
+                    return await self._collect_stream_async(
+                        chunk.choices[0].delta.content async for chunk in stream
+                        if chunk.choices and chunk.choices[0].delta.content
+                    )
+            response = await self.async_openai_client.chat.completions.create(**self._openai_request_params(prompt, model))
+            return response.choices[0].message.content
+        except Exception as e:
+            logger.error(f"OpenAI API error: {str(e)}")
+            raise
+    
+    def _collect_stream(self, chunks) -> str:
+        """Join streamed response text, closing the stream once the top-level JSON object is complete"""
+        parser = _StreamingObjectParser()
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            parser.feed(chunk)
+            if parser.complete:
+                chunks.close()
+                break
+        return "".join(parts)
+    
+    async def _collect_stream_async(self, chunks, text: str = "") -> str:
+        """Async variant of _collect_stream - the caller closes the stream"""
+        parser = _StreamingObjectParser()
+        parser.feed(text)
+        parts = [text]
+        async for chunk in chunks:
+            parts.append(chunk)
+            parser.feed(chunk)
+            if parser.complete:
+                break
+        return "".join(parts)
+    
     def _parse_extraction_result(self, result: str, field_definitions: List) -> Dict[str, Any]:
         """Parse the LLM response into structured data"""
         try:
-            # Clean the response - remove any markdown formatting
-            cleaned_result = result.strip()
-            if cleaned_result.startswith('```json'):
-                cleaned_result = cleaned_result[7:]
-            if cleaned_result.endswith('```'):
-                cleaned_result = cleaned_result[:-3]
-            cleaned_result = cleaned_result.strip()
-            
-            # Parse JSON
-            extracted_data = json.loads(cleaned_result)
-            
-            # Build valid field names from definitions
-            valid_fields = []
+            # Parse the outermost JSON object, ignoring any markdown fences or
+            # prose the model wrapped around it
+            extracted_data = orjson.loads(self._extract_json_span(result) or result)
+            
+            # Map display names, and their case/space-insensitive forms, to internal names
             field_name_mapping = {}
+            normalized_fields = {}
             
             for field_def in field_definitions:
                 if hasattr(field_def, 'display_name'):
                     display_name = field_def.display_name
                     internal_name = field_def.name
-                    valid_fields.append(display_name)
-                    field_name_mapping[display_name] = internal_name
                 else:
                     # Fallback for string fields
-                    valid_fields.append(field_def)
-                    field_name_mapping[field_def] = field_def.lower().replace(' ', '_')
+                    display_name = field_def
+                    internal_name = field_def.lower().replace(' ', '_')
+                field_name_mapping[display_name] = internal_name
+                normalized_fields.setdefault(display_name.lower().replace(' ', ''), internal_name)
             
             validated_data = {}
             
             for key, value in extracted_data.items():
-                if key in valid_fields:
-                    internal_name = field_name_mapping.get(key, key)
-                    validated_data[internal_name] = value
+                if key in field_name_mapping:
+                    validated_data[field_name_mapping[key]] = value
                 else:
                     # Try to find close matches
-                    for valid_field in valid_fields:
-                        if key.lower().replace(' ', '') == valid_field.lower().replace(' ', ''):
-                            internal_name = field_name_mapping.get(valid_field, valid_field)
-                            validated_data[internal_name] = value
-                            break
+                    internal_name = normalized_fields.get(key.lower().replace(' ', ''))
+                    if internal_name:
+                        validated_data[internal_name] = value
             
             return validated_data
             
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"Failed to parse JSON response: {str(e)}")
             logger.error(f"Raw response: {result}")
             return {}
@@ -260,14 +1654,71 @@ Output only valid JSON:"""
             logger.error(f"Error parsing extraction result: {str(e)}")
             return {}
     
-    def _calculate_confidence_scores(self, extracted_data: Dict[str, Any], required_fields: List) -> Dict[str, float]:
+    def _json_error(self, result: str) -> Optional[str]:
+        """Why a response can't be parsed as the extraction object, or None if it can"""
+        try:
+            extracted_data = orjson.loads(self._extract_json_span(result) or result)
+        except orjson.JSONDecodeError as e:
+            return str(e)
+        if not isinstance(extracted_data, dict):
+            return f"expected a JSON object, got {type(extracted_data).__name__}"
+        return None
+    
+    def _json_retry_prompt(self, prompt: str, error: str) -> str:
+        """The extraction prompt with feedback on the previous unparseable output"""
+        # Appended at the end so the cached static prefix still matches
+        return f"{prompt}\n\nYour previous output was not valid JSON ({error}). Output only the JSON object."
+    
+    def _extract_json_span(self, text: str) -> Optional[str]:
+        """Return the first balanced {...} object in text, or None if there isn't one"""
+        start = text.find('{')
+        if start == -1:
+            return None
+        
+        depth = 0
+        in_string = False
+        escaped = False
+        for i in range(start, len(text)):
+            char = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == '{':
+                depth += 1
+            elif char == '}':
+                depth -= 1
+                if depth == 0:
+                    return text[start:i + 1]
+        return None
+    
+    def _required_field_names(self, required_fields: List) -> frozenset:
+        """Internal names of the required fields, for field definitions or fallback display names"""
+        return frozenset(
+            field_def.name if hasattr(field_def, 'name') else field_def.lower().replace(' ', '_')
+            for field_def in required_fields
+        )
+    
+    def _calculate_confidence_scores(self, extracted_data: Dict[str, Any], required_field_names: frozenset) -> Dict[str, float]:
         """Calculate confidence scores for extracted fields"""
         confidence_scores = {}
+        required_sum = 0.0
+        required_count = 0
+        total_sum = 0.0
         
-        # Simple heuristic-based confidence scoring
+        # Simple heuristic-based confidence scoring, accumulating the
+        # required/overall averages in the same pass
         for field, value in extracted_data.items():
-            if not value or str(value).strip() == "":
-                confidence_scores[field] = 0.0
+            text = str(value) if value else ""
+            stripped = text.strip()
+            
+            if not stripped:
+                confidence = 0.0
             else:
                 # Base confidence on field completeness and format
                 confidence = 0.8  # Base confidence
@@ -279,115 +1730,73 @@ Output only valid JSON:"""
                 
                 if field_def and hasattr(field_def, 'field_type'):
                     # Adjust confidence based on field type validation
-                    if field_def.field_type == "date" and self._is_valid_date(str(value)):
+                    field_type = field_def.field_type
+                    if field_type == "date" and self._is_valid_date(stripped):
                         confidence = 0.9
-                    elif field_def.field_type == "email" and self._is_valid_email(str(value)):
+                    elif field_type == "email" and self._is_valid_email(stripped):
                         confidence = 0.9
-                    elif field_def.field_type == "phone" and self._is_valid_phone(str(value)):
+                    elif field_type == "phone" and self._is_valid_phone(stripped):
                         confidence = 0.9
-                    elif field_def.validation_pattern and self._matches_pattern(str(value), field_def.validation_pattern):
+                    elif field_def.compiled_pattern and field_def.compiled_pattern.match(stripped):
                         confidence = 0.9
                 else:
                     # Fallback validation
-                    if "date" in field.lower() and self._is_valid_date(str(value)):
+                    is_date, is_id, is_name = _fallback_field_kind(field)
+                    if is_date and self._is_valid_date(stripped):
                         confidence = 0.9
-                    elif field in ["member_id", "reference_number"] and len(str(value)) > 3:
+                    elif is_id and len(text) > 3:
                         confidence = 0.9
-                    elif "name" in field.lower() and len(str(value)) > 1:
+                    elif is_name and len(text) > 1:
                         confidence = 0.85
                 
-                if len(str(value)) < 2:
+                if len(text) < 2:
                     confidence = 0.5
-                
-                confidence_scores[field] = confidence
-        
-        # Calculate overall confidence
-        if confidence_scores:
-            # Get required field names
-            required_field_names = []
-            for field_def in required_fields:
-                if hasattr(field_def, 'name'):
-                    required_field_names.append(field_def.name)
-                else:
-                    required_field_names.append(field_def.lower().replace(' ', '_'))
             
-            # Weight required fields more heavily
-            required_scores = [confidence_scores.get(field, 0.0) for field in required_field_names if field in confidence_scores]
-            all_scores = list(confidence_scores.values())
-            
-            if required_scores:
-                required_avg = sum(required_scores) / len(required_scores)
-                all_avg = sum(all_scores) / len(all_scores)
-                overall_confidence = (required_avg * 0.8) + (all_avg * 0.2)
-            else:
-                overall_confidence = 0.0
-            
-            confidence_scores['overall'] = overall_confidence
+            confidence_scores[field] = confidence
+            total_sum += confidence
+            if field in required_field_names:
+                required_sum += confidence
+                required_count += 1
+        
+        # Weight required fields more heavily
+        if required_count:
+            overall_confidence = (required_sum / required_count) * 0.8 + (total_sum / len(confidence_scores)) * 0.2
         else:
-            confidence_scores['overall'] = 0.0
+            overall_confidence = 0.0
         
+        confidence_scores['overall'] = overall_confidence
         return confidence_scores
     
-    def _requires_review(self, extracted_data: Dict[str, Any], confidence_scores: Dict[str, float], required_fields: List) -> bool:
+    def _requires_review(self, extracted_data: Dict[str, Any], confidence_scores: Dict[str, float], required_field_names: frozenset) -> bool:
         """Determine if document requires manual review"""
         
-        # Get required field names
-        required_field_names = []
-        for field_def in required_fields:
-            if hasattr(field_def, 'name'):
-                required_field_names.append(field_def.name)
-            else:
-                required_field_names.append(field_def.lower().replace(' ', '_'))
-        
-        # Check if all required fields are present
-        missing_required = []
-        for field_name in required_field_names:
-            if field_name not in extracted_data or not extracted_data[field_name]:
-                missing_required.append(field_name)
-        
-        # Check confidence thresholds
-        min_confidence = float(os.getenv("MIN_CONFIDENCE_THRESHOLD", "0.7"))
-        required_threshold = float(os.getenv("REQUIRED_FIELDS_THRESHOLD", "0.8"))
-        
-        overall_confidence = confidence_scores.get('overall', 0.0)
-        
         # Requires review if:
         # 1. Missing required fields
         # 2. Overall confidence below threshold
         # 3. Any required field has very low confidence
-        if missing_required:
+        if any(not extracted_data.get(field_name) for field_name in required_field_names):
             return True
         
-        if overall_confidence < min_confidence:
+        if confidence_scores.get('overall', 0.0) < self.min_confidence_threshold:
             return True
         
-        for field_name in required_field_names:
-            if field_name in confidence_scores and confidence_scores[field_name] < required_threshold:
-                return True
-        
-        return False
+        return any(
+            confidence_scores.get(field_name, 1.0) < self.required_fields_threshold
+            for field_name in required_field_names
+        )
     
     def _is_valid_date(self, date_str: str) -> bool:
         """Simple date validation"""
-        import re
         # Check for common date formats
-        date_patterns = [
-            r'\d{1,2}/\d{1,2}/\d{4}',
-            r'\d{1,2}-\d{1,2}-\d{4}',
-            r'\d{4}-\d{1,2}-\d{1,2}'
-        ]
-        
-        for pattern in date_patterns:
-            if re.match(pattern, date_str.strip()):
-                return True
-        return False
+        date_str = date_str.strip()
+        return any(pattern.match(date_str) for pattern in _DATE_PATTERNS)
     
     def get_available_providers(self) -> List[str]:
         """Get list of available LLM providers"""
         providers = []
-        if self.anthropic_client:
+        if self._anthropic_key:
             providers.append("anthropic")
-        if self.openai_client:
+        if self._openai_key:
             providers.append("openai")
         if self.azure_openai_service and self.azure_openai_service.is_configured():
             providers.append("azure_openai")
@@ -413,29 +1822,17 @@ Output only valid JSON:"""
     
     def _is_valid_email(self, email_str: str) -> bool:
         """Simple email validation"""
-        import re
-        pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-        return bool(re.match(pattern, email_str.strip()))
+        return bool(_EMAIL_PATTERN.match(email_str.strip()))
     
     def _is_valid_phone(self, phone_str: str) -> bool:
         """Simple phone validation"""
-        import re
-        patterns = [
-            r'^\(\d{3}\) \d{3}-\d{4}$',
-            r'^\d{3}-\d{3}-\d{4}$',
-            r'^\d{10}$'
-        ]
-        
-        for pattern in patterns:
-            if re.match(pattern, phone_str.strip()):
-                return True
-        return False
+        phone_str = phone_str.strip()
+        return any(pattern.match(phone_str) for pattern in _PHONE_PATTERNS)
     
     def _matches_pattern(self, value: str, pattern: str) -> bool:
         """Check if value matches regex pattern"""
-        import re
         try:
-            return bool(re.match(pattern, value.strip()))
+            return bool(_compile_validation_pattern(pattern).match(value.strip()))
         except re.error:
             return False
     
@@ -512,16 +1909,16 @@ Output only valid JSON:"""
         
         # Anthropic status
         status['anthropic'] = {
-            'available': bool(self.anthropic_client),
+            'available': bool(self._anthropic_key),
             'configured': bool(os.getenv("ANTHROPIC_API_KEY")),
-            'models': self.get_available_models('anthropic') if self.anthropic_client else []
+            'models': self.get_available_models('anthropic') if self._anthropic_key else []
         }
         
         # OpenAI status
         status['openai'] = {
-            'available': bool(self.openai_client),
+            'available': bool(self._openai_key),
             'configured': bool(os.getenv("OPENAI_API_KEY")),
-            'models': self.get_available_models('openai') if self.openai_client else []
+            'models': self.get_available_models('openai') if self._openai_key else []
         }
         
         # Azure OpenAI status
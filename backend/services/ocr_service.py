@@ -1,9 +1,14 @@
 # OCR Service with optional dependencies for development
 import os
-import tempfile
-from typing import List, Tuple, Dict, Any
+import asyncio
+import hashlib
+import threading
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Dict, Any, AsyncIterator, Optional
 import logging
 from dotenv import load_dotenv
+from .file_cache import make_private_dir, write_file_atomic, is_expired, shared_pruner
 
 # Optional OCR dependencies - gracefully handle missing packages
 try:
@@ -13,12 +18,23 @@ except ImportError:
     PYTESSERACT_AVAILABLE = False
     pytesseract = None
 
+# Optional persistent Tesseract binding - the model is loaded once per API
+# instead of once per page by a tesseract subprocess
+try:
+    from tesserocr import PyTessBaseAPI, PSM, RIL, iterate_level
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+    PyTessBaseAPI = None
+
 try:
     import easyocr
+    import numpy as np  # easyocr dependency, used to hand it page pixels directly
     EASYOCR_AVAILABLE = True
 except ImportError:
     EASYOCR_AVAILABLE = False
     easyocr = None
+    np = None
 
 try:
     from PIL import Image
@@ -27,24 +43,62 @@ except ImportError:
     PIL_AVAILABLE = False
     Image = None
 
+# Text layer of born-digital PDFs, read without rendering or OCR
+try:
+    import fitz  # PyMuPDF
+    PYMUPDF_AVAILABLE = True
+except ImportError:
+    PYMUPDF_AVAILABLE = False
+    fitz = None
+
 try:
-    from pdf2image import convert_from_path
+    from pdf2image import convert_from_path, pdfinfo_from_path
     PDF2IMAGE_AVAILABLE = True
 except ImportError:
     PDF2IMAGE_AVAILABLE = False
     convert_from_path = None
+    pdfinfo_from_path = None
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Idle tesserocr APIs, shared by every OCRService in the process. An API is
+# used by one thread at a time and returned here afterwards, so the loaded
+# model outlives the per-document worker threads.
+_tesserocr_apis = []
+_tesserocr_apis_lock = threading.Lock()
+
 class OCRService:
     def __init__(self):
         self.ocr_engine = os.getenv("OCR_ENGINE", "tesseract")
         self.tesseract_cmd = os.getenv("TESSERACT_CMD", "/usr/bin/tesseract")
+        self.dpi = int(os.getenv("OCR_DPI", "200"))  # Render resolution; enough for faxed documents
+        self.high_dpi = int(os.getenv("OCR_HIGH_DPI", "300"))  # Used instead when the first page's text is small
+        self.min_text_height = int(os.getenv("OCR_MIN_TEXT_HEIGHT", "20"))  # Median word height (px) below which to re-render
+        self.max_workers = int(os.getenv("OCR_MAX_WORKERS", str(os.cpu_count() or 1)))  # Pages OCR'd in parallel (Tesseract)
+        # Average chars/page for an embedded text layer to replace OCR. Opt-in (0
+        # disables): layer text is reported at confidence 1.0 and skips review,
+        # and scanned or faxed PDFs can carry a stale or garbage layer
+        self.text_layer_min_chars = int(os.getenv("OCR_TEXT_LAYER_MIN_CHARS", "0"))
+        self.text_layer_min_coverage = float(os.getenv("OCR_TEXT_LAYER_MIN_COVERAGE", "0.8"))  # Fraction of pages that must have text
+        self.page_cache_dir = os.getenv("OCR_PAGE_CACHE_DIR")  # OCR results by page pixels (re-uploads, cover sheets); unset disables
+        self.page_cache_max_age = float(os.getenv("OCR_PAGE_CACHE_MAX_AGE", "86400"))  # Seconds a cached page is kept after it was written
+        self.page_cache_max_bytes = int(os.getenv("OCR_PAGE_CACHE_MAX_BYTES", str(1024 ** 3)))  # Oldest pages are deleted beyond this
+        self.page_cache_pruner = None
+        if self.page_cache_dir:
+            # Cached pages are patient text - private to the service user and bounded
+            try:
+                make_private_dir(self.page_cache_dir)
+                self.page_cache_pruner = shared_pruner(self.page_cache_dir, self.page_cache_max_age, self.page_cache_max_bytes)
+                self.page_cache_pruner.maybe_prune()
+            except OSError as e:
+                logger.warning(f"OCR page cache directory unavailable: {str(e)}")
+                self.page_cache_dir = None
         
         # Check if OCR dependencies are available
-        if not PYTESSERACT_AVAILABLE and not EASYOCR_AVAILABLE:
+        tesseract_available = PYTESSERACT_AVAILABLE or TESSEROCR_AVAILABLE
+        if not tesseract_available and not EASYOCR_AVAILABLE:
             logger.warning("No OCR engines available. OCR functionality will be disabled.")
             self.ocr_available = False
             return
@@ -52,9 +106,15 @@ class OCRService:
         self.ocr_available = True
         
         # Configure Tesseract
-        if self.ocr_engine == "tesseract" and PYTESSERACT_AVAILABLE:
-            pytesseract.pytesseract.tesseract_cmd = self.tesseract_cmd
-        elif self.ocr_engine == "tesseract" and not PYTESSERACT_AVAILABLE:
+        if self.ocr_engine == "tesseract" and tesseract_available:
+            if PYTESSERACT_AVAILABLE:
+                pytesseract.pytesseract.tesseract_cmd = self.tesseract_cmd
+            if self.max_workers > 1:
+                # Pages are OCR'd by several Tesseract processes at once; each would
+                # otherwise start an OpenMP thread per core and oversubscribe the CPU.
+                # Not set for EasyOCR, whose torch model relies on OpenMP threads.
+                os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+        elif self.ocr_engine == "tesseract" and not tesseract_available:
             logger.warning("Tesseract not available, falling back to EasyOCR")
             self.ocr_engine = "easyocr"
         
@@ -66,16 +126,22 @@ class OCRService:
             logger.warning("EasyOCR not available, falling back to Tesseract")
             self.ocr_engine = "tesseract"
     
-    def extract_text_from_pdf(self, pdf_path: str) -> Dict[str, Any]:
+    def extract_text_from_pdf(self, pdf_path: str, include_boxes: bool = False) -> Dict[str, Any]:
         """
         Extract text from PDF using OCR
         
         Args:
             pdf_path: Path to the PDF file
+            include_boxes: Add each page's kept words as (x, y, w, h, text, confidence)
             
         Returns:
             Dictionary containing extracted text, confidence, and metadata
         """
+        # Born-digital PDFs already carry their text - no rendering or OCR needed
+        text_layer_pages = self._extract_text_layer(pdf_path)
+        if text_layer_pages is not None:
+            return self.combine_page_results(text_layer_pages)
+        
         if not self.ocr_available:
             return {
                 'text': 'OCR functionality not available - missing dependencies (pytesseract, easyocr, PIL, pdf2image)',
@@ -97,83 +163,258 @@ class OCRService:
             }
         
         try:
-            # Convert PDF to images
-            images = convert_from_path(pdf_path, dpi=300)
+            dpi, page_results = self._process_first_page(pdf_path, include_boxes)
             
-            all_text = []
-            all_confidences = []
-            page_results = []
+            # The rest of the pages are rendered one at a time by whichever
+            # worker OCRs them, so only the pages in progress are in memory
+            remaining = range(2, self._page_count(pdf_path) + 1) if page_results else range(0)
             
-            for page_num, image in enumerate(images, 1):
-                logger.info(f"Processing page {page_num} of {len(images)}")
-                
-                # Save image temporarily
-                with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
-                    image.save(temp_file.name, 'PNG')
-                    temp_image_path = temp_file.name
-                
-                try:
-                    # Extract text based on OCR engine
-                    if self.ocr_engine == "tesseract":
-                        page_result = self._extract_with_tesseract(temp_image_path)
-                    else:
-                        page_result = self._extract_with_easyocr(temp_image_path)
-                    
-                    page_result['page_number'] = page_num
-                    page_results.append(page_result)
-                    
-                    all_text.append(page_result['text'])
-                    all_confidences.append(page_result['confidence'])
-                    
-                finally:
-                    # Clean up temporary file
-                    os.unlink(temp_image_path)
+            def process(page_num):
+                return self._render_and_process_page(pdf_path, page_num, dpi, include_boxes)
             
-            # Calculate overall confidence
-            overall_confidence = sum(all_confidences) / len(all_confidences) if all_confidences else 0
+            if self.ocr_engine == "tesseract" and self.max_workers > 1 and len(remaining) > 1:
+                # Each Tesseract call is a separate process, so pages OCR in
+                # parallel with the threads just waiting on them
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(remaining))) as executor:
+                    page_results.extend(executor.map(process, remaining))
+            else:
+                # EasyOCR's torch model already uses every core for one page
+                page_results.extend(map(process, remaining))
             
-            return {
-                'text': '\n\n--- PAGE BREAK ---\n\n'.join(all_text),
-                'confidence': overall_confidence,
-                'engine': self.ocr_engine,
-                'page_count': len(images),
-                'page_results': page_results
-            }
+            return self.combine_page_results(page_results)
             
         except Exception as e:
             logger.error(f"Error extracting text from PDF: {str(e)}")
             raise Exception(f"OCR processing failed: {str(e)}")
     
-    def _extract_with_tesseract(self, image_path: str) -> Dict[str, Any]:
-        """Extract text using Tesseract OCR"""
+    async def iter_pages(self, pdf_path: str, include_boxes: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """
+        OCR a PDF page by page, yielding each page result in page order as
+        soon as it is ready, so work on early pages (LLM extraction) can start
+        while later pages are still being OCR'd. combine_page_results() turns
+        the yielded pages into the extract_text_from_pdf() result.
+        """
+        text_layer_pages = await asyncio.to_thread(self._extract_text_layer, pdf_path)
+        if text_layer_pages is not None:
+            for page_result in text_layer_pages:
+                yield page_result
+            return
+        
+        if not self.ocr_available or not PDF2IMAGE_AVAILABLE:
+            logger.warning("OCR or pdf2image not available - no pages to process")
+            return
+        
+        loop = asyncio.get_running_loop()
+        # EasyOCR's torch model already uses every core for one page
+        workers = self.max_workers if self.ocr_engine == "tesseract" else 1
+        executor = ThreadPoolExecutor(max_workers=max(1, workers))
         try:
-            # Get text with confidence data
-            data = pytesseract.image_to_data(
-                image_path, 
-                output_type=pytesseract.Output.DICT,
-                config='--psm 6'  # Assume uniform block of text
-            )
+            dpi, page_results = await loop.run_in_executor(executor, self._process_first_page, pdf_path, include_boxes)
+            for page_result in page_results:
+                yield page_result
+            if not page_results:
+                return
             
-            # Extract text and calculate confidence
-            text_parts = []
-            confidences = []
-            
-            for i, conf in enumerate(data['conf']):
-                if int(conf) > 0:  # Only include confident detections
-                    word = data['text'][i].strip()
-                    if word:
-                        text_parts.append(word)
-                        confidences.append(int(conf))
+            page_count = await loop.run_in_executor(executor, self._page_count, pdf_path)
+            pending = [
+                loop.run_in_executor(executor, self._render_and_process_page, pdf_path, page_num, dpi, include_boxes)
+                for page_num in range(2, page_count + 1)
+            ]
+            for page_future in pending:
+                yield await page_future
+        except Exception as e:
+            logger.error(f"Error extracting text from PDF: {str(e)}")
+            raise Exception(f"OCR processing failed: {str(e)}")
+        finally:
+            # Pages nobody will read any more (consumer stopped early) aren't OCR'd
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def combine_page_results(self, page_results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Document-level OCR result from the per-page results"""
+        all_text = [page_result['text'] for page_result in page_results]
+        all_confidences = [page_result['confidence'] for page_result in page_results]
+        
+        # Calculate overall confidence
+        overall_confidence = sum(all_confidences) / len(all_confidences) if all_confidences else 0
+        
+        return {
+            'text': '\n\n--- PAGE BREAK ---\n\n'.join(all_text),
+            'confidence': overall_confidence,
+            # Text-layer pages say so; a document is either all text layer or all OCR
+            'engine': page_results[0].get('engine', self.ocr_engine) if page_results else self.ocr_engine,
+            'page_count': len(page_results),
+            'page_results': page_results
+        }
+    
+    def _extract_text_layer(self, pdf_path: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Page results from the PDF's embedded text, or None when the PDF is a
+        scan - too few characters per page, or too many pages without text
+        """
+        if not PYMUPDF_AVAILABLE or self.text_layer_min_chars <= 0:
+            return None
+        try:
+            with fitz.open(pdf_path) as doc:
+                texts = [page.get_text().strip() for page in doc]
+        except Exception as e:
+            logger.warning(f"Could not read PDF text layer, falling back to OCR: {str(e)}")
+            return None
+        
+        if not texts:
+            return None
+        if sum(len(text) for text in texts) / len(texts) < self.text_layer_min_chars:
+            return None
+        if sum(1 for text in texts if text) / len(texts) < self.text_layer_min_coverage:
+            return None
+        
+        logger.info(f"Using the embedded text layer of {len(texts)} pages - skipping OCR")
+        return [
+            {
+                'text': text,
+                'confidence': 1.0,
+                'word_count': len(text.split()),
+                'engine': 'text_layer',
+                'page_number': page_num
+            }
+            for page_num, text in enumerate(texts, 1)
+        ]
+    
+    def _process_first_page(self, pdf_path: str, include_boxes: bool = False) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        Render and OCR the first page alone, so its text size can pick the DPI
+        for the rest of the document. Returns (dpi, first page results).
+        """
+        dpi = self.dpi
+        images = self._render_pages(pdf_path, dpi, last_page=1)
+        page_results = [self._process_page(1, image, include_boxes) for image in images]
+        
+        median_height = page_results[0].get('text_height', 0) if page_results else 0
+        if dpi < self.high_dpi and 0 < median_height < self.min_text_height:
+            logger.info(f"Small text ({median_height}px at {dpi} DPI) - rendering at {self.high_dpi} DPI")
+            dpi = self.high_dpi
+            images = self._render_pages(pdf_path, dpi, last_page=1)
+            page_results = [self._process_page(1, image, include_boxes) for image in images]
+        
+        return dpi, page_results
+    
+    def _render_pages(self, pdf_path: str, dpi: int, first_page: int = None, last_page: int = None) -> List[Any]:
+        """
+        Rasterize a range of PDF pages. Grayscale, since both engines binarize
+        anyway and a third of the pixel data means less work per page.
+        """
+        return convert_from_path(
+            pdf_path,
+            dpi=dpi,
+            grayscale=True,
+            first_page=first_page,
+            last_page=last_page,
+            thread_count=self.max_workers
+        )
+    
+    def _page_count(self, pdf_path: str) -> int:
+        """Number of pages in the PDF, without rendering any"""
+        return pdfinfo_from_path(pdf_path)["Pages"]
+    
+    def _render_and_process_page(self, pdf_path: str, page_num: int, dpi: int, include_boxes: bool = False) -> Dict[str, Any]:
+        """Render a single page and OCR it"""
+        image = self._render_pages(pdf_path, dpi, first_page=page_num, last_page=page_num)[0]
+        return self._process_page(page_num, image, include_boxes)
+    
+    def _process_page(self, page_num: int, image, include_boxes: bool = False) -> Dict[str, Any]:
+        """OCR one page image with the configured engine"""
+        logger.info(f"Processing page {page_num}")
+        
+        # Hashing the pixels takes milliseconds, OCR takes a second or more
+        cache_path = self._page_cache_path(image, include_boxes)
+        page_result = self._get_cached_page(cache_path) if cache_path else None
+        if page_result is not None:
+            logger.info(f"Page {page_num} found in OCR page cache")
+        else:
+            # Pages go to the engine as in-memory images - no PNG
+            # encode/decode round trip through a temp file per page
+            if self.ocr_engine == "tesseract":
+                page_result = self._extract_with_tesseract(image, include_boxes)
+            else:
+                page_result = self._extract_with_easyocr(image, include_boxes)
+            if cache_path and 'error' not in page_result:
+                self._cache_page(cache_path, page_result)
+        
+        page_result['page_number'] = page_num
+        return page_result
+    
+    def _page_cache_path(self, image, include_boxes: bool = False) -> Optional[str]:
+        """Cache file for a page image's OCR result - keyed by its pixels and the engine"""
+        if not self.page_cache_dir:
+            return None
+        digest = hashlib.blake2b(image.tobytes(), digest_size=16)
+        digest.update(f"{self.ocr_engine}:{image.mode}:{image.size}:{include_boxes}".encode("utf-8"))
+        key = digest.hexdigest()
+        return os.path.join(self.page_cache_dir, key[:2], f"{key}.json")
+    
+    def _get_cached_page(self, cache_path: str) -> Optional[Dict[str, Any]]:
+        # Expired pages are deleted on sight, not only by the next prune
+        if is_expired(cache_path, self.page_cache_max_age):
+            return None
+        try:
+            with open(cache_path, "rb") as f:
+                page_result = orjson.loads(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to read OCR page cache: {str(e)}")
+            return None
+        if 'boxes' in page_result:
+            page_result['boxes'] = [tuple(box) for box in page_result['boxes']]
+        return page_result
+    
+    def _cache_page(self, cache_path: str, page_result: Dict[str, Any]):
+        try:
+            make_private_dir(os.path.dirname(cache_path))
+            write_file_atomic(cache_path, orjson.dumps(page_result))
+        except OSError as e:
+            logger.warning(f"Failed to write OCR page cache: {str(e)}")
+            return
+        self.page_cache_pruner.maybe_prune()
+    
+    def _extract_with_tesseract(self, image, include_boxes: bool = False) -> Dict[str, Any]:
+        """Extract text from a page image using Tesseract OCR"""
+        try:
+            if TESSEROCR_AVAILABLE:
+                words = self._tesserocr_words(image)
+            else:
+                # Get text with confidence data
+                data = pytesseract.image_to_data(
+                    image,
+                    output_type=pytesseract.Output.DICT,
+                    config='--psm 6'  # Assume uniform block of text
+                )
+                
+                # Extract text and calculate confidence - one pass over the word
+                # columns, only confident, non-empty detections
+                words = [
+                    (word, conf, box) for word, conf, box in zip(
+                        map(str.strip, data['text']),
+                        map(int, data['conf']),
+                        zip(data['left'], data['top'], data['width'], data['height'])
+                    )
+                    if conf > 0 and word
+                ]
+            text_parts = [word for word, conf, box in words]
             
             text = ' '.join(text_parts)
-            avg_confidence = sum(confidences) / len(confidences) if confidences else 0
+            avg_confidence = sum(conf for word, conf, box in words) / len(words) if words else 0
             
-            return {
+            # Only the kept words leave here, not the full per-element result
+            # data, which would otherwise be held for every page of the PDF
+            page_result = {
                 'text': text,
                 'confidence': avg_confidence / 100.0,  # Convert to 0-1 scale
                 'word_count': len(text_parts),
-                'raw_data': data
+                'text_height': self._median_height([box[3] for word, conf, box in words])
             }
+            if include_boxes:
+                page_result['boxes'] = [(*box, word, conf / 100.0) for word, conf, box in words]
+            return page_result
             
         except Exception as e:
             logger.error(f"Tesseract OCR error: {str(e)}")
@@ -184,28 +425,59 @@ class OCRService:
                 'error': str(e)
             }
     
-    def _extract_with_easyocr(self, image_path: str) -> Dict[str, Any]:
-        """Extract text using EasyOCR"""
+    def _tesserocr_words(self, image) -> List[Tuple[str, float, Tuple[int, int, int, int]]]:
+        """(word, confidence, (left, top, width, height)) of the confident, non-empty words, via tesserocr"""
+        with _tesserocr_apis_lock:
+            api = _tesserocr_apis.pop() if _tesserocr_apis else None
+        if api is None:
+            api = PyTessBaseAPI(psm=PSM.SINGLE_BLOCK)  # Same as --psm 6
+        
+        try:
+            api.SetImage(image)
+            api.Recognize()
+            words = []
+            for word_iterator in iterate_level(api.GetIterator(), RIL.WORD):
+                word = (word_iterator.GetUTF8Text(RIL.WORD) or '').strip()
+                conf = word_iterator.Confidence(RIL.WORD)
+                bounding_box = word_iterator.BoundingBox(RIL.WORD)
+                if conf > 0 and word and bounding_box:
+                    left, top, right, bottom = bounding_box
+                    words.append((word, conf, (left, top, right - left, bottom - top)))
+            return words
+        finally:
+            api.Clear()
+            with _tesserocr_apis_lock:
+                _tesserocr_apis.append(api)
+    
+    def _extract_with_easyocr(self, image, include_boxes: bool = False) -> Dict[str, Any]:
+        """Extract text from a page image using EasyOCR"""
         try:
-            results = self.easyocr_reader.readtext(image_path)
+            results = self.easyocr_reader.readtext(np.asarray(image))
             
             text_parts = []
             confidences = []
+            boxes = []
             
             for (bbox, text, confidence) in results:
                 if confidence > 0.5:  # Only include confident detections
                     text_parts.append(text)
                     confidences.append(confidence)
+                    xs = [point[0] for point in bbox]
+                    ys = [point[1] for point in bbox]
+                    boxes.append((int(min(xs)), int(min(ys)), int(max(xs) - min(xs)), int(max(ys) - min(ys)), text, confidence))
             
             text = ' '.join(text_parts)
             avg_confidence = sum(confidences) / len(confidences) if confidences else 0
             
-            return {
+            page_result = {
                 'text': text,
                 'confidence': avg_confidence,
                 'word_count': len(text_parts),
-                'raw_results': results
+                'text_height': self._median_height([box[3] for box in boxes])
             }
+            if include_boxes:
+                page_result['boxes'] = boxes
+            return page_result
             
         except Exception as e:
             logger.error(f"EasyOCR error: {str(e)}")
@@ -216,6 +488,12 @@ class OCRService:
                 'error': str(e)
             }
     
+    def _median_height(self, heights: List[int]) -> int:
+        """Median of the recognized words' heights in pixels, 0 if none"""
+        if not heights:
+            return 0
+        return sorted(heights)[len(heights) // 2]
+    
     def preprocess_text(self, text: str) -> str:
         """
         Preprocess OCR text for better LLM processing
@@ -229,25 +507,11 @@ class OCRService:
         if not text:
             return ""
         
-        # Basic text cleaning
-        lines = text.split('\n')
-        cleaned_lines = []
-        
-        for line in lines:
-            line = line.strip()
-            if line and len(line) > 1:  # Skip very short lines
-                # Remove excessive whitespace
-                line = ' '.join(line.split())
-                cleaned_lines.append(line)
-        
-        # Join lines with proper spacing
-        cleaned_text = '\n'.join(cleaned_lines)
-        
-        # Remove excessive line breaks
-        while '\n\n\n' in cleaned_text:
-            cleaned_text = cleaned_text.replace('\n\n\n', '\n\n')
-        
-        return cleaned_text
+        # Collapse whitespace runs within each line and skip blank or very
+        # short lines - with no blank lines kept there are no runs of line
+        # breaks left to squeeze afterwards
+        cleaned_lines = (' '.join(line.split()) for line in text.split('\n'))
+        return '\n'.join(line for line in cleaned_lines if len(line) > 1)
     
     def chunk_text(self, text: str, max_chunk_size: int = 4000) -> List[str]:
         """
@@ -264,35 +528,42 @@ class OCRService:
             return [text]
         
         chunks = []
-        current_chunk = ""
+        # Pieces of the chunk being built and their total length - joined once
+        # per chunk instead of re-copying a growing string on every append
+        current_parts = []
+        current_len = 0
         
         # Split by paragraphs first
         paragraphs = text.split('\n\n')
         
         for paragraph in paragraphs:
             # If adding this paragraph would exceed limit
-            if len(current_chunk) + len(paragraph) + 2 > max_chunk_size:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                    current_chunk = paragraph
+            if current_len + len(paragraph) + 2 > max_chunk_size:
+                if current_len:
+                    chunks.append(''.join(current_parts).strip())
+                    current_parts, current_len = [paragraph], len(paragraph)
                 else:
                     # Paragraph itself is too long, split by sentences
                     sentences = paragraph.split('. ')
                     for sentence in sentences:
-                        if len(current_chunk) + len(sentence) + 2 > max_chunk_size:
-                            if current_chunk:
-                                chunks.append(current_chunk.strip())
-                                current_chunk = sentence
+                        if current_len + len(sentence) + 2 > max_chunk_size:
+                            if current_len:
+                                chunks.append(''.join(current_parts).strip())
+                                current_parts, current_len = [sentence], len(sentence)
                             else:
                                 # Even sentence is too long, force split
                                 chunks.append(sentence[:max_chunk_size])
-                                current_chunk = sentence[max_chunk_size:]
+                                remainder = sentence[max_chunk_size:]
+                                current_parts, current_len = [remainder], len(remainder)
                         else:
-                            current_chunk += sentence + '. '
+                            current_parts += (sentence, '. ')
+                            current_len += len(sentence) + 2
             else:
-                current_chunk += paragraph + '\n\n'
+                current_parts += (paragraph, '\n\n')
+                current_len += len(paragraph) + 2
         
-        if current_chunk.strip():
-            chunks.append(current_chunk.strip())
+        current_chunk = ''.join(current_parts).strip()
+        if current_chunk:
+            chunks.append(current_chunk)
         
         return chunks
\ No newline at end of file
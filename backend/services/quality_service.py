@@ -4,7 +4,6 @@ import cv2
 import numpy as np
 from PIL import Image
 import pytesseract
-import os
 from pdf2image import convert_from_path
 
 logger = logging.getLogger(__name__)
@@ -30,23 +29,20 @@ class DocumentQualityService:
         try:
             # Convert PDF to images if necessary
             if file_path.lower().endswith('.pdf'):
-                images = convert_from_path(file_path, dpi=200, first_page=1, last_page=1)
+                # Grayscale - both assessments only look at luminance
+                images = convert_from_path(file_path, dpi=200, grayscale=True, first_page=1, last_page=1)
                 if not images:
                     raise ValueError("Could not convert PDF to image")
                 image = images[0]
-                # Save temporary image for analysis
-                temp_path = file_path.replace('.pdf', '_temp.png')
-                image.save(temp_path)
-                image_path = temp_path
             else:
-                image_path = file_path
                 image = Image.open(file_path)
             
-            # Assess image quality
-            quality_metrics = self._assess_image_quality(image_path, image)
+            # Both assessments work on the in-memory image - no temporary PNG
+            # written next to the upload and decoded again by OpenCV
+            quality_metrics = self._assess_image_quality(image)
             
             # Assess text quality
-            text_metrics = self._assess_text_quality(image_path)
+            text_metrics = self._assess_text_quality(image)
             
             # Calculate overall quality score
             overall_score = self._calculate_overall_score(quality_metrics, text_metrics)
@@ -54,10 +50,6 @@ class DocumentQualityService:
             # Generate recommendations
             recommendations = self._generate_recommendations(quality_metrics, text_metrics, overall_score)
             
-            # Clean up temporary file
-            if file_path.lower().endswith('.pdf') and os.path.exists(temp_path):
-                os.remove(temp_path)
-            
             return {
                 "image_dpi": quality_metrics.get("dpi", 0),
                 "image_clarity_score": quality_metrics.get("clarity_score", 0.0),
@@ -83,21 +75,15 @@ class DocumentQualityService:
                 "detailed_metrics": {}
             }
     
-    def _assess_image_quality(self, image_path: str, pil_image: Image.Image) -> Dict[str, Any]:
+    def _assess_image_quality(self, pil_image: Image.Image) -> Dict[str, Any]:
         """Assess image-specific quality metrics"""
         try:
             # Get image dimensions and DPI
             width, height = pil_image.size
             dpi = pil_image.info.get('dpi', (72, 72))[0] if 'dpi' in pil_image.info else 72
             
-            # Load image with OpenCV for analysis
-            cv_image = cv2.imread(image_path)
-            if cv_image is None:
-                # Try converting PIL to OpenCV
-                cv_image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-            
-            # Convert to grayscale
-            gray = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
+            # Grayscale pixels for OpenCV, straight from the PIL image (any mode)
+            gray = np.asarray(pil_image.convert("L"))
             
             # Calculate clarity using Laplacian variance
             clarity_score = cv2.Laplacian(gray, cv2.CV_64F).var()
@@ -139,17 +125,20 @@ class DocumentQualityService:
                 "total_pixels": 0
             }
     
-    def _assess_text_quality(self, image_path: str) -> Dict[str, Any]:
+    def _assess_text_quality(self, image: Image.Image) -> Dict[str, Any]:
         """Assess text-specific quality metrics"""
         try:
             # Get OCR confidence data
-            ocr_data = pytesseract.image_to_data(image_path, output_type=pytesseract.Output.DICT)
+            ocr_data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
             
-            # Calculate text density and confidence
-            confidences = [int(conf) for conf in ocr_data['conf'] if int(conf) > 0]
-            text_blocks = [text for text in ocr_data['text'] if text.strip()]
+            # Calculate text density and confidence - the per-word columns as
+            # arrays, so each metric is one vectorized reduction
+            conf = np.asarray(ocr_data['conf'], dtype=np.float64).astype(np.int32)  # Truncates like int()
+            detected = conf > 0
+            confidences = conf[detected]
+            text_blocks_count = sum(1 for text in ocr_data['text'] if text.strip())
             
-            if not confidences:
+            if not confidences.size:
                 return {
                     "text_density": 0.0,
                     "avg_confidence": 0.0,
@@ -157,32 +146,23 @@ class DocumentQualityService:
                     "readable_text_ratio": 0.0
                 }
             
-            avg_confidence = sum(confidences) / len(confidences)
-            text_density = len(text_blocks) / max(len(ocr_data['text']), 1)
+            avg_confidence = float(confidences.mean())
+            text_density = text_blocks_count / max(len(ocr_data['text']), 1)
             
             # Calculate readable text ratio (confidence > 60)
-            readable_blocks = [conf for conf in confidences if conf > 60]
-            readable_ratio = len(readable_blocks) / len(confidences) if confidences else 0.0
+            readable_ratio = int(np.count_nonzero(confidences > 60)) / confidences.size
             
             # Estimate text coverage area
-            total_area = 0
-            text_area = 0
-            
-            for i, conf in enumerate(ocr_data['conf']):
-                if int(conf) > 0:
-                    w = int(ocr_data['width'][i])
-                    h = int(ocr_data['height'][i])
-                    area = w * h
-                    total_area += area
-                    if int(conf) > 30:  # Consider as text if confidence > 30
-                        text_area += area
+            area = np.asarray(ocr_data['width'], dtype=np.int64) * np.asarray(ocr_data['height'], dtype=np.int64)
+            total_area = int(area[detected].sum())
+            text_area = int(area[conf > 30].sum())  # Consider as text if confidence > 30
             
             text_coverage = text_area / max(total_area, 1)
             
             return {
                 "text_density": text_density,
                 "avg_confidence": avg_confidence / 100.0,  # Normalize to 0-1
-                "text_blocks_count": len(text_blocks),
+                "text_blocks_count": text_blocks_count,
                 "readable_text_ratio": readable_ratio,
                 "text_coverage": text_coverage
             }
@@ -0,0 +1,242 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+import hashlib
+import orjson
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Documents are fingerprinted on their wording, not their values - numbers of
+# the same length normalize to the same token
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_DIGIT_PATTERN = re.compile(r"\d")
+
+# Value shape pieces: letter runs, digit runs, whitespace, anything else
+_VALUE_PIECES = re.compile(r"([A-Za-z'-]+)|(\d+)|([ \t]+)|(.)", re.DOTALL)
+
+# 64-bit fingerprints split into 4 bands - two fingerprints within Hamming
+# distance 3 always share at least one band, so bands work as the index
+_BANDS = 4
+_BAND_BITS = 16
+_MAX_LABEL_CHARS = 40
+
+
+def simhash(text: str) -> int:
+    """64-bit similarity hash of the normalized tokens of a text"""
+    tokens = Counter(_TOKEN_PATTERN.findall(_DIGIT_PATTERN.sub("0", text.lower())))
+    weights = [0] * 64
+    for token, count in tokens.items():
+        token_hash = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += count if token_hash >> bit & 1 else -count
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def _bands(fingerprint: int) -> List[int]:
+    mask = (1 << _BAND_BITS) - 1
+    return [fingerprint >> (band * _BAND_BITS) & mask for band in range(_BANDS)]
+
+
+def _value_shape(value: str) -> str:
+    """Regex matching values shaped like this one - same runs of letters, digits and punctuation"""
+    parts = []
+    for letters, digits, spaces, other in _VALUE_PIECES.findall(value):
+        if letters:
+            parts.append(r"[A-Za-z'-]+")
+        elif digits:
+            parts.append(r"\d+")
+        elif spaces:
+            parts.append(r"[ \t]+")
+        else:
+            parts.append(re.escape(other))
+    return "".join(parts)
+
+
+def _signed(fingerprint: int) -> int:
+    """SQLite integers are signed 64-bit"""
+    return fingerprint - 2 ** 64 if fingerprint >= 2 ** 63 else fingerprint
+
+
+class TemplateCache:
+    """
+    Extraction recipes for recurring document templates (payer denial letters,
+    authorization forms). After an LLM extraction, each extracted value is
+    turned into a regex anchored on the template text around it; a later
+    document with a near-identical fingerprint is extracted by running those
+    regexes instead of calling the LLM. A recipe that doesn't fully apply is
+    a miss, so drifted templates fall back to the LLM.
+    
+    Recipes are stored per extraction schema (the caller's hash of the field
+    set and prompt version), so changing the fields sends every template back
+    to the LLM. Recipes unused for max_age seconds are dropped, and at most
+    max_entries are kept, least recently used going first.
+    """
+    
+    def __init__(self, path: str, max_distance: int = 3, max_entries: int = 1000, max_age: float = 30 * 86400):
+        self.path = path
+        self.max_distance = min(max_distance, _BANDS - 1)  # Band index only guarantees recall up to 3
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        
+        # A cache file from before recipes were tied to a schema can't be
+        # trusted - start it over
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(templates)")}
+        if columns and "schema" not in columns:
+            self.connection.execute("DROP TABLE templates")
+        
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS templates ("
+            "id INTEGER PRIMARY KEY, schema TEXT NOT NULL, fingerprint INTEGER NOT NULL, "
+            + ", ".join(f"band{band} INTEGER NOT NULL" for band in range(_BANDS)) +
+            ", recipe BLOB NOT NULL, hits INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, "
+            "last_used_at REAL NOT NULL)"
+        )
+        for band in range(_BANDS):
+            self.connection.execute(f"CREATE INDEX IF NOT EXISTS templates_band{band} ON templates (band{band}, schema)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS templates_last_used ON templates (last_used_at)")
+        self.connection.commit()
+    
+    def _candidates(self, fingerprint: int, schema: str) -> List[Tuple[int, int, bytes]]:
+        """(distance, template id, recipe) of the schema's templates within max_distance, closest first"""
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id, fingerprint, recipe FROM templates WHERE schema = ? AND ("
+                + " OR ".join(f"band{band} = ?" for band in range(_BANDS)) + ")",
+                [schema, *_bands(fingerprint)]
+            ).fetchall()
+        
+        candidates = sorted(
+            (bin((stored & (2 ** 64 - 1)) ^ fingerprint).count("1"), template_id, recipe)
+            for template_id, stored, recipe in rows
+        )
+        return [candidate for candidate in candidates if candidate[0] <= self.max_distance]
+    
+    def lookup(self, ocr_text: str, schema: str) -> Optional[Tuple[int, Dict[str, str]]]:
+        """(template id, extracted values) from the closest template whose recipe applies, or None"""
+        for distance, template_id, recipe in self._candidates(simhash(ocr_text), schema):
+            values = self._apply_recipe(orjson.loads(recipe), ocr_text)
+            if values is not None:
+                with self.lock:
+                    self.connection.execute(
+                        "UPDATE templates SET hits = hits + 1, last_used_at = ? WHERE id = ?",
+                        (time.time(), template_id)
+                    )
+                    self.connection.commit()
+                logger.info(f"Template {template_id} matched at distance {distance} - skipping LLM call")
+                return template_id, values
+        return None
+    
+    def learn(self, ocr_text: str, extracted: Dict[str, Any], schema: str) -> Optional[int]:
+        """Store a recipe for this document's template, if every extracted value can be located.
+        A known template of the same schema (whose recipe just failed to apply) is updated in place."""
+        recipe = self._build_recipe(ocr_text, extracted)
+        if recipe is None:
+            return None
+        
+        fingerprint = simhash(ocr_text)
+        candidates = self._candidates(fingerprint, schema)
+        now = time.time()
+        with self.lock:
+            if candidates:
+                template_id = candidates[0][1]
+                self.connection.execute(
+                    "UPDATE templates SET fingerprint = ?, "
+                    + ", ".join(f"band{band} = ?" for band in range(_BANDS)) +
+                    ", recipe = ?, last_used_at = ? WHERE id = ?",
+                    [_signed(fingerprint), *_bands(fingerprint), orjson.dumps(recipe), now, template_id]
+                )
+            else:
+                template_id = self.connection.execute(
+                    "INSERT INTO templates (schema, fingerprint, "
+                    + ", ".join(f"band{band}" for band in range(_BANDS)) +
+                    ", recipe, created_at, last_used_at) VALUES (?, ?" + ", ?" * (_BANDS + 3) + ")",
+                    [schema, _signed(fingerprint), *_bands(fingerprint), orjson.dumps(recipe), now, now]
+                ).lastrowid
+                self._prune(now)
+            self.connection.commit()
+        return template_id
+    
+    def _prune(self, now: float):
+        """Drop recipes unused for max_age, then the least recently used beyond max_entries (lock held)"""
+        self.connection.execute("DELETE FROM templates WHERE last_used_at < ?", (now - self.max_age,))
+        self.connection.execute(
+            "DELETE FROM templates WHERE id NOT IN "
+            "(SELECT id FROM templates ORDER BY last_used_at DESC LIMIT ?)",
+            (self.max_entries,)
+        )
+    
+    def _build_recipe(self, ocr_text: str, extracted: Dict[str, Any]) -> Optional[Dict[str, str]]:
+        """Field -> anchored regex for each extracted value, or None if any value can't be anchored"""
+        values = {}
+        for key, value in extracted.items():
+            if value is None or (isinstance(value, str) and not value.strip()):
+                continue
+            if not isinstance(value, str):
+                return None
+            values[key] = value.strip()
+        if not values:
+            return None
+        
+        recipe = {}
+        for key, value in values.items():
+            pattern = self._value_pattern(ocr_text, value, [other for other in values.values() if other != value])
+            if pattern is None:
+                return None
+            recipe[key] = pattern
+        
+        # A recipe is only kept if it reproduces this document's extraction
+        if self._apply_recipe(recipe, ocr_text) != values:
+            return None
+        return recipe
+    
+    def _value_pattern(self, ocr_text: str, value: str, other_values: List[str]) -> Optional[str]:
+        """Regex capturing the value between the template text before and after it"""
+        position = ocr_text.find(value)
+        if position == -1:
+            return None
+        
+        # Label: the text before the value on its line, cut after any other
+        # extracted value since that part differs between documents
+        line_start = ocr_text.rfind("\n", 0, position) + 1
+        label = ocr_text[max(line_start, position - _MAX_LABEL_CHARS):position]
+        for other in other_values:
+            cut = label.rfind(other)
+            if cut != -1:
+                label = label[cut + len(other):]
+        separator = label[len(label.rstrip(" \t:#")):]
+        label = label.rstrip(" \t:#").lstrip()
+        if not re.search(r"[A-Za-z]", label):
+            return None
+        
+        # The value must be followed by what followed it here - end of line or
+        # the next word - so a longer value can't be captured partially
+        end = position + len(value)
+        following = re.match(r"[ \t]*(\S{1,10})?", ocr_text[end:])
+        next_word = following.group(1) if following else None
+        if next_word is None:
+            suffix = r"(?=[ \t]*(?:\n|$))"
+        elif any(next_word in other for other in other_values):
+            # Followed by another value - no fixed text to end the match on
+            return None
+        else:
+            suffix = r"(?=[ \t]*" + re.escape(next_word) + ")"
+        
+        separator_pattern = r"[ \t:#]*" if separator else ""
+        return re.escape(label) + separator_pattern + "(" + _value_shape(value) + ")" + suffix
+    
+    def _apply_recipe(self, recipe: Dict[str, str], ocr_text: str) -> Optional[Dict[str, str]]:
+        """Values captured by every recipe pattern, or None if any pattern doesn't match"""
+        values = {}
+        for key, pattern in recipe.items():
+            match = re.search(pattern, ocr_text)
+            if match is None:
+                return None
+            values[key] = match.group(1)
+        return values
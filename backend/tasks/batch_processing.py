@@ -8,6 +8,7 @@ from tasks.document_processing import process_document, split_document
 from datetime import datetime
 import os
 import traceback
+import fitz  # PyMuPDF
 
 logger = logging.getLogger(__name__)
 
@@ -317,6 +318,13 @@ def should_split_document(file_path: str) -> bool:
     Determine if a document should be split based on file characteristics
     """
     try:
+        # A single-page PDF can never be split; the page count comes from the
+        # PDF structure without rendering anything, so don't queue a split task
+        if file_path.lower().endswith('.pdf'):
+            with fitz.open(file_path) as pdf:
+                if pdf.page_count <= 1:
+                    return False
+        
         # Simple heuristic: split if file is large (>5MB) or has many pages
         file_size = os.path.getsize(file_path)
         
@@ -324,7 +332,6 @@ def should_split_document(file_path: str) -> bool:
             return True
         
         # Could add more sophisticated logic here:
-        # - Check number of pages in PDF
         # - Analyze document structure
         # - Look for page break indicators
         
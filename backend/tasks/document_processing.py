@@ -98,7 +98,7 @@ def process_document(self, document_id: int, batch_id: Optional[int] = None) ->
         )
         
         llm_service = LLMService(db)
-        extraction_result = llm_service.extract_fields(ocr_result["text"])
+        extraction_result = llm_service.extract_fields(ocr_result["text"], ocr_confidence=ocr_result["confidence"])
         
         # Update document with extraction results
         document.extracted_fields = extraction_result["extracted_fields"]
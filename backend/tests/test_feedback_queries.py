@@ -0,0 +1,95 @@
+"""Statement- and commit-count guards for the feedback reads and writes"""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from database.models import Base, Document, HumanFeedback, ModelPerformance
+from services.field_service import ReinforcementLearningService
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine, expire_on_commit=False)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@contextmanager
+def count_statements(session):
+    """Collects every statement the session's engine executes inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = session.get_bind()
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def add_feedback(db, documents: int, per_document: int):
+    for number in range(documents):
+        document = Document(
+            filename=f"doc{number}.pdf",
+            original_filename=f"doc{number}.pdf",
+            file_path=f"/uploads/doc{number}.pdf",
+            file_size=1,
+            mime_type="application/pdf"
+        )
+        db.add(document)
+        db.flush()
+        for _ in range(per_document):
+            db.add(HumanFeedback(
+                document_id=document.id,
+                field_name="member_id",
+                feedback_type="correction",
+                model_version="v1"
+            ))
+    db.commit()
+    # Nothing may come from the identity map
+    db.expunge_all()
+
+
+def test_feedback_for_training_loads_documents_without_n_plus_one(db):
+    add_feedback(db, documents=5, per_document=4)
+    rl_service = ReinforcementLearningService(db)
+
+    with count_statements(db) as statements:
+        feedback = rl_service.get_feedback_for_training(model_version="v1", limit=100)
+        filenames = {row.document.filename for row in feedback}
+
+    assert len(feedback) == 20
+    assert len(filenames) == 5
+    assert len(statements) <= 2, statements
+
+
+def test_single_feedback_is_one_commit(db):
+    add_feedback(db, documents=1, per_document=0)
+    rl_service = ReinforcementLearningService(db)
+    commits = []
+    event.listen(db, "after_commit", commits.append)
+
+    feedback = rl_service.record_human_feedback(
+        document_id=1,
+        field_name="member_id",
+        original_value="A123",
+        corrected_value="A123",
+        original_confidence=0.9,
+        feedback_type="confirmation",
+        reviewer_id="reviewer",
+        model_version="v1"
+    )
+
+    assert len(commits) == 1
+    assert feedback.id is not None
+    assert feedback.reward_score == 0.9
+    performance = db.query(ModelPerformance).one()
+    assert (performance.total_predictions, performance.correct_predictions) == (1, 1)
@@ -0,0 +1,63 @@
+"""Retention bounds of the file-per-entry cache directories"""
+import os
+import stat
+import time
+
+import pytest
+
+from services.file_cache import DirectoryPruner, is_expired, make_private_dir, write_file_atomic
+
+
+def write_entry(path, size: int, age: float = 0):
+    make_private_dir(os.path.dirname(path))
+    write_file_atomic(path, b"x" * size)
+    written_at = time.time() - age
+    os.utime(path, (written_at, written_at))
+
+
+def test_cache_files_are_private(tmp_path):
+    cache_dir = tmp_path / "cache"
+    cache_dir.mkdir(mode=0o755)
+    make_private_dir(str(cache_dir))
+    write_entry(str(cache_dir / "ab" / "abcd.json"), 10)
+
+    assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(cache_dir / "ab").st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(cache_dir / "ab" / "abcd.json").st_mode) == 0o600
+
+
+def test_failed_write_leaves_no_temporary_file(tmp_path, monkeypatch):
+    def replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", replace)
+    with pytest.raises(OSError):
+        write_file_atomic(str(tmp_path / "entry.json"), b"x")
+    assert os.listdir(tmp_path) == []
+
+
+def test_expired_entry_is_deleted_on_read(tmp_path):
+    path = str(tmp_path / "entry.json")
+    write_entry(path, 10, age=120)
+
+    assert not is_expired(path, max_age=300)
+    assert is_expired(path, max_age=60)
+    assert not os.path.exists(path)
+
+
+def test_prune_drops_expired_entries_and_stale_writes(tmp_path):
+    write_entry(str(tmp_path / "aa" / "old.json"), 10, age=7200)
+    write_entry(str(tmp_path / "aa" / "new.json"), 10, age=10)
+    write_entry(str(tmp_path / "aa" / "abandoned.json.1.2.tmp"), 10, age=7200)
+    write_entry(str(tmp_path / "aa" / "in_progress.json.1.3.tmp"), 10, age=1)
+
+    assert DirectoryPruner(str(tmp_path), max_age=3600, max_bytes=0).prune() == 2
+    assert sorted(os.listdir(tmp_path / "aa")) == ["in_progress.json.1.3.tmp", "new.json"]
+
+
+def test_prune_evicts_oldest_entries_beyond_size_limit(tmp_path):
+    for number in range(5):
+        write_entry(str(tmp_path / "aa" / f"{number}.json"), 100, age=50 - number)
+
+    assert DirectoryPruner(str(tmp_path), max_age=0, max_bytes=250).prune() == 3
+    assert sorted(os.listdir(tmp_path / "aa")) == ["3.json", "4.json"]
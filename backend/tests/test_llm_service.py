@@ -0,0 +1,230 @@
+"""Behaviour of the LLM service's caches, parsers and state machines"""
+import os
+
+import pytest
+
+from services import llm_service as llm_service_module
+from services.llm_service import CircuitOpenError, LLMService, _CircuitBreaker, _DirectoryCache, _StreamingObjectParser
+
+
+@pytest.fixture
+def llm_service(monkeypatch):
+    # Breakers are per process - every test starts with closed circuits
+    monkeypatch.setattr(llm_service_module, "_circuit_breakers", {})
+    return LLMService()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_service_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def cache_files(path):
+    return sorted(filename for _, _, filenames in os.walk(path) for filename in filenames)
+
+
+def test_directory_cache_round_trip(tmp_path):
+    cache = _DirectoryCache(str(tmp_path), max_age=60, max_bytes=0)
+    cache.setex("llm_response:abcdef", 60, b'{"member_id": "123"}')
+
+    assert cache.get("llm_response:abcdef") == b'{"member_id": "123"}'
+    assert cache.get("llm_response:fedcba") is None
+
+
+def test_directory_cache_deletes_expired_entry_on_read(tmp_path):
+    cache = _DirectoryCache(str(tmp_path), max_age=60, max_bytes=0)
+    cache.setex("llm_response:abcdef", -1, b"{}")
+
+    assert cache.get("llm_response:abcdef") is None
+    assert cache_files(tmp_path) == []
+
+
+def test_directory_cache_prune_keeps_size_limit(tmp_path):
+    cache = _DirectoryCache(str(tmp_path), max_age=0, max_bytes=200)
+    for number in range(5):
+        cache.setex(f"llm_response:{number:02d}cafe", 60, b"x" * 50)
+        written_at = 1_000_000_000 + number
+        os.utime(cache._file(f"llm_response:{number:02d}cafe"), (written_at, written_at))
+
+    cache.pruner.prune()
+    assert cache.get("llm_response:00cafe") is None
+    assert cache.get("llm_response:04cafe") is not None
+
+
+def chunk_extraction(fields, confidences, raw_response):
+    return {'extracted_fields': fields, 'confidence_scores': confidences, 'raw_response': raw_response}
+
+
+def test_merged_extraction_keeps_the_result_schema(llm_service):
+    merged = llm_service._merge_extractions(
+        [
+            chunk_extraction({"member_id": "A123", "patient_name": ""}, {"member_id": 0.6}, '{"member_id": "A123"}'),
+            chunk_extraction({"member_id": "A128", "patient_name": "Jane Roe"}, {"member_id": 0.9, "patient_name": 0.8}, '{"member_id": "A128"}')
+        ],
+        required_fields=[], provider="anthropic", model="claude"
+    )
+
+    assert merged['extracted_fields'] == {"member_id": "A128", "patient_name": "Jane Roe"}
+    assert isinstance(merged['raw_response'], str)
+    assert merged['raw_response'].split("\n\n--- CHUNK BREAK ---\n\n") == ['{"member_id": "A123"}', '{"member_id": "A128"}']
+    assert merged['merged_from'] == {'unit': 'chunk', 'count': 2}
+
+
+def test_streaming_parser_emits_each_pair_when_it_closes():
+    parser = _StreamingObjectParser()
+
+    assert parser.feed('```json\n{"member_id": "A1') == []
+    assert parser.feed('23", "address": {"city": "Austin, TX", "zip": [7, 8]}') == [("member_id", "A123")]
+    assert parser.feed(', "note": "said \\"no, thanks\\" }"') == [("address", {"city": "Austin, TX", "zip": [7, 8]})]
+    assert not parser.complete
+    assert parser.feed('}\n```') == [("note", 'said "no, thanks" }')]
+    assert parser.complete
+
+
+def test_streaming_parser_skips_a_malformed_pair():
+    parser = _StreamingObjectParser()
+
+    assert parser.feed('{"a": 1, "b": oops, "c": 3}') == [("a", 1), ("c", 3)]
+
+
+def test_circuit_opens_after_consecutive_failures(clock):
+    breaker = _CircuitBreaker(fail_max=2, reset_timeout=30)
+
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+
+def test_half_open_circuit_lets_one_trial_through(clock):
+    breaker = _CircuitBreaker(fail_max=1, reset_timeout=30)
+    breaker.record_failure()
+
+    clock[0] += 30
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    # Trial failed - open for another period
+    breaker.record_failure()
+    clock[0] += 29
+    assert not breaker.allow()
+
+    clock[0] += 1
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.allow() and breaker.allow()
+
+
+def configure_clients(llm_service, **extract):
+    for provider, function in extract.items():
+        llm_service.__dict__[f"{provider}_client"] = object()
+        setattr(llm_service, f"_extract_with_{provider}", function)
+
+
+def test_open_circuit_falls_back_to_other_provider(llm_service, clock):
+    llm_service.breaker_fail_max = 1
+    calls = []
+
+    def anthropic(prompt, model):
+        calls.append("anthropic")
+        raise TimeoutError("provider timed out")
+
+    def openai(prompt, model):
+        calls.append("openai")
+        return '{"member_id": "A123"}'
+
+    configure_clients(llm_service, anthropic=anthropic, openai=openai)
+
+    with pytest.raises(TimeoutError):
+        llm_service._call_provider("prompt", "anthropic", "claude")
+    assert llm_service._call_provider("prompt", "anthropic", "claude") == (
+        "openai", llm_service.race_models["openai"], '{"member_id": "A123"}'
+    )
+    assert calls == ["anthropic", "openai"]
+
+
+def test_open_circuit_without_fallback_raises(llm_service, clock):
+    llm_service.breaker_fail_max = 1
+
+    def anthropic(prompt, model):
+        raise TimeoutError("provider timed out")
+
+    configure_clients(llm_service, anthropic=anthropic)
+    llm_service.__dict__["openai_client"] = None
+
+    with pytest.raises(TimeoutError):
+        llm_service._call_provider("prompt", "anthropic", "claude")
+    with pytest.raises(CircuitOpenError):
+        llm_service._call_provider("prompt", "anthropic", "claude")
+
+
+def test_unparseable_response_is_retried_with_the_error(llm_service):
+    prompts = []
+    responses = iter(['Sure! {"member_id": "A123",', 'Here you go: {"member_id": "A123"}'])
+
+    def anthropic(prompt, model):
+        prompts.append(prompt)
+        return next(responses)
+
+    configure_clients(llm_service, anthropic=anthropic)
+
+    assert llm_service._call_provider("prompt", "anthropic", "claude")[2] == 'Here you go: {"member_id": "A123"}'
+    assert prompts[0] == "prompt"
+    assert prompts[1].startswith("prompt\n\nYour previous output was not valid JSON (")
+    assert prompts[1].endswith("Output only the JSON object.")
+
+
+def test_json_error(llm_service):
+    assert llm_service._json_error('Here it is:\n```json\n{"member_id": "A123"}\n```') is None
+    assert llm_service._json_error('["A123"]') == "expected a JSON object, got list"
+    assert llm_service._json_error('{"member_id": "A123",') is not None
+    assert llm_service._json_error("no JSON here") is not None
+
+
+def test_chunk_text_covers_the_text_with_overlap(llm_service):
+    text = "\n".join(f"line {number} " + "word " * 20 for number in range(200))
+    chunks = llm_service._chunk_text(text, max_tokens=100, overlap=10)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 400 for chunk in chunks)
+    assert chunks[0] == text[:len(chunks[0])]
+    assert text.endswith(chunks[-1])
+    # Each chunk starts inside the previous one
+    position = 0
+    for previous, chunk in zip(chunks, chunks[1:]):
+        start = text.index(chunk, position + 1)
+        assert start < position + len(previous)
+        position = start
+
+
+def test_chunked_extraction_merges_chunks_and_skips_failed_ones(llm_service, monkeypatch):
+    llm_service.chunk_max_tokens = 100
+    llm_service.chunk_overlap_tokens = 10
+    text = "Member ID: A123\n" + "filler text\n" * 100 + "Patient Name: Jane Roe\n" + "filler text\n" * 100
+
+    def extract_text(chunk, provider, model, required_fields, optional_fields):
+        if chunk.startswith("filler") and "Patient" not in chunk:
+            raise TimeoutError("chunk timed out")
+        fields = {"member_id": "A123"} if "Member ID" in chunk else {"patient_name": "Jane Roe"}
+        return {'extracted_fields': fields, 'confidence_scores': {name: 0.9 for name in fields}, 'raw_response': "{}"}
+
+    monkeypatch.setattr(llm_service, "_extract_text", extract_text)
+    result = llm_service._extract_chunked(text, "anthropic", "claude", [], [])
+
+    assert result['extracted_fields'] == {"member_id": "A123", "patient_name": "Jane Roe"}
+    assert result['merged_from']['unit'] == "chunk"
+
+
+def test_chunked_extraction_raises_when_every_chunk_fails(llm_service, monkeypatch):
+    llm_service.chunk_max_tokens = 100
+
+    def extract_text(chunk, *args):
+        raise TimeoutError("chunk timed out")
+
+    monkeypatch.setattr(llm_service, "_extract_text", extract_text)
+    with pytest.raises(TimeoutError):
+        llm_service._extract_chunked("filler text\n" * 200, "anthropic", "claude", [], [])
@@ -0,0 +1,80 @@
+"""Upgrade/downgrade smoke test of the Alembic migrations on SQLite"""
+import os
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from database.models import Base
+
+alembic = pytest.importorskip("alembic")
+from alembic import command  # noqa: E402
+from alembic.config import Config  # noqa: E402
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def connection(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    with engine.begin() as connection:
+        yield connection
+    engine.dispose()
+
+
+def run(connection, action, revision):
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "database", "migrations"))
+    config.attributes["connection"] = connection
+    action(config, revision)
+
+
+def performance_schema(connection):
+    inspector = inspect(connection)
+    columns = {column["name"]: column for column in inspector.get_columns("model_performance")}
+    return (
+        {constraint["name"] for constraint in inspector.get_unique_constraints("model_performance")},
+        {name: bool(columns[name].get("computed")) for name in ("precision", "recall", "f1_score")},
+        "ix_human_feedback_training" in {index["name"] for index in inspector.get_indexes("human_feedback")}
+    )
+
+
+def test_upgrade_on_empty_database(connection):
+    run(connection, command.upgrade, "head")
+
+    assert connection.execute(text("SELECT version_num FROM alembic_version")).scalar() == "0001"
+
+
+def test_downgrade_then_upgrade_merges_duplicate_performance_rows(connection):
+    Base.metadata.create_all(connection)
+    run(connection, command.upgrade, "head")
+    assert performance_schema(connection) == (
+        {"uq_model_performance_version_field"},
+        {"precision": True, "recall": True, "f1_score": True},
+        True
+    )
+
+    run(connection, command.downgrade, "base")
+    assert performance_schema(connection) == (
+        set(),
+        {"precision": False, "recall": False, "f1_score": False},
+        False
+    )
+
+    # Rows written per feedback before the constraint existed
+    for total, correct, false_positives, reward in ((3, 2, 1, 0.5), (1, 1, 0, 1.0)):
+        connection.execute(text(
+            "INSERT INTO model_performance (model_version, field_name, total_predictions, correct_predictions, "
+            "false_positives, false_negatives, avg_reward) VALUES ('v1', 'member_id', :total, :correct, :fp, 0, :reward)"
+        ), {"total": total, "correct": correct, "fp": false_positives, "reward": reward})
+
+    run(connection, command.upgrade, "head")
+
+    assert performance_schema(connection)[0] == {"uq_model_performance_version_field"}
+    rows = connection.execute(text(
+        "SELECT total_predictions, correct_predictions, false_positives, avg_reward, precision FROM model_performance"
+    )).all()
+    assert len(rows) == 1
+    total, correct, false_positives, avg_reward, precision = rows[0]
+    assert (total, correct, false_positives) == (4, 3, 1)
+    assert avg_reward == pytest.approx((3 * 0.5 + 1 * 1.0) / 4)
+    assert precision == pytest.approx(3 / 4)
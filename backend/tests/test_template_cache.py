@@ -0,0 +1,137 @@
+"""Template recipe matching - a wrong match returns wrong values without an LLM call"""
+import random
+import string
+
+import pytest
+
+from services import template_cache
+from services.llm_service import LLMService
+from services.template_cache import TemplateCache
+
+DENIAL_LETTER = """ACME HEALTH PLAN
+Prior Authorization Denial Notice
+Member Name: {name}
+Member ID: {member_id} Plan: Gold
+Date of Service: {date_of_service}
+We reviewed the request for services and determined it is not medically necessary under the plan guidelines.
+If you disagree you may appeal within 180 days of this notice by calling customer service.
+Your appeal must be submitted in writing and include any additional medical records or
+statements from your treating provider that support the request. A reviewer who was not
+involved in the original decision will consider your appeal and notify you of the outcome.
+You may request copies of all documents relevant to this determination free of charge.
+This notice does not affect your right to continue receiving covered services from your
+network providers. Questions about this letter can be directed to the member services
+department Monday through Friday during regular business hours.
+"""
+
+JANE = {"patient_name": "Jane Roe", "member_id": "A123456", "date_of_service": "01/02/2024"}
+JOHN = {"patient_name": "John Smith", "member_id": "B765432", "date_of_service": "11/12/2023"}
+
+
+def letter(values, template=DENIAL_LETTER):
+    return template.format(
+        name=values["patient_name"], member_id=values["member_id"], date_of_service=values["date_of_service"]
+    )
+
+
+def other_template(seed: int) -> str:
+    """A letter template with its own wording - far from every other seed's fingerprint"""
+    rng = random.Random(seed)
+    words = " ".join("".join(rng.choice(string.ascii_lowercase) for _ in range(7)) for _ in range(80))
+    return "Member Name: {name}\nMember ID: {member_id} Plan: Gold\nDate of Service: {date_of_service}\n" + words + "\n"
+
+
+@pytest.fixture
+def cache():
+    cache = TemplateCache(":memory:")
+    yield cache
+    cache.connection.close()
+
+
+def test_near_duplicate_document_is_extracted_from_recipe(cache):
+    template_id = cache.learn(letter(JANE), JANE, "schema")
+
+    assert template_id is not None
+    assert cache.lookup(letter(JOHN), "schema") == (template_id, JOHN)
+
+
+def test_drifted_template_is_a_miss(cache):
+    cache.learn(letter(JANE), JANE, "schema")
+
+    # Same wording, so the fingerprint still matches, but the value that
+    # anchored the member ID moved to its own line
+    drifted = letter(JOHN).replace(" Plan: Gold", "\nPlan: Gold")
+    assert cache._candidates(template_cache.simhash(drifted), "schema")
+    assert cache.lookup(drifted, "schema") is None
+
+    # Reworded letter - too far from the stored fingerprint
+    reworded = letter(JOHN).replace("Member ID:", "Subscriber No.")
+    assert cache.lookup(reworded, "schema") is None
+
+
+def test_value_that_cannot_be_anchored_gives_no_recipe(cache):
+    # Normalized by the LLM - not in the text as extracted
+    assert cache.learn(letter(JANE), {**JANE, "date_of_service": "2024-01-02"}, "schema") is None
+    # No label text in front of the value
+    assert cache.learn("A123456\n" + letter(JOHN), {"member_id": "A123456"}, "schema") is None
+    # Not a string
+    assert cache.learn(letter(JANE), {**JANE, "member_id": 123456}, "schema") is None
+
+    assert cache.lookup(letter(JOHN), "schema") is None
+
+
+def test_schema_change_is_a_miss(cache):
+    cache.learn(letter(JANE), JANE, "schema")
+
+    assert cache.lookup(letter(JOHN), "other schema") is None
+
+
+def test_learning_a_known_template_updates_it_in_place(cache):
+    first = cache.learn(letter(JANE), JANE, "schema")
+    second = cache.learn(letter(JOHN), JOHN, "schema")
+
+    assert first == second
+    assert cache.connection.execute("SELECT COUNT(*) FROM templates").fetchone()[0] == 1
+
+
+def test_prune_drops_least_recently_used_beyond_max_entries(monkeypatch):
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr(template_cache.time, "time", lambda: next(clock))
+    cache = TemplateCache(":memory:", max_entries=2)
+    templates = [other_template(seed) for seed in range(3)]
+
+    cache.learn(letter(JANE, templates[0]), JANE, "schema")
+    cache.learn(letter(JANE, templates[1]), JANE, "schema")
+    assert cache.lookup(letter(JANE, templates[0]), "schema") is not None
+    cache.learn(letter(JANE, templates[2]), JANE, "schema")
+
+    assert cache.lookup(letter(JANE, templates[0]), "schema") is not None
+    assert cache.lookup(letter(JANE, templates[1]), "schema") is None
+    assert cache.lookup(letter(JANE, templates[2]), "schema") is not None
+
+
+def test_prune_drops_recipes_unused_for_max_age(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(template_cache.time, "time", lambda: now[0])
+    cache = TemplateCache(":memory:", max_age=100)
+
+    cache.learn(letter(JANE, other_template(0)), JANE, "schema")
+    now[0] += 500
+    cache.learn(letter(JANE, other_template(1)), JANE, "schema")
+
+    assert cache.lookup(letter(JANE, other_template(0)), "schema") is None
+    assert cache.lookup(letter(JANE, other_template(1)), "schema") is not None
+
+
+@pytest.mark.parametrize("explicit", [{"provider": "openai"}, {"model": "gpt-4o"}])
+def test_named_provider_or_model_skips_template_lookup(monkeypatch, explicit):
+    llm_service = LLMService()
+    lookups = []
+    monkeypatch.setattr(llm_service, "_is_insufficient_text", lambda *args: False)
+    monkeypatch.setattr(llm_service, "_extract_with_template", lambda *args: lookups.append(args) or {"provider": "template"})
+    monkeypatch.setattr(llm_service, "_extract_text", lambda ocr_text, provider, model, *args: {"provider": provider})
+    monkeypatch.setattr(llm_service, "_learn_template", lambda *args: None)
+
+    assert llm_service.extract_fields(letter(JOHN))["provider"] == "template"
+    assert llm_service.extract_fields(letter(JOHN), **explicit)["provider"] != "template"
+    assert len(lookups) == 1